@@ -1,9 +1,8 @@
 import os
 import sys
-import time
+import asyncio
 import logging
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
@@ -13,16 +12,14 @@ import bootstrap
 
 bootstrap.add_src_to_path()
 
-from mb160_service.collector.poller import poll_once
+from mb160_service.collector.engine import CollectorEngine, DeviceTarget
+from mb160_service.collector.pipeline import IngestPipeline
+from mb160_service.collector.poller import start_spool_drainer
+from mb160_service.collector.sessions import SESSIONS
 from mb160_service.config import get_device_settings
 from mb160_service.db import build_engine
 from mb160_service.logging import setup_logging
 
-try:
-    from zk.exception import ZKNetworkError, ZKErrorResponse  # type: ignore
-except Exception:  # pragma: no cover
-    ZKNetworkError = ZKErrorResponse = ()  # type: ignore
-
 log = logging.getLogger("mb160.collector.multi")
 
 
@@ -47,61 +44,85 @@ def _parse_ips() -> list[str]:
     raise RuntimeError("Define MB160_IPS en .env (ej: MB160_IPS=192.168.1.10,192.168.1.11)")
 
 
-def _poll_device(engine, ip: str, port: int) -> None:
-    poll_once(engine, device_ip=ip, device_port=port)
+def _parse_targets(port: int, default_interval: int) -> list[DeviceTarget]:
+    """
+    Cada entrada de MB160_IPS acepta un intervalo propio: `ip@segundos`
+    (ej: 192.168.1.10@60). Sin @ usa MULTI_PULL_INTERVAL_SECONDS.
+    Un puerto distinto a MB160_PORT se indica como `ip:puerto` (ej. los
+    dispositivos simulados de run_fake_devices.py: 127.0.0.1:14371@30).
+    """
+    targets = []
+    for entry in _parse_ips():
+        address, _, interval = entry.partition("@")
+        ip, _, custom_port = address.partition(":")
+        try:
+            seconds = int(interval) if interval else default_interval
+        except ValueError:
+            seconds = default_interval
+        try:
+            device_port = int(custom_port) if custom_port else port
+        except ValueError:
+            device_port = port
+        targets.append(
+            DeviceTarget(
+                ip=ip.strip(),
+                port=device_port,
+                interval_seconds=max(1, seconds),
+                label=address.strip() if custom_port else "",
+            )
+        )
+    return targets
 
 
 def main() -> int:
     setup_logging()
     settings = get_device_settings()
 
-    device_ips = _parse_ips()
     interval_seconds = _env_int("MULTI_PULL_INTERVAL_SECONDS", 300)
-    max_workers = max(1, _env_int("MULTI_PULL_MAX_WORKERS", min(6, len(device_ips))))
+    targets = _parse_targets(settings.port, interval_seconds)
+    max_workers = max(1, _env_int("MULTI_PULL_MAX_WORKERS", min(6, len(targets))))
+    deadline_seconds = _env_int("MULTI_PULL_DEADLINE_SECONDS", interval_seconds)
 
     engine = build_engine()
+    # descarga e ingesta desacopladas: el reloj se libera antes de escribir a la DB y
+    # los writers agrupan las filas de varios checadores en una transacción
+    pipeline = IngestPipeline(
+        engine,
+        writers=max(1, _env_int("MULTI_PULL_DB_WRITERS", 1)),
+        max_pending=max(1, _env_int("MULTI_PULL_MAX_PENDING", 32)),
+        coalesce_rows=max(1, _env_int("MULTI_PULL_COALESCE_ROWS", settings.insert_batch_size * 10)),
+    ).start()
+    # reenvía a la DB lo que quedó en el spool local mientras SQL Server/VPN no respondía
+    drainer = start_spool_drainer(engine)
 
     log.info(
-        "Multi collector iniciado | devices=%d | port=%s | interval=%ss | workers=%d",
-        len(device_ips),
+        "Multi collector iniciado | devices=%d | port=%s | interval=%ss | workers=%d | deadline=%ss",
+        len(targets),
         settings.port,
         interval_seconds,
         max_workers,
+        deadline_seconds,
     )
 
-    while True:
-        cycle_start = time.monotonic()
-        log.info("Iniciando ciclo de pull para %d dispositivos", len(device_ips))
-
-        unreachable = 0
-        errors = 0
-
-        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mb160") as executor:
-            future_to_ip = {
-                executor.submit(_poll_device, engine, ip, settings.port): ip
-                for ip in device_ips
-            }
-            for future in as_completed(future_to_ip):
-                ip = future_to_ip[future]
-                try:
-                    future.result()
-                except ZKNetworkError:
-                    unreachable += 1
-                    log.warning("Device offline | ip=%s", ip)
-                except ZKErrorResponse as e:
-                    errors += 1
-                    log.error("Device error | ip=%s | %s", ip, e)
-                except Exception as e:
-                    errors += 1
-                    log.error("Pull failed | ip=%s | %s: %s", ip, type(e).__name__, e)
-
-        elapsed = time.monotonic() - cycle_start
-        sleep_seconds = max(1, interval_seconds - int(elapsed))
-        log.info(
-            "Ciclo completado | elapsed=%.1fs | offline=%d | errors=%d | next_in=%ss",
-            elapsed, unreachable, errors, sleep_seconds,
-        )
-        time.sleep(sleep_seconds)
+    collector = CollectorEngine(
+        engine,
+        targets,
+        max_concurrency=max_workers,
+        deadline_seconds=deadline_seconds or None,
+        report_interval_seconds=interval_seconds,
+        probe_timeout=settings.breaker_probe_timeout_seconds,
+        pipeline=pipeline,
+    )
+    try:
+        asyncio.run(collector.run())
+    except KeyboardInterrupt:
+        log.info("Saliendo...")
+    finally:
+        pipeline.close()
+        if drainer is not None:
+            drainer.stop(5)
+        SESSIONS.close_all()
+    return 0
 
 
 if __name__ == "__main__":
@@ -9,7 +9,8 @@ import bootstrap
 
 bootstrap.add_src_to_path()
 
-from mb160_service.collector.poller import poll_once
+from mb160_service.collector.poller import flush_spool, poll_once
+from mb160_service.collector.sessions import SESSIONS
 from mb160_service.db import build_engine
 from mb160_service.logging import setup_logging
 
@@ -17,7 +18,12 @@ from mb160_service.logging import setup_logging
 def main() -> int:
     setup_logging()
     engine = build_engine()
-    poll_once(engine)
+    try:
+        poll_once(engine)
+        # lo que quedó en el spool de corridas con la DB caída
+        flush_spool(engine)
+    finally:
+        SESSIONS.close_all()
     return 0
 
 
@@ -0,0 +1,60 @@
+import argparse
+import logging
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+
+bootstrap.add_src_to_path()
+
+from mb160_service.collector.rollup import rebuild_daily
+from mb160_service.db import build_engine
+from mb160_service.logging import setup_logging
+
+log = logging.getLogger("mb160.rollup")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Reconstruye dbo.AsistenciaDiaria desde dbo.AsistenciaMarcaje (historial o reparación).",
+    )
+    parser.add_argument("--start", help="Inicio YYYY-MM-DD (default: hoy - --days)")
+    parser.add_argument("--end", help="Fin YYYY-MM-DD inclusivo (default: hoy)")
+    parser.add_argument("--days", type=int, default=31, help="días hacia atrás si no se da --start")
+    parser.add_argument("--user", help="sólo este UsuarioDispositivo")
+    return parser.parse_args()
+
+
+def main() -> int:
+    setup_logging()
+    args = _parse_args()
+
+    today = date.today()
+    end = datetime.strptime(args.end, "%Y-%m-%d").date() if args.end else today
+    start = datetime.strptime(args.start, "%Y-%m-%d").date() if args.start else today - timedelta(days=args.days)
+    if end < start:
+        log.error("--end debe ser >= --start")
+        return 2
+
+    engine = build_engine()
+    log.info("Rollup diario | start=%s | end=%s | user=%s", start, end, args.user or "*")
+    total = 0
+    day = start
+    while day <= end:
+        # una transacción por día: un rango largo no bloquea la tabla de golpe
+        with engine.begin() as dbconn:
+            written = rebuild_daily(dbconn, day, user_id=args.user)
+        log.info("Rollup | día=%s | filas=%d", day, written)
+        total += written
+        day += timedelta(days=1)
+    log.info("Rollup completado | días=%d | filas=%d", (end - start).days + 1, total)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,69 @@
+import argparse
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+
+bootstrap.add_src_to_path()
+
+from mb160_service.collector.dump_cache import DumpCache, DumpEntry
+from mb160_service.config import get_device_settings
+
+
+def _mb(value: int) -> str:
+    return f"{value / 2**20:.1f}MB"
+
+
+def _print_entries(entries: list[DumpEntry]) -> None:
+    print(f"{'device':<20} {'records':>9} {'raw':>9} {'disco':>9} {'ratio':>6}  {'creado':<19}  {'último uso':<19}  digest")
+    for e in entries:
+        ratio = e.raw_bytes / e.stored_bytes if e.stored_bytes else 0.0
+        print(
+            f"{e.device_serial:<20} {e.record_count:>9} {_mb(e.raw_bytes):>9} {_mb(e.stored_bytes):>9} {ratio:>5.1f}x  "
+            f"{e.created_at:%Y-%m-%d %H:%M:%S}  {e.last_used_at:%Y-%m-%d %H:%M:%S}  {e.digest[:12]}"
+        )
+
+
+def main() -> int:
+    settings = get_device_settings()
+    parser = argparse.ArgumentParser(description="Lista y depura el cache de dumps crudos de los MB160.")
+    parser.add_argument("--dir", default=settings.dump_cache_dir, help="carpeta del cache (default: DUMP_CACHE_DIR)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="dumps guardados y tamaño total")
+
+    prune = sub.add_parser("prune", help="borrar dumps (sin filtros: todos)")
+    prune.add_argument("--max-mb", type=float, help="borrar los menos usados hasta quedar en este tamaño")
+    prune.add_argument("--older-than-days", type=float, help="borrar los que no se usan hace N días")
+    prune.add_argument("--device", help="sólo dumps de este DispositivoSerial")
+    prune.add_argument("--keep-latest", action="store_true", help="conservar el dump más reciente de cada dispositivo")
+    args = parser.parse_args()
+
+    if not args.dir:
+        parser.error("DUMP_CACHE_DIR está vacío (cache deshabilitado); usa --dir")
+    cache = DumpCache(args.dir, 0)
+
+    if args.command == "list":
+        entries = cache.entries()
+        _print_entries(entries)
+        print(f"Total | dumps={len(entries)} | disco={_mb(cache.total_bytes())} | límite={settings.dump_cache_max_mb}MB")
+        return 0
+
+    removed = cache.prune(
+        max_bytes=int(args.max_mb * 2**20) if args.max_mb is not None else None,
+        older_than=datetime.now() - timedelta(days=args.older_than_days) if args.older_than_days is not None else None,
+        device_serial=args.device,
+        keep_latest=args.keep_latest,
+    )
+    _print_entries(removed)
+    print(f"Borrados | dumps={len(removed)} | quedan={len(cache.entries())} | disco={_mb(cache.total_bytes())}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,74 @@
+import argparse
+import logging
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+
+bootstrap.add_src_to_path()
+
+from mb160_service.api.columnar import DATASET_FORMATS, write_dataset
+from mb160_service.api.marks import MarkFilters
+from mb160_service.config import get_api_settings
+from mb160_service.db import build_engine
+from mb160_service.logging import setup_logging
+
+log = logging.getLogger("mb160.export")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Exporta dbo.AsistenciaMarcaje a Parquet/Arrow particionado por Fecha y DispositivoSerial.",
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--date", help="Un día YYYY-MM-DD")
+    group.add_argument("--start", help="Inicio del rango YYYY-MM-DD (requiere --end)")
+    parser.add_argument("--end", help="Fin del rango YYYY-MM-DD inclusivo (con --start)")
+    parser.add_argument("--device", help="sólo este DispositivoSerial")
+    parser.add_argument("--user", help="sólo este UsuarioDispositivo")
+    parser.add_argument("--format", choices=DATASET_FORMATS, default="parquet")
+    parser.add_argument("--out", default="exports/marks", help="carpeta del dataset (default: exports/marks)")
+    args = parser.parse_args()
+
+    if args.date:
+        args.start = args.end = args.date
+    elif not args.end:
+        parser.error("--start requiere --end")
+    args.start = datetime.strptime(args.start, "%Y-%m-%d")
+    args.end = datetime.strptime(args.end, "%Y-%m-%d")
+    if args.end < args.start:
+        parser.error("--end debe ser >= --start")
+    return args
+
+
+def main() -> int:
+    setup_logging()
+    args = _parse_args()
+    filters = MarkFilters(
+        user_id=args.user,
+        device_serial=args.device,
+        dt_from=args.start,
+        dt_to=args.end + timedelta(days=1) - timedelta(seconds=1),
+    )
+    log.info(
+        "Export columnar | start=%s | end=%s | device=%s | user=%s | formato=%s | dir=%s",
+        args.start.date(), args.end.date(), args.device or "*", args.user or "*", args.format, args.out,
+    )
+    try:
+        rows = write_dataset(
+            build_engine(), filters, args.out, fmt=args.format, chunk_rows=get_api_settings().export_chunk_rows,
+        )
+    except RuntimeError as e:
+        log.error("%s", e)
+        return 2
+    log.info("Export completado | filas=%d | dir=%s", rows, args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
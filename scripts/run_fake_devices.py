@@ -0,0 +1,78 @@
+import argparse
+import logging
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+
+bootstrap.add_src_to_path()
+
+from mb160_service.logging import setup_logging
+from mb160_service.utils.fake_mb160 import FakeDeviceFarm
+from mb160_service.utils.simulator import fake_device_history, simulated_employees
+
+log = logging.getLogger("mb160.fake_device")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Levanta checadores MB160 simulados (protocolo ZK TCP/UDP)")
+    parser.add_argument("--count", type=int, default=1, help="número de dispositivos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=14370, help="puerto del primero; los demás +1 (0 = efímeros)")
+    parser.add_argument("--users", type=int, default=50, help="usuarios por dispositivo")
+    parser.add_argument("--records", type=int, default=1000, help="registros de asistencia por dispositivo")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latencia por respuesta")
+    parser.add_argument("--loss", type=float, default=0.0, help="probabilidad de perder un paquete (0-1)")
+    parser.add_argument("--live-interval", type=float, default=0.0, help="segundos entre checadas nuevas (0 = sin checadas)")
+    parser.add_argument("--shift-days", type=int, default=0,
+                        help="historial de turnos simulados de N días (reemplaza --records)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    setup_logging()
+    serials = [f"SIM{idx + 1:05d}" for idx in range(args.count)]
+    employees = (
+        simulated_employees(args.users * args.count, devices=serials, seed=args.seed) if args.shift_days > 0 else []
+    )
+    start = date.today() - timedelta(days=args.shift_days)
+
+    def per_device(_idx, serial):
+        # sin --shift-days cada dispositivo usa --users/--records
+        if not employees:
+            return {}
+        return fake_device_history(serial, employees, start, args.shift_days, seed=args.seed)
+
+    farm = FakeDeviceFarm(
+        args.count,
+        host=args.host,
+        base_port=args.base_port,
+        seed=args.seed,
+        live_interval=args.live_interval or None,
+        per_device=per_device,
+        users=args.users,
+        records=args.records,
+        latency=args.latency_ms / 1000.0,
+        loss=args.loss,
+    ).start()
+
+    targets = ",".join(f"{host}:{port}" for host, port in farm.targets)
+    print(f"MB160_IPS={targets}")
+    print("MB160_OMIT_PING=1")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        log.info("Saliendo...")
+    finally:
+        farm.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
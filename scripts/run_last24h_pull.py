@@ -11,6 +11,7 @@ import bootstrap
 bootstrap.add_src_to_path()
 
 from mb160_service.collector.poller import poll_once
+from mb160_service.collector.sessions import SESSIONS
 from mb160_service.db import build_engine
 from mb160_service.logging import setup_logging
 
@@ -19,7 +20,10 @@ def main() -> int:
     setup_logging()
     engine = build_engine()
     cutoff = datetime.now() - timedelta(hours=24)
-    poll_once(engine, min_ts=cutoff, use_last_ts=False)
+    try:
+        poll_once(engine, min_ts=cutoff, use_last_ts=False)
+    finally:
+        SESSIONS.close_all()
     return 0
 
 
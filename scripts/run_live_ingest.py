@@ -1,7 +1,4 @@
-import time
 import logging
-from sqlalchemy import text
-from sqlalchemy.exc import IntegrityError
 
 import sys
 from pathlib import Path
@@ -13,6 +10,9 @@ if str(ROOT) not in sys.path:
 import bootstrap
 bootstrap.add_src_to_path()
 
+from mb160_service.collector.batch import AttendanceBatch
+from mb160_service.collector.poller import insert_rows
+from mb160_service.collector.watermark import ingest_transaction
 from mb160_service.config import get_device_settings
 from mb160_service.db import build_engine
 from mb160_service.logging import setup_logging
@@ -22,32 +22,11 @@ IP = device_settings.ip or "192.168.2.13"
 PORT = device_settings.port
 
 def insert_mark(dbconn, device_serial, device_ip, evt):
-    ts = getattr(evt, "timestamp", None)
-    if ts is None:
-        return False
-
-    sql = text("""
-        INSERT INTO dbo.AsistenciaMarcaje
-        (DispositivoSerial, DispositivoIP, UsuarioDispositivo, EventoFechaHora, Punch, Estado, WorkCode)
-        VALUES
-        (:serial, :ip, :user_id, :ts, :punch, :estado, :workcode)
-    """)
-
-    params = {
-        "serial": device_serial,
-        "ip": device_ip,
-        "user_id": str(getattr(evt, "user_id", "")),
-        "ts": ts.replace(microsecond=0),
-        "punch": int(getattr(evt, "punch", 0) or 0),
-        "estado": int(getattr(evt, "status", 0) or 0),
-        "workcode": getattr(evt, "workcode", None),
-    }
-
-    try:
-        dbconn.execute(sql, params)
-        return True
-    except IntegrityError:
+    batch = AttendanceBatch.from_records([evt], device_serial=device_serial, device_ip=device_ip)
+    if not len(batch):
         return False
+    inserted, _dup = insert_rows(dbconn, batch.to_params(), batch_size=1)
+    return inserted > 0
 
 def main():
     from zk import ZK
@@ -66,7 +45,7 @@ def main():
         logging.info(f"Escuchando eventos en vivo MB160 {IP}:{PORT} serial={device_serial}")
         logging.info("Haz una checada en el MB160 para que se inserte en la DB. Ctrl+C para salir.")
 
-        with engine.begin() as dbconn:
+        with ingest_transaction(engine) as dbconn:
             for evt in conn.live_capture(new_timeout=10):
                 if evt is None:
                     continue
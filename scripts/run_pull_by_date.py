@@ -14,7 +14,9 @@ import bootstrap
 
 bootstrap.add_src_to_path()
 
-from mb160_service.collector.poller import poll_once
+from mb160_service.collector.poller import PollResult, poll_windows
+from mb160_service.collector.sessions import SESSIONS
+from mb160_service.collector.window import TimeWindow
 from mb160_service.config import get_device_settings
 from mb160_service.db import build_engine
 from mb160_service.logging import setup_logging
@@ -48,69 +50,72 @@ def _parse_ips() -> list[str]:
     raise RuntimeError("Define MB160_IPS en .env (ej: MB160_IPS=192.168.1.10,192.168.1.11)")
 
 
-def _parse_args() -> tuple[datetime, datetime]:
+def _parse_args() -> tuple[list[TimeWindow], bool]:
     parser = argparse.ArgumentParser(
         description="Pull marcajes por rango de fechas desde múltiples MB160.",
     )
     group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("--date", help="Día único en formato YYYY-MM-DD")
+    group.add_argument("--date", nargs="+", help="Uno o más días YYYY-MM-DD (una sola descarga por dispositivo)")
     group.add_argument("--start", help="Inicio del rango YYYY-MM-DD (requiere --end)")
     parser.add_argument("--end", help="Fin del rango YYYY-MM-DD inclusivo (con --start)")
+    parser.add_argument(
+        "--no-dump-cache", action="store_true",
+        help="bajar el log del reloj aunque haya un dump en cache con el mismo conteo",
+    )
     args = parser.parse_args()
+    use_dump_cache = not args.no_dump_cache
 
     if args.date:
-        start = datetime.strptime(args.date, "%Y-%m-%d")
-        end_exclusive = start + timedelta(days=1)
-    else:
-        if not args.end:
-            parser.error("--start requiere --end")
-        start = datetime.strptime(args.start, "%Y-%m-%d")
-        end_inclusive = datetime.strptime(args.end, "%Y-%m-%d")
-        if end_inclusive < start:
-            parser.error("--end debe ser >= --start")
-        end_exclusive = end_inclusive + timedelta(days=1)
-
-    return start, end_exclusive
-
-
-def _poll_device(engine, ip: str, port: int, start: datetime, end_exclusive: datetime) -> None:
-    poll_once(
-        engine,
-        device_ip=ip,
-        device_port=port,
-        min_ts=start,
-        max_ts=end_exclusive,
-        use_last_ts=False,
-    )
+        days = sorted({datetime.strptime(value, "%Y-%m-%d") for value in args.date})
+        return [TimeWindow(day, day + timedelta(days=1)) for day in days], use_dump_cache
+
+    if not args.end:
+        parser.error("--start requiere --end")
+    start = datetime.strptime(args.start, "%Y-%m-%d")
+    end_inclusive = datetime.strptime(args.end, "%Y-%m-%d")
+    if end_inclusive < start:
+        parser.error("--end debe ser >= --start")
+    return [TimeWindow(start, end_inclusive + timedelta(days=1))], use_dump_cache
+
+
+def _poll_device(engine, ip: str, port: int, windows: list[TimeWindow], use_dump_cache: bool) -> list[PollResult]:
+    # use_last_ts=False -> merge por staging (solo inserta lo que falta); un solo
+    # get_attendance por dispositivo para todas las ventanas (o el dump en cache)
+    return poll_windows(engine, windows, device_ip=ip, device_port=port, use_dump_cache=use_dump_cache)
 
 
 def main() -> int:
     setup_logging()
     settings = get_device_settings()
 
-    start, end_exclusive = _parse_args()
+    windows, use_dump_cache = _parse_args()
     device_ips = _parse_ips()
     max_workers = max(1, _env_int("MULTI_PULL_MAX_WORKERS", min(6, len(device_ips))))
 
     engine = build_engine()
 
     log.info(
-        "Pull rango | start=%s | end_exclusive=%s | devices=%d | port=%s | workers=%d",
-        start, end_exclusive, len(device_ips), settings.port, max_workers,
+        "Pull rango | ventanas=%s | devices=%d | port=%s | workers=%d",
+        ", ".join(f"[{w.min_ts:%Y-%m-%d}, {w.max_ts:%Y-%m-%d})" for w in windows),
+        len(device_ips), settings.port, max_workers,
     )
 
     unreachable = 0
     errors = 0
+    inserted = 0
+    skipped = 0
 
     with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mb160-pull") as executor:
         future_to_ip = {
-            executor.submit(_poll_device, engine, ip, settings.port, start, end_exclusive): ip
+            executor.submit(_poll_device, engine, ip, settings.port, windows, use_dump_cache): ip
             for ip in device_ips
         }
         for future in as_completed(future_to_ip):
             ip = future_to_ip[future]
             try:
-                future.result()
+                for result in future.result():
+                    inserted += result.inserted
+                    skipped += result.dup_skipped
             except ZKNetworkError:
                 unreachable += 1
                 log.warning("Device offline | ip=%s", ip)
@@ -121,7 +126,11 @@ def main() -> int:
                 errors += 1
                 log.error("Pull failed | ip=%s | %s: %s", ip, type(e).__name__, e)
 
-    log.info("Pull completado | offline=%d | errors=%d", unreachable, errors)
+    SESSIONS.close_all()
+    log.info(
+        "Pull completado | inserted=%d | skipped=%d | offline=%d | errors=%d",
+        inserted, skipped, unreachable, errors,
+    )
     return 0 if errors == 0 else 1
 
 
@@ -0,0 +1,128 @@
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+
+bootstrap.add_src_to_path()
+
+from mb160_service.collector.reconcile import ReconcileResult, reconcile_device
+from mb160_service.collector.sessions import SESSIONS
+from mb160_service.config import get_device_settings
+from mb160_service.db import build_engine
+from mb160_service.logging import setup_logging
+
+try:
+    from zk.exception import ZKNetworkError, ZKErrorResponse  # type: ignore
+except Exception:  # pragma: no cover
+    ZKNetworkError = ZKErrorResponse = ()  # type: ignore
+
+log = logging.getLogger("mb160.reconcile")
+
+
+def _env_int(var: str, default: int) -> int:
+    try:
+        return int(os.environ.get(var, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _parse_targets(port: int) -> list[tuple[str, int]]:
+    """MB160_IPS (o MB160_IP); cada entrada acepta `ip:puerto` y se ignora `@segundos`."""
+    raw = os.environ.get("MB160_IPS", "") or os.environ.get("MB160_IP", "")
+    entries = list(dict.fromkeys(value.strip() for value in raw.split(",") if value.strip()))
+    if not entries:
+        raise RuntimeError("Define MB160_IPS en .env (ej: MB160_IPS=192.168.1.10,192.168.1.11)")
+    targets = []
+    for entry in entries:
+        address = entry.partition("@")[0]
+        ip, _, custom_port = address.partition(":")
+        try:
+            device_port = int(custom_port) if custom_port else port
+        except ValueError:
+            device_port = port
+        targets.append((ip.strip(), device_port))
+    return targets
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compara marcajes por día entre cada MB160 y la DB e inserta solo lo que falta.",
+    )
+    parser.add_argument("--start", help="Inicio YYYY-MM-DD (default: hoy - --days)")
+    parser.add_argument("--end", help="Fin YYYY-MM-DD inclusivo (default: hoy)")
+    parser.add_argument("--days", type=int, default=30, help="días hacia atrás si no se da --start")
+    parser.add_argument("--dry-run", action="store_true", help="solo reportar diferencias, sin insertar")
+    return parser.parse_args()
+
+
+def main() -> int:
+    setup_logging()
+    settings = get_device_settings()
+    args = _parse_args()
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    end = (datetime.strptime(args.end, "%Y-%m-%d") if args.end else today) + timedelta(days=1)
+    start = datetime.strptime(args.start, "%Y-%m-%d") if args.start else today - timedelta(days=args.days)
+    if end <= start:
+        log.error("--end debe ser >= --start")
+        return 2
+
+    targets = _parse_targets(settings.port)
+    max_workers = max(1, _env_int("MULTI_PULL_MAX_WORKERS", min(6, len(targets))))
+    engine = build_engine()
+
+    log.info(
+        "Reconciliación | start=%s | end_exclusive=%s | devices=%d | workers=%d%s",
+        start, end, len(targets), max_workers, " | dry-run" if args.dry_run else "",
+    )
+
+    results: list[ReconcileResult] = []
+    errors = 0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mb160-reconcile") as executor:
+        future_to_target = {
+            executor.submit(
+                reconcile_device, engine, start=start, end=end, device_ip=ip, device_port=port, dry_run=args.dry_run,
+            ): f"{ip}:{port}"
+            for ip, port in targets
+        }
+        for future in as_completed(future_to_target):
+            target = future_to_target[future]
+            try:
+                results.append(future.result())
+            except ZKNetworkError:
+                errors += 1
+                log.warning("Device offline | target=%s", target)
+            except ZKErrorResponse as e:
+                errors += 1
+                log.error("Device error | target=%s | %s", target, e)
+            except Exception as e:
+                errors += 1
+                log.error("Reconciliación falló | target=%s | %s: %s", target, type(e).__name__, e)
+
+    SESSIONS.close_all()
+
+    for result in sorted(results, key=lambda r: r.device_serial):
+        for drift in result.drift:
+            log.info(
+                "Drift | device=%s | día=%s | reloj=%d | db=%d",
+                result.device_serial, drift.day, drift.device_records, drift.db_records,
+            )
+    log.info(
+        "Reconciliación completada | devices=%d | con drift=%d | faltantes=%d | extra_db=%d | inserted=%d | errors=%d",
+        len(results), sum(1 for r in results if r.drift), sum(r.missing for r in results),
+        sum(r.extra for r in results), sum(r.inserted for r in results), errors,
+    )
+    return 0 if errors == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
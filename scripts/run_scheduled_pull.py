@@ -13,7 +13,8 @@ import bootstrap
 
 bootstrap.add_src_to_path()
 
-from mb160_service.collector.poller import poll_once
+from mb160_service.collector.poller import flush_spool, poll_once
+from mb160_service.collector.sessions import SESSIONS
 from mb160_service.db import build_engine
 from mb160_service.logging import setup_logging
 
@@ -58,9 +59,12 @@ def main() -> int:
         engine = build_engine()
         try:
             poll_once(engine)
+            flush_spool(engine)
         except Exception as e:
             log.exception("Error en poll_once: %s", e)
         finally:
+            # el siguiente pull es en ~24h: no dejar sesiones abiertas en el reloj
+            SESSIONS.close_all()
             engine.dispose()
 
 
@@ -0,0 +1,25 @@
+IF OBJECT_ID(N'dbo.AsistenciaDiaria', N'U') IS NULL
+BEGIN
+    -- Resumen por empleado y día con las ventanas de sp_ProcessMarcajeQueue.
+    -- Lo mantiene el collector al insertar (collector/rollup.py); para llenar
+    -- historial: python scripts/run_daily_rollup.py --start ... --end ...
+    CREATE TABLE dbo.AsistenciaDiaria
+    (
+        UsuarioDispositivo   NVARCHAR(50) NOT NULL,
+        Fecha                DATE NOT NULL,
+
+        PrimeraEntrada       DATETIME2(0) NULL,  -- primer marcaje < 12:00
+        SalidaComida         DATETIME2(0) NULL,  -- 1er marcaje 12:50 – 15:59
+        EntradaComida        DATETIME2(0) NULL,  -- 2do marcaje 12:50 – 15:59
+        UltimaSalida         DATETIME2(0) NULL,  -- último marcaje >= 16:00
+        Marcajes             INT NOT NULL,       -- filas del día en AsistenciaMarcaje (incluye doble-tap)
+
+        UltimoCambio         DATETIME2(3) NOT NULL CONSTRAINT DF_AsistenciaDiaria_UltimoCambio DEFAULT(SYSDATETIME()),
+
+        CONSTRAINT PK_AsistenciaDiaria PRIMARY KEY CLUSTERED (Fecha, UsuarioDispositivo)
+    );
+
+    CREATE INDEX IX_AsistenciaDiaria_Usuario_Fecha
+        ON dbo.AsistenciaDiaria (UsuarioDispositivo, Fecha);
+END;
+GO
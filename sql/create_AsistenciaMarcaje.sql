@@ -41,4 +41,13 @@ GO
 
 ALTER TABLE dbo.AsistenciaMarcaje
 ADD UsuarioNombre NVARCHAR(150) NULL;
-GO
\ No newline at end of file
+GO
+
+-- GET /marks sin filtro de usuario/dispositivo: paginación por (EventoFechaHora DESC, AsistenciaMarcajeID)
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE name = N'IX_AsistenciaMarcaje_Fecha' AND object_id = OBJECT_ID(N'dbo.AsistenciaMarcaje')
+)
+    CREATE INDEX IX_AsistenciaMarcaje_Fecha
+        ON dbo.AsistenciaMarcaje (EventoFechaHora DESC);
+GO
@@ -0,0 +1,123 @@
+"""
+Cache en proceso de respuestas de /marks y /marks/{mark_id}.
+
+Cada entrada guarda el JSON ya serializado y el watermark de ingesta
+(collector/watermark.py) con el que se leyó: la del dispositivo filtrado o,
+sin filtro de dispositivo, el digest de todos. Una entrada sirve mientras
+ese watermark no cambie.
+
+Lo que escribe en dbo.AsistenciaMarcaje sin pasar por insert_rows (los
+scripts de sql/, correcciones a mano) no mueve el watermark. Por eso el
+token también lleva el bloque de tiempo actual (time.time() // max_age):
+ninguna entrada ni ETag vive más de max_age segundos. Es hora de pared y no
+monotonic para que varios workers de la API den el mismo ETag.
+
+El ETag sale de la llave normalizada + el token, así que un If-None-Match
+vigente se contesta con 304 sin buscar en la cache ni tocar la DB. LRU
+acotado por número de entradas y por bytes.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional
+
+from mb160_service.collector.watermark import WatermarkSnapshot
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    scope: Optional[str]  # DispositivoSerial del watermark; None = todos
+    token: str
+    headers: Dict[str, str]
+
+
+def make_etag(key: Hashable, token: str) -> str:
+    digest = hashlib.sha1(f"{key!r}|{token}".encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match (lista separada por comas, W/ o *) contra un ETag (comparación débil)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    LRU de respuestas serializadas. max_entries <= 0 o max_bytes <= 0 =
+    deshabilitada (get siempre falla, put no guarda). max_age_seconds <= 0 =
+    las entradas sólo vencen por watermark.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 2**20, max_age_seconds: int = 300):
+        self._max_entries = max(0, int(max_entries))
+        self._max_bytes = max(0, int(max_bytes))
+        self._max_age = max(0, int(max_age_seconds))
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0 and self._max_bytes > 0
+
+    def token(self, watermarks: WatermarkSnapshot, scope: Optional[str]) -> str:
+        """Watermark de `scope` + bloque de max_age: lo que va en CachedResponse.token y en el ETag."""
+        token = watermarks.token(scope)
+        if self._max_age:
+            token = f"{token}.{int(time.time()) // self._max_age}"
+        return token
+
+    def get(self, key: Hashable, watermarks: WatermarkSnapshot) -> Optional[CachedResponse]:
+        """La entrada de `key` si su token sigue vigente; una vencida se descarta."""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry.token != self.token(watermarks, entry.scope):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: CachedResponse) -> None:
+        size = len(entry.body)
+        if not self.enabled or size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = entry
+            self._bytes += size
+            while len(self._items) > self._max_entries or self._bytes > self._max_bytes:
+                self._drop(next(iter(self._items)))
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._items.pop(key)
+        self._bytes -= len(entry.body)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
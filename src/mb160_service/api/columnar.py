@@ -0,0 +1,149 @@
+"""
+Export columnar (Arrow/Parquet) de dbo.AsistenciaMarcaje para análisis.
+
+Cada fetch de la consulta de /marks (iter_mark_chunks) se convierte directo
+en un RecordBatch: las filas se transponen a columnas y cada columna va a
+pyarrow de una vez, sin armar un dict por fila. pyarrow es opcional (solo
+lo necesitan este módulo y el endpoint/CLI de export columnar).
+"""
+import io
+import logging
+from typing import Any, Iterator, List, Sequence
+
+from mb160_service.api.marks import MARK_FIELDS, MarkFilters, iter_mark_chunks
+
+log = logging.getLogger("mb160.export")
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+DATASET_FORMATS = ("parquet", "arrow")
+PARTITION_FIELDS = ("Fecha", "DispositivoSerial")
+
+
+def require_pyarrow():
+    """pyarrow importado; RuntimeError con la instrucción si no está instalado."""
+    try:
+        import pyarrow  # type: ignore
+    except ImportError as e:
+        raise RuntimeError("El export columnar requiere pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def mark_schema():
+    pa = require_pyarrow()
+    return pa.schema([
+        ("AsistenciaMarcajeID", pa.int64()),
+        ("DispositivoSerial", pa.string()),
+        ("DispositivoIP", pa.string()),
+        ("UsuarioDispositivo", pa.string()),
+        ("EventoFechaHora", pa.timestamp("s")),  # HORA LOCAL, sin zona (igual que en la DB)
+        ("Punch", pa.uint8()),
+        ("Estado", pa.uint8()),
+        ("WorkCode", pa.int32()),
+        ("FechaRegistro", pa.timestamp("ms")),
+    ])
+
+
+def _to_array(pa, values: Sequence[Any], typ):
+    if pa.types.is_timestamp(typ) and any(isinstance(v, str) for v in values):
+        # SQLite (standin) regresa las fechas como texto ISO
+        return pa.array(values, pa.string()).cast(typ)
+    return pa.array(values, typ)
+
+
+def iter_record_batches(conn, filters: MarkFilters, *, chunk_rows: int) -> Iterator[Any]:
+    """Un RecordBatch por fetch de `chunk_rows` filas (mismo orden que /marks)."""
+    pa = require_pyarrow()
+    schema = mark_schema()
+    for columns, rows in iter_mark_chunks(conn, filters, chunk_rows=chunk_rows):
+        if list(columns) != list(MARK_FIELDS):
+            raise RuntimeError(f"columnas inesperadas: {columns}")
+        arrays = [_to_array(pa, values, field.type) for values, field in zip(zip(*rows), schema)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _Chunks(io.RawIOBase):
+    """Destino del writer IPC: junta lo escrito para entregarlo por bloques."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def arrow_stream(engine, filters: MarkFilters, *, chunk_rows: int = 5000) -> Iterator[bytes]:
+    """
+    Cuerpo de /marks/export?format=arrow: Arrow IPC stream (esquema + un
+    RecordBatch por fetch). Se lee con pyarrow.ipc.open_stream / pandas /
+    polars sin parsear JSON.
+    """
+    pa = require_pyarrow()
+    sink = _Chunks()
+    with pa.ipc.new_stream(sink, mark_schema()) as writer:
+        yield sink.take()
+        with engine.connect() as conn:
+            for batch in iter_record_batches(conn, filters, chunk_rows=chunk_rows):
+                writer.write_batch(batch)
+                yield sink.take()
+    yield sink.take()
+
+
+def _with_partition_columns(batch):
+    pa = require_pyarrow()
+    fecha = batch.column("EventoFechaHora").cast(pa.date32())
+    return batch.append_column(pa.field("Fecha", pa.date32()), fecha)
+
+
+def write_dataset(
+    engine,
+    filters: MarkFilters,
+    out_dir: str,
+    *,
+    fmt: str = "parquet",
+    chunk_rows: int = 5000,
+) -> int:
+    """
+    Escribe los marcajes del filtro en `out_dir` como dataset particionado
+    estilo Hive: Fecha=YYYY-MM-DD/DispositivoSerial=<serial>/part-N.<fmt>.
+    Las particiones que se vuelven a exportar se reemplazan; las demás no
+    se tocan. Regresa el número de filas escritas.
+    """
+    if fmt not in DATASET_FORMATS:
+        raise ValueError(f"formato no soportado: {fmt!r}")
+    pa = require_pyarrow()
+    import pyarrow.dataset as ds  # type: ignore
+
+    schema = mark_schema().append(pa.field("Fecha", pa.date32()))
+    written = 0
+
+    def _batches():
+        nonlocal written
+        with engine.connect() as conn:
+            for batch in iter_record_batches(conn, filters, chunk_rows=chunk_rows):
+                written += batch.num_rows
+                yield _with_partition_columns(batch)
+
+    ds.write_dataset(
+        _batches(),
+        out_dir,
+        schema=schema,
+        format="parquet" if fmt == "parquet" else "ipc",
+        partitioning=ds.partitioning(
+            pa.schema([schema.field(name) for name in PARTITION_FIELDS]), flavor="hive",
+        ),
+        basename_template="part-{i}." + ("parquet" if fmt == "parquet" else "arrow"),
+        existing_data_behavior="delete_matching",
+        max_rows_per_group=max(chunk_rows, 64 * 1024),
+    )
+    log.info("Export columnar | dir=%s | formato=%s | filas=%d", out_dir, fmt, written)
+    return written
+
@@ -0,0 +1,91 @@
+"""
+Consultas de /attendance/daily sobre dbo.AsistenciaDiaria (el resumen por
+empleado y día que mantiene collector/rollup.py).
+
+Orden Fecha, UsuarioDispositivo (la PK) y paginación por cursor igual que
+/marks: el cursor es la llave de la última fila de la página anterior.
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from mb160_service.api.marks import pack_cursor, unpack_cursor
+
+DAILY_FIELDS = (
+    "UsuarioDispositivo",
+    "Fecha",
+    "PrimeraEntrada",
+    "SalidaComida",
+    "EntradaComida",
+    "UltimaSalida",
+    "Marcajes",
+)
+DAILY_COLUMNS = ", ".join(DAILY_FIELDS)
+
+_AFTER_CURSOR_SQL = (
+    "Fecha >= :cursor_fecha AND (Fecha > :cursor_fecha OR UsuarioDispositivo > :cursor_user)"
+)
+
+
+@dataclass(frozen=True)
+class DailyFilters:
+    user_id: Optional[str] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None  # inclusive
+
+    def where(self) -> Tuple[List[str], Dict[str, Any]]:
+        where: List[str] = []
+        params: Dict[str, Any] = {}
+        if self.user_id:
+            where.append("UsuarioDispositivo = :user_id")
+            params["user_id"] = self.user_id
+        if self.date_from:
+            where.append("Fecha >= :date_from")
+            params["date_from"] = self.date_from
+        if self.date_to:
+            where.append("Fecha <= :date_to")
+            params["date_to"] = self.date_to
+        return where, params
+
+
+def _decode_cursor(token: str) -> Tuple[date, str]:
+    try:
+        fecha, user_id = unpack_cursor(token)
+        return date.fromisoformat(fecha), str(user_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"cursor inválido: {token!r}") from e
+
+
+def fetch_daily_page(
+    conn,
+    filters: DailyFilters,
+    *,
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Una página del resumen diario y el cursor de la siguiente (None si ya no hay más)."""
+    where, params = filters.where()
+    params["limit"] = int(limit)
+    if cursor:
+        params["cursor_fecha"], params["cursor_user"] = _decode_cursor(cursor)
+        where.append(_AFTER_CURSOR_SQL)
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    limit_sql = "OFFSET 0 ROWS FETCH NEXT :limit ROWS ONLY" if conn.dialect.name == "mssql" else "LIMIT :limit"
+
+    q = text(f"""
+        SELECT {DAILY_COLUMNS}
+        FROM dbo.AsistenciaDiaria
+        {where_sql}
+        ORDER BY Fecha ASC, UsuarioDispositivo ASC
+        {limit_sql}
+    """)
+    rows = [dict(r) for r in conn.execute(q, params).mappings().all()]
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        # SQLite (standin) regresa la fecha como texto
+        next_cursor = pack_cursor([str(last["Fecha"])[:10], last["UsuarioDispositivo"]])
+    return rows, next_cursor
@@ -1,9 +1,17 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List, Dict, Any
 
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Header, Query, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy import text
 
+from mb160_service.api.cache import CachedResponse, ResponseCache, etag_matches, make_etag
+from mb160_service.api.columnar import ARROW_STREAM_MEDIA_TYPE, arrow_stream, require_pyarrow
+from mb160_service.api.daily import DailyFilters, fetch_daily_page
+from mb160_service.api.marks import EXPORT_MEDIA_TYPES, MARK_COLUMNS, MarkFilters, export_marks, fetch_marks_page
+from mb160_service.collector.health import read_health_file
+from mb160_service.collector.watermark import WATERMARKS
 from mb160_service.config import get_api_settings, get_db_settings
 from mb160_service.db import build_engine, test_connection
 
@@ -17,6 +25,22 @@ api_settings = get_api_settings()
 db_settings = get_db_settings()
 engine = build_engine(db_settings)
 
+# respuestas de /marks y /marks/{mark_id}, vigentes mientras no cambie el watermark de ingesta
+# (y a lo más MARKS_CACHE_MAX_AGE_SECONDS)
+MARKS_CACHE = ResponseCache(
+    max_entries=api_settings.marks_cache_entries,
+    max_bytes=api_settings.marks_cache_max_mb * 2**20,
+    max_age_seconds=api_settings.marks_cache_max_age_seconds,
+)
+CACHE_MARKS = MARKS_CACHE.enabled and WATERMARKS.enabled
+
+
+def _cached_response(entry: CachedResponse, if_none_match: Optional[str], state: str) -> Response:
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache", "X-Cache": state}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
 
 @app.get("/health")
 def health() -> Dict[str, Any]:
@@ -24,70 +48,121 @@ def health() -> Dict[str, Any]:
     return {"status": "ok", "db": db_settings.database}
 
 
+@app.get("/devices/health")
+def devices_health() -> Dict[str, Any]:
+    """
+    Estado del circuit breaker por checador (closed/open/half_open), tal como
+    lo publica el collector multi-dispositivo en DEVICE_HEALTH_FILE.
+    """
+    return read_health_file()
+
+
 @app.get("/marks", response_model=list[dict])
 def list_marks(
+    response: Response,
     user_id: Optional[str] = Query(None, description="UsuarioDispositivo (enroll/user_id del reloj)"),
     device_serial: Optional[str] = Query(None, description="DispositivoSerial"),
     dt_from: Optional[datetime] = Query(None, description="Fecha/hora local desde (inclusive)"),
     dt_to: Optional[datetime] = Query(None, description="Fecha/hora local hasta (inclusive)"),
     limit: int = Query(200, ge=1, le=2000),
-    offset: int = Query(0, ge=0),
-) -> List[Dict[str, Any]]:
-    where = []
-    params: Dict[str, Any] = {"limit": limit, "offset": offset}
-
-    if user_id:
-        where.append("UsuarioDispositivo = :user_id")
-        params["user_id"] = user_id
-    if device_serial:
-        where.append("DispositivoSerial = :device_serial")
-        params["device_serial"] = device_serial
-    if dt_from:
-        where.append("EventoFechaHora >= :dt_from")
-        params["dt_from"] = dt_from
-    if dt_to:
-        where.append("EventoFechaHora <= :dt_to")
-        params["dt_to"] = dt_to
-
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-    q = text(f"""
-        SELECT
-            AsistenciaMarcajeID,
-            DispositivoSerial,
-            DispositivoIP,
-            UsuarioDispositivo,
-            EventoFechaHora,
-            Punch,
-            Estado,
-            WorkCode,
-            FechaRegistro
-        FROM dbo.AsistenciaMarcaje
-        {where_sql}
-        ORDER BY EventoFechaHora DESC
-        OFFSET :offset ROWS
-        FETCH NEXT :limit ROWS ONLY
-    """)
-
-    with engine.connect() as conn:
-        rows = conn.execute(q, params).mappings().all()
-
-    return [dict(r) for r in rows]
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    offset: int = Query(0, ge=0, description="Obsoleto: usar cursor (costo crece con la página)"),
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
+    """
+    Marcajes del más reciente al más antiguo. Si hay más páginas, la
+    respuesta trae el header X-Next-Cursor; se manda tal cual en `cursor`
+    para pedir la siguiente.
+
+    La respuesta trae ETag: mientras el collector no inserte marcajes del
+    dispositivo filtrado (o de cualquiera, sin filtro de dispositivo), la
+    misma consulta sale de la cache y con If-None-Match regresa 304 (a lo
+    más MARKS_CACHE_MAX_AGE_SECONDS).
+    """
+    if cursor and offset:
+        raise HTTPException(status_code=400, detail="Use cursor or offset, not both")
+    filters = MarkFilters(user_id=user_id or None, device_serial=device_serial or None, dt_from=dt_from, dt_to=dt_to)
+
+    key = etag = token = None
+    if CACHE_MARKS:
+        # el watermark se lee antes de la consulta: si cambia a media consulta la entrada nace vencida
+        watermarks = WATERMARKS.snapshot()
+        key = ("marks", filters, limit, cursor or None, offset)
+        token = MARKS_CACHE.token(watermarks, filters.device_serial)
+        etag = make_etag(key, token)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        entry = MARKS_CACHE.get(key, watermarks)
+        if entry is not None:
+            return _cached_response(entry, if_none_match, "hit")
+
+    try:
+        with engine.connect() as conn:
+            rows, next_cursor = fetch_marks_page(conn, filters, limit=limit, cursor=cursor, offset=offset)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if key is None:
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return rows
+
+    entry = CachedResponse(
+        body=JSONResponse(jsonable_encoder(rows)).body,
+        etag=etag,
+        scope=filters.device_serial,
+        token=token,
+        headers={"X-Next-Cursor": next_cursor} if next_cursor else {},
+    )
+    MARKS_CACHE.put(key, entry)
+    return _cached_response(entry, None, "miss")
+
+
+@app.get("/marks/export")
+def export_marks_endpoint(
+    user_id: Optional[str] = Query(None, description="UsuarioDispositivo (enroll/user_id del reloj)"),
+    device_serial: Optional[str] = Query(None, description="DispositivoSerial"),
+    dt_from: Optional[datetime] = Query(None, description="Fecha/hora local desde (inclusive)"),
+    dt_to: Optional[datetime] = Query(None, description="Fecha/hora local hasta (inclusive)"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv|arrow)$", description="ndjson, csv o arrow (Arrow IPC stream)"),
+    gzip: bool = Query(False, description="Comprimir la respuesta (Content-Encoding: gzip); no aplica a arrow"),
+) -> StreamingResponse:
+    """
+    Todos los marcajes del filtro (mismo orden que /marks) en streaming: se
+    leen de la DB en bloques de EXPORT_CHUNK_ROWS y se envían conforme
+    llegan, sin armar la lista completa en memoria.
+    """
+    filters = MarkFilters(user_id=user_id, device_serial=device_serial, dt_from=dt_from, dt_to=dt_to)
+    headers = {"Content-Disposition": f'attachment; filename="marks.{format}"'}
+    chunk_rows = api_settings.export_chunk_rows
+
+    if format == "arrow":
+        try:
+            require_pyarrow()
+        except RuntimeError as e:
+            raise HTTPException(status_code=501, detail=str(e))
+        body = arrow_stream(engine, filters, chunk_rows=chunk_rows)
+        return StreamingResponse(body, media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
+
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    body = export_marks(engine, filters, fmt=format, chunk_rows=chunk_rows, gzip=gzip)
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
 
 
 @app.get("/marks/{mark_id}", response_model=dict)
-def get_mark(mark_id: int) -> Dict[str, Any]:
-    q = text("""
-        SELECT
-            AsistenciaMarcajeID,
-            DispositivoSerial,
-            DispositivoIP,
-            UsuarioDispositivo,
-            EventoFechaHora,
-            Punch,
-            Estado,
-            WorkCode,
-            FechaRegistro
+def get_mark(mark_id: int, if_none_match: Optional[str] = Header(None)) -> Any:
+    key = ("mark", mark_id)
+    watermarks = None
+    if CACHE_MARKS:
+        # el dispositivo del marcaje no se sabe sin la DB: el 304 sale de la entrada en cache
+        watermarks = WATERMARKS.snapshot()
+        entry = MARKS_CACHE.get(key, watermarks)
+        if entry is not None:
+            return _cached_response(entry, if_none_match, "hit")
+
+    q = text(f"""
+        SELECT {MARK_COLUMNS}
         FROM dbo.AsistenciaMarcaje
         WHERE AsistenciaMarcajeID = :id
     """)
@@ -96,8 +171,46 @@ def get_mark(mark_id: int) -> Dict[str, Any]:
 
     if not row:
         raise HTTPException(status_code=404, detail="Mark not found")
-
-    return dict(row)
+    if watermarks is None:
+        return dict(row)
+
+    scope = row["DispositivoSerial"]
+    token = MARKS_CACHE.token(watermarks, scope)
+    entry = CachedResponse(
+        body=JSONResponse(jsonable_encoder(dict(row))).body,
+        etag=make_etag(key, token),
+        scope=scope,
+        token=token,
+        headers={},
+    )
+    MARKS_CACHE.put(key, entry)
+    return _cached_response(entry, if_none_match, "miss")
+
+
+@app.get("/attendance/daily", response_model=list[dict])
+def attendance_daily(
+    response: Response,
+    user_id: Optional[str] = Query(None, description="UsuarioDispositivo (enroll/user_id del reloj)"),
+    date_from: Optional[date] = Query(None, description="Día desde (inclusive)"),
+    date_to: Optional[date] = Query(None, description="Día hasta (inclusive)"),
+    limit: int = Query(200, ge=1, le=2000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+) -> List[Dict[str, Any]]:
+    """
+    Resumen por empleado y día (PrimeraEntrada, SalidaComida, EntradaComida,
+    UltimaSalida) con las ventanas de sp_ProcessMarcajeQueue, ordenado por
+    Fecha y UsuarioDispositivo. Paginación con X-Next-Cursor igual que /marks.
+    """
+    filters = DailyFilters(user_id=user_id, date_from=date_from, date_to=date_to)
+    try:
+        with engine.connect() as conn:
+            rows, next_cursor = fetch_daily_page(conn, filters, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+"""
+Consultas de marcajes para la API (/marks).
+
+La paginación es por llave (keyset): el orden es EventoFechaHora DESC,
+AsistenciaMarcajeID ASC, el mismo de IX_AsistenciaMarcaje_Device_Fecha /
+IX_AsistenciaMarcaje_Usuario_Fecha (el ID es la llave del índice cluster y
+va al final de cada índice). El cursor es la última fila de la página
+anterior, así cada página es un seek al índice + TOP(limit) sin importar qué
+tan profunda sea, y los INSERT del collector no recorren los límites.
+"""
+import base64
+import csv
+import io
+import json
+import zlib
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+MARK_FIELDS = (
+    "AsistenciaMarcajeID",
+    "DispositivoSerial",
+    "DispositivoIP",
+    "UsuarioDispositivo",
+    "EventoFechaHora",
+    "Punch",
+    "Estado",
+    "WorkCode",
+    "FechaRegistro",
+)
+MARK_COLUMNS = ", ".join(MARK_FIELDS)
+
+_ORDER_SQL = "ORDER BY EventoFechaHora DESC, AsistenciaMarcajeID ASC"
+
+# después del cursor en el orden de arriba (forma que SQL Server resuelve como seek sobre la fecha)
+_AFTER_CURSOR_SQL = (
+    "EventoFechaHora <= :cursor_ts AND (EventoFechaHora < :cursor_ts OR AsistenciaMarcajeID > :cursor_id)"
+)
+
+
+@dataclass(frozen=True)
+class MarkFilters:
+    """Filtros de /marks (los mismos en todos los endpoints de marcajes)."""
+    user_id: Optional[str] = None
+    device_serial: Optional[str] = None
+    dt_from: Optional[datetime] = None
+    dt_to: Optional[datetime] = None  # inclusive
+
+    def where(self) -> Tuple[List[str], Dict[str, Any]]:
+        where: List[str] = []
+        params: Dict[str, Any] = {}
+        if self.user_id:
+            where.append("UsuarioDispositivo = :user_id")
+            params["user_id"] = self.user_id
+        if self.device_serial:
+            where.append("DispositivoSerial = :device_serial")
+            params["device_serial"] = self.device_serial
+        if self.dt_from:
+            where.append("EventoFechaHora >= :dt_from")
+            params["dt_from"] = self.dt_from
+        if self.dt_to:
+            where.append("EventoFechaHora <= :dt_to")
+            params["dt_to"] = self.dt_to
+        return where, params
+
+
+def pack_cursor(values: Sequence[Any]) -> str:
+    """Cursor opaco (base64url de una lista JSON) con la llave de la última fila."""
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def unpack_cursor(token: str) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception as e:
+        raise ValueError(f"cursor inválido: {token!r}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"cursor inválido: {token!r}")
+    return values
+
+
+def encode_cursor(ts: datetime, mark_id: int) -> str:
+    return pack_cursor([ts.isoformat(), int(mark_id)])
+
+
+def decode_cursor(token: str) -> Tuple[datetime, int]:
+    """(EventoFechaHora, AsistenciaMarcajeID) de un cursor; ValueError si no es válido."""
+    try:
+        ts, mark_id = unpack_cursor(token)
+        return datetime.fromisoformat(ts), int(mark_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"cursor inválido: {token!r}") from e
+
+
+def _limit_sql(dialect: str, offset: bool) -> str:
+    if dialect == "mssql":
+        if offset:
+            return "OFFSET :offset ROWS FETCH NEXT :limit ROWS ONLY"
+        return "OFFSET 0 ROWS FETCH NEXT :limit ROWS ONLY"
+    # SQLite (standin)
+    return "LIMIT :limit OFFSET :offset" if offset else "LIMIT :limit"
+
+
+def _select_sql(filters: MarkFilters, extra_where: Sequence[str] = ()) -> Tuple[str, Dict[str, Any]]:
+    where, params = filters.where()
+    where += list(extra_where)
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    sql = f"""
+        SELECT {MARK_COLUMNS}
+        FROM dbo.AsistenciaMarcaje
+        {where_sql}
+        {_ORDER_SQL}
+    """
+    return sql, params
+
+
+def fetch_marks_page(
+    conn,
+    filters: MarkFilters,
+    *,
+    limit: int,
+    cursor: Optional[str] = None,
+    offset: int = 0,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Una página de marcajes y el cursor de la siguiente (None si ya no hay
+    más). `offset` se conserva para clientes viejos; con cursor no se usa.
+    """
+    sql, params = _select_sql(filters, [_AFTER_CURSOR_SQL] if cursor else [])
+    params["limit"] = int(limit)
+    if cursor:
+        params["cursor_ts"], params["cursor_id"] = decode_cursor(cursor)
+    use_offset = bool(offset) and not cursor
+    if use_offset:
+        params["offset"] = int(offset)
+
+    q = text(sql + _limit_sql(conn.dialect.name, use_offset))
+    rows = [dict(r) for r in conn.execute(q, params).mappings().all()]
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(_as_datetime(last["EventoFechaHora"]), last["AsistenciaMarcajeID"])
+    return rows, next_cursor
+
+
+def iter_mark_chunks(conn, filters: MarkFilters, *, chunk_rows: int) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """
+    Todos los marcajes del filtro en bloques de `chunk_rows` tuplas
+    (columnas, filas), en el mismo orden que /marks. Es una sola consulta con
+    stream_results: el driver entrega filas conforme se piden, así la
+    memoria depende de chunk_rows y no del rango.
+    """
+    chunk_rows = max(1, int(chunk_rows))
+    sql, params = _select_sql(filters)
+    result = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(text(sql), params)
+    columns = list(result.keys())
+    for rows in result.partitions(chunk_rows):
+        yield columns, rows
+
+
+# ---- export (/marks/export) ----
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} no es serializable")
+
+
+_JSON = json.JSONEncoder(default=_json_default, ensure_ascii=False)
+
+
+def _encode_ndjson(columns: List[str], rows: List[tuple]) -> bytes:
+    encode = _JSON.encode
+    return "".join(encode(dict(zip(columns, row))) + "\n" for row in rows).encode("utf-8")
+
+
+def _encode_csv(rows: Iterable[Sequence[Any]]) -> bytes:
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+def export_marks(
+    engine,
+    filters: MarkFilters,
+    *,
+    fmt: str = "ndjson",
+    chunk_rows: int = 5000,
+    gzip: bool = False,
+) -> Iterator[bytes]:
+    """
+    Cuerpo de /marks/export: NDJSON (un objeto por línea) o CSV con
+    encabezado, un bloque de bytes por fetch de `chunk_rows` filas. Con
+    gzip cada bloque sale con Z_SYNC_FLUSH (el cliente puede descomprimir
+    sin esperar al final). La conexión se abre y se cierra dentro del
+    generador, también si el cliente corta la descarga.
+    """
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise ValueError(f"formato no soportado: {fmt!r}")
+    zipper = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def _out(data: bytes) -> bytes:
+        return zipper.compress(data) + zipper.flush(zlib.Z_SYNC_FLUSH) if zipper else data
+
+    if fmt == "csv":
+        # el encabezado sale antes de la consulta: primer byte inmediato
+        yield _out(_encode_csv([MARK_FIELDS]))
+    with engine.connect() as conn:
+        for columns, rows in iter_mark_chunks(conn, filters, chunk_rows=chunk_rows):
+            yield _out(_encode_ndjson(columns, rows) if fmt == "ndjson" else _encode_csv(rows))
+    if zipper:
+        yield zipper.flush()
+
+
+def _as_datetime(value: Any) -> datetime:
+    # SQLite (standin) regresa texto en consultas text()
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
@@ -0,0 +1,294 @@
+"""
+Lectura de asistencia del MB160 en streaming.
+
+pyzk `get_attendance()` baja el buffer completo (1503/1504), lo junta en un
+solo bytes y arma un objeto Attendance por registro; además vuelve a llamar
+read_sizes() y get_users(). Aquí se pide el mismo buffer pero se procesa
+chunk por chunk (≤64 KB en TCP): cada registro de 40 bytes se filtra por la
+fecha codificada (entero) antes de crear el datetime, y solo los que caen en
+la ventana se agregan a un AttendanceBatch (o se emiten como
+AttendanceRecord). La memoria del poll depende de los registros que pasan el
+filtro, no del tamaño del log del reloj.
+"""
+import logging
+import struct
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from mb160_service.collector.batch import AttendanceBatch
+from mb160_service.collector.dump_cache import DumpWriter
+from mb160_service.utils import zkproto as zp
+
+log = logging.getLogger("mb160.collector.stream")
+
+_ATT_40 = struct.Struct("<H24sBIB8s")  # uid, user_id, status, fecha codificada, punch, reservado
+_TCP_CHUNK = 0xFFC0  # mismos tamaños que pyzk read_with_buffer
+_UDP_CHUNK = 16 * 1024
+
+
+class AttendanceRecord(NamedTuple):
+    """Registro compacto con los mismos atributos que pyzk Attendance."""
+    user_id: str
+    timestamp: datetime
+    status: int
+    punch: int
+    uid: int
+
+
+class StreamingNotSupported(Exception):
+    """El firmware no usa registros de 40 bytes o no soporta 1503; usar get_attendance()."""
+
+
+# errores que indican que pyzk (atributos privados, requirements.txt fija la
+# versión) o la respuesta del reloj no son lo que se espera: se cae a
+# get_attendance() en vez de fallar el poll. Los de red (OSError/ZKError) no
+# entran aquí: esos reconectan y reintentan la fase.
+_PROTOCOL_ERRORS = (AttributeError, KeyError, IndexError, TypeError, struct.error)
+
+
+def _zk_private(conn, name: str) -> Any:
+    """Atributo privado de pyzk ZK (name mangling: _ZK__<name>)."""
+    try:
+        return getattr(conn, f"_ZK__{name}")
+    except AttributeError as e:
+        raise StreamingNotSupported(f"pyzk sin ZK.__{name}") from e
+
+
+def _bounds(min_ts: Optional[datetime], max_ts: Optional[datetime], after_ts: Optional[datetime]):
+    """
+    Límites de la ventana como fechas codificadas del reloj (resolución de
+    1s), con la misma semántica que _filter_logs:
+    min_ts <= ts < max_ts y ts > after_ts.
+    """
+    lo = None
+    if min_ts is not None:
+        lo = zp.encode_time(min_ts) + (1 if min_ts.microsecond else 0)
+    if after_ts is not None:
+        after = zp.encode_time(after_ts) + 1
+        lo = after if lo is None else max(lo, after)
+    hi = None
+    if max_ts is not None:
+        hi = zp.encode_time(max_ts) + (1 if max_ts.microsecond else 0)
+    return lo, hi
+
+
+class _Parser:
+    """Acumula bytes del buffer y emite los registros que pasan el filtro."""
+
+    def __init__(self, record_count: int, lo: Optional[int], hi: Optional[int],
+                 batch: Optional[AttendanceBatch] = None):
+        self._record_count = record_count
+        self._batch = batch
+        self._lo = lo
+        self._hi = hi
+        self._pending = b""
+        self._header = True
+        self._user_ids: Dict[bytes, str] = {}  # user_id interned: un str por empleado
+        self.scanned = 0
+
+    def feed(self, data: bytes) -> List[AttendanceRecord]:
+        buf = self._pending + data if self._pending else data
+        if self._header:
+            if len(buf) < 4:
+                self._pending = buf
+                return []
+            total_size = struct.unpack("<I", buf[:4])[0]
+            # pueden entrar checadas entre read_sizes() y 1503: el conteo solo sirve
+            # para distinguir el formato de 40 bytes de los de 8/16
+            if total_size % _ATT_40.size or (total_size // _ATT_40.size) * 2 < self._record_count:
+                raise StreamingNotSupported(f"record_size={total_size / max(1, self._record_count):g}")
+            buf = buf[4:]
+            self._header = False
+
+        usable = len(buf) - len(buf) % _ATT_40.size
+        self._pending = buf[usable:]
+        if not usable:
+            return []
+
+        lo, hi = self._lo, self._hi
+        user_ids = self._user_ids
+        batch = self._batch
+        out: List[AttendanceRecord] = []
+        # con batch se juntan columnas del chunk y se agregan de una vez
+        col_user: List[str] = []
+        col_ts: List[int] = []
+        col_punch: List[int] = []
+        col_status: List[int] = []
+        for uid, raw_user, status, encoded, punch, _reserved in _ATT_40.iter_unpack(memoryview(buf)[:usable]):
+            if lo is not None and encoded < lo:
+                continue
+            if hi is not None and encoded >= hi:
+                continue
+            raw_user = bytes(raw_user)
+            user_id = user_ids.get(raw_user)
+            if user_id is None:
+                # mismo user_id que AttendanceBatch.from_records (dedupe por llave)
+                user_id = raw_user.split(b"\x00")[0].decode(errors="ignore").strip()
+                user_ids[raw_user] = user_id
+            if batch is not None:
+                col_user.append(user_id)
+                col_ts.append(encoded)
+                col_punch.append(punch)
+                col_status.append(status)
+            else:
+                out.append(AttendanceRecord(user_id, zp.decode_time(encoded), status, punch, uid))
+        if col_ts:
+            batch.extend_encoded(col_user, col_ts, col_punch, col_status)
+        self.scanned += usable // _ATT_40.size
+        return out
+
+
+def _prepare_buffer(conn) -> Any:
+    """
+    CMD_PREPARE_BUFFER (1503) para el log de asistencia. Regresa el tamaño
+    del buffer, o los bytes completos si el reloj los mandó en la respuesta.
+    """
+    command_string = struct.pack("<bhii", 1, zp.CMD_ATTLOG_RRQ, 0, 0)
+    send_command = _zk_private(conn, "send_command")
+    try:
+        response = send_command(zp.CMD_PREPARE_BUFFER, command_string, 1024)
+        if not response.get("status"):
+            raise StreamingNotSupported("RWB Not supported")
+        data = _zk_private(conn, "data")
+        if response["code"] == zp.CMD_DATA:
+            # respuesta directa (logs chicos): igual que pyzk read_with_buffer
+            tcp_length = _zk_private(conn, "tcp_length")
+            if conn.tcp and len(data) < tcp_length - 8:
+                data = data + _zk_private(conn, "recieve_raw_data")((tcp_length - 8) - len(data))
+            return data
+        return struct.unpack("<I", data[1:5])[0]
+    except _PROTOCOL_ERRORS as e:
+        raise StreamingNotSupported(f"respuesta 1503 inesperada: {type(e).__name__}: {e}") from e
+
+
+def iter_attendance(
+    conn,
+    *,
+    record_count: int,
+    min_ts: Optional[datetime] = None,
+    max_ts: Optional[datetime] = None,
+    after_ts: Optional[datetime] = None,
+    stats: Optional[Dict[str, int]] = None,
+) -> Iterator[AttendanceRecord]:
+    """
+    Registros del reloj con min_ts <= timestamp < max_ts y timestamp >
+    after_ts, leyendo el buffer por chunks. record_count es el de
+    read_sizes() (para reconocer el formato de registro). En `stats` deja
+    scanned (registros leídos) y bytes.
+
+    Lanza StreamingNotSupported antes de emitir registros si el firmware no
+    tiene el formato de 40 bytes o la versión de pyzk no tiene los métodos
+    privados que se usan.
+    """
+    if record_count == 0:
+        return
+    lo, hi = _bounds(min_ts, max_ts, after_ts)
+    yield from _stream(conn, _Parser(record_count, lo, hi), stats)
+
+
+def _stream(
+    conn, parser: _Parser, stats: Optional[Dict[str, int]], dump: Optional[DumpWriter] = None,
+) -> Iterator[AttendanceRecord]:
+    prepared = _prepare_buffer(conn)
+    total_bytes = 0
+    try:
+        if isinstance(prepared, (bytes, bytearray)):
+            total_bytes = len(prepared)
+            yield from parser.feed(bytes(prepared))
+            if dump is not None:
+                dump.write(bytes(prepared))
+        else:
+            read_chunk = _zk_private(conn, "read_chunk")
+            max_chunk = _TCP_CHUNK if conn.tcp else _UDP_CHUNK
+            start = 0
+            while start < prepared:
+                size = min(max_chunk, prepared - start)
+                try:
+                    chunk = read_chunk(start, size)
+                except _PROTOCOL_ERRORS as e:
+                    raise StreamingNotSupported(f"read_chunk: {type(e).__name__}: {e}") from e
+                start += size
+                total_bytes += len(chunk)
+                yield from parser.feed(chunk)
+                if dump is not None:
+                    dump.write(chunk)
+    finally:
+        if not isinstance(prepared, (bytes, bytearray)):
+            try:
+                conn.free_data()
+            except Exception as e:
+                log.debug("free_data falló tras leer asistencia. Error=%s", e)
+        if stats is not None:
+            stats["scanned"] = parser.scanned
+            stats["bytes"] = total_bytes
+
+
+def read_attendance(
+    conn,
+    *,
+    record_count: Optional[int],
+    device_serial: str = "",
+    device_ip: str = "",
+    min_ts: Optional[datetime] = None,
+    max_ts: Optional[datetime] = None,
+    after_ts: Optional[datetime] = None,
+    stats: Optional[Dict[str, int]] = None,
+    dump: Optional[DumpWriter] = None,
+) -> AttendanceBatch:
+    """
+    AttendanceBatch con los registros de la ventana, armado mientras se lee
+    el buffer. Si el firmware no soporta la lectura en streaming (o no hay
+    conteo de read_sizes) cae a get_attendance() y filtra el batch después.
+
+    Con `dump` (DumpCache.writer) el buffer crudo completo se guarda en el
+    cache mientras se lee; se descarta si la lectura no termina.
+    """
+    if record_count is not None:
+        batch = AttendanceBatch(device_serial, device_ip)
+        if record_count == 0:
+            return batch
+        lo, hi = _bounds(min_ts, max_ts, after_ts)
+        try:
+            for _ in _stream(conn, _Parser(record_count, lo, hi, batch), stats, dump):
+                pass
+            if dump is not None:
+                dump.commit()
+            return batch
+        except StreamingNotSupported as e:
+            log.info("Lectura en streaming no soportada (%s); se usa get_attendance()", e)
+        finally:
+            if dump is not None:
+                dump.abort()
+    elif dump is not None:
+        dump.abort()
+
+    logs = conn.get_attendance() or []
+    if stats is not None:
+        stats["scanned"] = len(logs)
+    batch = AttendanceBatch.from_records(logs, device_serial=device_serial, device_ip=device_ip)
+    return batch.select(min_ts=min_ts, max_ts=max_ts, after_ts=after_ts)
+
+
+def read_attendance_dump(
+    chunks: Iterable[bytes],
+    *,
+    record_count: int,
+    device_serial: str = "",
+    device_ip: str = "",
+    min_ts: Optional[datetime] = None,
+    max_ts: Optional[datetime] = None,
+    after_ts: Optional[datetime] = None,
+    stats: Optional[Dict[str, int]] = None,
+) -> AttendanceBatch:
+    """Igual que read_attendance, pero desde un dump crudo del cache (DumpCache.read)."""
+    batch = AttendanceBatch(device_serial, device_ip)
+    lo, hi = _bounds(min_ts, max_ts, after_ts)
+    parser = _Parser(record_count, lo, hi, batch)
+    total_bytes = 0
+    for chunk in chunks:
+        total_bytes += len(chunk)
+        parser.feed(chunk)
+    if stats is not None:
+        stats["scanned"] = parser.scanned
+        stats["bytes"] = total_bytes
+    return batch
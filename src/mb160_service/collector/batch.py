@@ -0,0 +1,245 @@
+"""
+AttendanceBatch: marcajes en columnas (array de la stdlib) entre la
+descarga y el INSERT.
+
+En lugar de un objeto Attendance + un dict por registro, el batch guarda:
+  ts       array('q')  segundos desde 1970-01-01 (hora local, sin zona)
+  user     array('I')  índice a `users` (cada UsuarioDispositivo una vez)
+  punch    array('B')
+  status   array('B')
+  workcode array('l')  -1 = NULL
+
+Filtrar por ventana (bisección, ver window.py), ordenar y quitar duplicados
+de la llave de UQ_AsistenciaMarcaje_Dedupe (usuario, fecha, punch, estado)
+trabajan sobre las columnas y el batch se convierte al final directo a los
+parámetros del executemany.
+"""
+import itertools
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from mb160_service.collector.window import Bounds, TimeWindow, WindowIndex, sorted_prefix
+from mb160_service.utils import zkproto as zp
+
+_EPOCH = datetime(1970, 1, 1)
+_NO_WORKCODE = -1
+
+
+def to_epoch(ts: datetime) -> int:
+    """Segundos desde 1970-01-01 de un datetime local (se descartan microsegundos)."""
+    return (ts.toordinal() - _EPOCH.toordinal()) * 86400 + ts.hour * 3600 + ts.minute * 60 + ts.second
+
+
+def from_epoch(seconds: int) -> datetime:
+    return _EPOCH + timedelta(seconds=seconds)
+
+
+def _ceil_epoch(ts: datetime) -> int:
+    # límite inferior con microsegundos: el primer segundo entero >= ts
+    return to_epoch(ts) + (1 if ts.microsecond else 0)
+
+
+def _bounds(min_ts: Optional[datetime], max_ts: Optional[datetime], after_ts: Optional[datetime]) -> Bounds:
+    """[lo, hi) en segundos para min_ts <= ts < max_ts y ts > after_ts."""
+    lo = None if min_ts is None else _ceil_epoch(min_ts)
+    if after_ts is not None:
+        after = to_epoch(after_ts) + 1
+        lo = after if lo is None else max(lo, after)
+    hi = None if max_ts is None else _ceil_epoch(max_ts)
+    return lo, hi
+
+
+class AttendanceBatch:
+    """Marcajes de un dispositivo en columnas; ver docstring del módulo."""
+
+    __slots__ = ("device_serial", "device_ip", "users", "ts", "user", "punch", "status", "workcode",
+                 "_user_index", "_day_epoch", "_index")
+
+    def __init__(self, device_serial: str = "", device_ip: str = ""):
+        self.device_serial = device_serial
+        self.device_ip = device_ip
+        self.users: List[str] = []
+        self.ts = array("q")
+        self.user = array("I")
+        self.punch = array("B")
+        self.status = array("B")
+        self.workcode = array("l")
+        self._user_index: Dict[str, int] = {}
+        self._day_epoch: Dict[int, int] = {}
+        self._index: Optional[WindowIndex] = None
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    # ---- construcción ----
+
+    def _intern(self, user_id: str) -> int:
+        idx = self._user_index.get(user_id)
+        if idx is None:
+            idx = len(self.users)
+            self.users.append(user_id)
+            self._user_index[user_id] = idx
+        return idx
+
+    def append(self, user_id: str, ts: datetime, punch: int = 0, status: int = 0,
+               workcode: Optional[int] = None) -> None:
+        self._index = None
+        self.ts.append(to_epoch(ts))
+        self.user.append(self._intern(user_id))
+        self.punch.append(int(punch or 0) & 0xFF)
+        self.status.append(int(status or 0) & 0xFF)
+        self.workcode.append(_NO_WORKCODE if workcode is None else int(workcode))
+
+    def append_encoded(self, user_id: str, encoded: int, punch: int, status: int) -> None:
+        """Registro crudo del reloj (fecha codificada de zkemsdk), sin crear datetime."""
+        self._index = None
+        day = encoded // 86400
+        base = self._day_epoch.get(day)
+        if base is None:
+            base = to_epoch(zp.decode_time(day * 86400))
+            self._day_epoch[day] = base
+        self.ts.append(base + encoded % 86400)
+        self.user.append(self._intern(user_id))
+        self.punch.append(punch & 0xFF)
+        self.status.append(status & 0xFF)
+        self.workcode.append(_NO_WORKCODE)
+
+    def extend_encoded(self, user_ids: List[str], encoded: List[int], punch: List[int], status: List[int]) -> None:
+        """Varios registros crudos del reloj (columnas paralelas), p.ej. un chunk del buffer."""
+        self._index = None
+        days = self._day_epoch
+        for day in {e // 86400 for e in encoded}:
+            if day not in days:
+                days[day] = to_epoch(zp.decode_time(day * 86400))
+        self.ts.extend([days[e // 86400] + e % 86400 for e in encoded])
+        self.user.extend(map(self._intern, user_ids))
+        self.punch.extend(punch)
+        self.status.extend(status)
+        self.workcode.extend(itertools.repeat(_NO_WORKCODE, len(encoded)))
+
+    @classmethod
+    def from_records(cls, records: Iterable[Any], *, device_serial: str = "", device_ip: str = "") -> "AttendanceBatch":
+        """Desde objetos con timestamp/user_id/punch/status (pyzk Attendance, eventos de live_capture)."""
+        batch = cls(device_serial, device_ip)
+        for rec in records:
+            ts = getattr(rec, "timestamp", None)
+            if ts is None:
+                continue
+            batch.append(
+                str(getattr(rec, "user_id", "")).strip(), ts,
+                getattr(rec, "punch", 0), getattr(rec, "status", 0), getattr(rec, "workcode", None),
+            )
+        return batch
+
+    def _take(self, indexes: Iterable[int]) -> "AttendanceBatch":
+        out = AttendanceBatch(self.device_serial, self.device_ip)
+        out.users = self.users
+        out._user_index = self._user_index
+        out._day_epoch = self._day_epoch
+        if isinstance(indexes, range) and indexes.step == 1:
+            # ventana contigua (bisección sobre datos ordenados): copia por slice
+            cut = slice(indexes.start, indexes.stop)
+            out.ts, out.user, out.punch = self.ts[cut], self.user[cut], self.punch[cut]
+            out.status, out.workcode = self.status[cut], self.workcode[cut]
+            return out
+        idx = indexes if isinstance(indexes, (list, range)) else list(indexes)
+        out.ts = array("q", map(self.ts.__getitem__, idx))
+        out.user = array("I", map(self.user.__getitem__, idx))
+        out.punch = array("B", map(self.punch.__getitem__, idx))
+        out.status = array("B", map(self.status.__getitem__, idx))
+        out.workcode = array("l", map(self.workcode.__getitem__, idx))
+        return out
+
+    # ---- operaciones ----
+
+    def window_index(self) -> WindowIndex:
+        """Índice de bisección por fecha; se arma una vez y lo comparten todas las ventanas."""
+        if self._index is None:
+            self._index = WindowIndex(self.ts)
+        return self._index
+
+    def is_sorted(self) -> bool:
+        if self._index is not None:
+            return self._index.sorted
+        return sorted_prefix(self.ts) == len(self)
+
+    def sort(self) -> "AttendanceBatch":
+        """Ordenado por fecha (estable). Regresa el mismo batch si ya lo estaba."""
+        if self.is_sorted():
+            return self
+        return self._take(sorted(range(len(self)), key=self.ts.__getitem__))
+
+    def select(
+        self,
+        *,
+        min_ts: Optional[datetime] = None,
+        max_ts: Optional[datetime] = None,
+        after_ts: Optional[datetime] = None,
+    ) -> "AttendanceBatch":
+        """Registros con min_ts <= ts < max_ts y ts > after_ts (misma semántica que el poller)."""
+        return self.select_windows([TimeWindow(min_ts, max_ts)], after_ts=after_ts)[0]
+
+    def select_windows(
+        self,
+        windows: List[TimeWindow],
+        *,
+        after_ts: Optional[datetime] = None,
+    ) -> List["AttendanceBatch"]:
+        """Un batch por ventana [min_ts, max_ts), todas con el mismo índice."""
+        bounds = [_bounds(w.min_ts, w.max_ts, after_ts) for w in windows]
+        if all(lo is None and hi is None for lo, hi in bounds):
+            return [self for _ in windows]
+        selected = self.window_index().indexes_many(bounds)
+        return [
+            self if isinstance(idx, range) and len(idx) == len(self) else self._take(idx)
+            for idx in selected
+        ]
+
+    def dedupe(self) -> Tuple["AttendanceBatch", int]:
+        """
+        Quita repetidos de (usuario, fecha, punch, estado), conservando el
+        primero. Regresa (batch, duplicados quitados).
+        """
+        seen: Dict[Tuple[int, int, int, int], int] = {}
+        for i, key in enumerate(zip(self.user, self.ts, self.punch, self.status)):
+            seen.setdefault(key, i)
+        if len(seen) == len(self):
+            return self, 0
+        return self._take(sorted(seen.values())), len(self) - len(seen)
+
+    def min_ts(self) -> Optional[datetime]:
+        return from_epoch(min(self.ts)) if len(self) else None
+
+    def max_ts(self) -> Optional[datetime]:
+        return from_epoch(max(self.ts)) if len(self) else None
+
+    # ---- salida ----
+
+    def to_params(self, user_map: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Parámetros del INSERT a dbo.AsistenciaMarcaje (mismas llaves que _mark_params)."""
+        names = user_map or {}
+        user_names = [names.get(u) or None for u in self.users]
+        stamps: Dict[int, datetime] = {}
+        rows: List[Dict[str, Any]] = []
+        serial, ip, users = self.device_serial, self.device_ip, self.users
+        for ts, uidx, punch, status, workcode in zip(self.ts, self.user, self.punch, self.status, self.workcode):
+            stamp = stamps.get(ts)
+            if stamp is None:
+                stamp = stamps[ts] = _EPOCH + timedelta(seconds=ts)
+            rows.append({
+                "DispositivoSerial": serial,
+                "DispositivoIP": ip,
+                "UsuarioDispositivo": users[uidx],
+                "UsuarioNombre": user_names[uidx],
+                "EventoFechaHora": stamp,
+                "Punch": punch,
+                "Estado": status,
+                "WorkCode": None if workcode == _NO_WORKCODE else workcode,
+            })
+        return rows
+
+    def __iter__(self) -> Iterator[Tuple[str, datetime, int, int]]:
+        """(user_id, timestamp, punch, status) por registro; para depurar/tests."""
+        for ts, uidx, punch, status in zip(self.ts, self.user, self.punch, self.status):
+            yield self.users[uidx], from_epoch(ts), punch, status
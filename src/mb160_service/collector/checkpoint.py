@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from mb160_service.utils.filelock import file_lock
+
+log = logging.getLogger("mb160.checkpoint")
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """
+    Último EventoFechaHora ingerido y número de registros que reportó el
+    dispositivo (read_sizes()) en el último poll incremental confirmado.
+    record_count sólo sirve como pista para saltar el siguiente poll
+    incremental si el conteo no cambió; los pulls por rango no lo mueven.
+    """
+    last_ts: Optional[datetime]
+    record_count: int
+    updated_at: datetime
+
+
+class CheckpointStore:
+    """
+    Watermark por DispositivoSerial para no correr SELECT MAX(EventoFechaHora)
+    en cada poll. Vive en memoria y se persiste en un JSON local (escritura
+    atómica con os.replace) después de cada transacción confirmada.
+
+    Varios procesos pueden compartir el archivo (collector, pulls por cron):
+    cada escritura toma un lock de archivo (`<path>.lock`), vuelve a leer lo
+    que haya en disco y lo mezcla antes de escribir, así no se pierden los
+    watermarks que guardó otro proceso.
+
+    path vacío/None = solo memoria (se reconstruye desde la DB al reiniciar).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path or None
+        self._lock = threading.Lock()
+        self._items: Dict[str, Checkpoint] = {}
+        self._load()
+
+    def _read_file(self) -> Dict[str, Checkpoint]:
+        if not self._path or not os.path.exists(self._path):
+            return {}
+        with open(self._path, "r", encoding="utf-8") as fh:
+            raw = json.load(fh)
+        items = {}
+        for serial, item in raw.items():
+            last_ts = item.get("last_ts")
+            items[serial] = Checkpoint(
+                last_ts=datetime.fromisoformat(last_ts) if last_ts else None,
+                record_count=int(item.get("record_count", 0)),
+                updated_at=datetime.fromisoformat(item["updated_at"]),
+            )
+        return items
+
+    def _load(self) -> None:
+        try:
+            self._items = self._read_file()
+        except Exception as e:
+            # archivo corrupto: arrancamos en frío, la DB es la fuente de verdad
+            log.warning("No se pudo leer checkpoints (%s). Arranque en frío. Error=%s", self._path, e)
+            self._items = {}
+
+    @contextmanager
+    def _file_locked(self) -> Iterator[None]:
+        """Lock de archivo con lo de disco ya mezclado en memoria (por serial gana el más reciente)."""
+        if not self._path:
+            yield
+            return
+        with file_lock(f"{self._path}.lock"):
+            try:
+                on_disk = self._read_file()
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                log.warning("No se pudo leer checkpoints (%s); se reescribe con lo de memoria. Error=%s", self._path, e)
+                on_disk = {}
+            for serial, cp in on_disk.items():
+                mine = self._items.get(serial)
+                if mine is None or cp.updated_at > mine.updated_at:
+                    self._items[serial] = cp
+            yield
+
+    def _persist(self) -> None:
+        """Escribe lo de memoria; se llama dentro de _file_locked()."""
+        if not self._path:
+            return
+        payload = {
+            serial: {
+                "last_ts": cp.last_ts.isoformat() if cp.last_ts else None,
+                "record_count": cp.record_count,
+                "updated_at": cp.updated_at.isoformat(),
+            }
+            for serial, cp in self._items.items()
+        }
+        tmp = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, indent=2, sort_keys=True)
+        os.replace(tmp, self._path)
+
+    def get(self, device_serial: str) -> Optional[Checkpoint]:
+        with self._lock:
+            return self._items.get(device_serial)
+
+    def snapshot(self) -> Dict[str, Checkpoint]:
+        with self._lock:
+            return dict(self._items)
+
+    def _apply(self, device_serial: str, last_ts: Optional[datetime], record_count: int) -> Checkpoint:
+        prev = self._items.get(device_serial)
+        if prev and prev.last_ts and (last_ts is None or last_ts < prev.last_ts):
+            last_ts = prev.last_ts
+        cp = Checkpoint(last_ts=last_ts, record_count=int(record_count), updated_at=datetime.now())
+        self._items[device_serial] = cp
+        return cp
+
+    def commit(self, device_serial: str, *, last_ts: Optional[datetime], record_count: int) -> Checkpoint:
+        """
+        Registra el watermark de un batch ya confirmado en la DB. last_ts nunca
+        retrocede (tampoco contra lo que otro proceso dejó en el archivo): un
+        pull por rango viejo no mueve el watermark hacia atrás.
+        """
+        with self._lock:
+            cp = None
+            try:
+                with self._file_locked():
+                    cp = self._apply(device_serial, last_ts, record_count)
+                    self._persist()
+            except OSError as e:
+                log.warning("No se pudo guardar checkpoints (%s). Error=%s", self._path, e)
+                if cp is None:
+                    cp = self._apply(device_serial, last_ts, record_count)
+            return cp
+
+    def invalidate(self, device_serial: str) -> None:
+        with self._lock:
+            try:
+                with self._file_locked():
+                    if self._items.pop(device_serial, None) is not None:
+                        self._persist()
+            except OSError as e:
+                log.warning("No se pudo guardar checkpoints (%s). Error=%s", self._path, e)
+                self._items.pop(device_serial, None)
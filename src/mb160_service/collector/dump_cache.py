@@ -0,0 +1,317 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+import zlib
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from mb160_service.utils.filelock import file_lock
+
+log = logging.getLogger("mb160.dump_cache")
+
+_READ_CHUNK = 64 * 1024
+_INDEX = "index.json"
+_INDEX_LOCK = "index.lock"
+
+
+@dataclass(frozen=True)
+class DumpEntry:
+    """Un dump crudo del log de asistencia de un dispositivo."""
+    device_serial: str
+    record_count: int
+    digest: str  # sha256 del buffer crudo (nombre del archivo)
+    raw_bytes: int
+    stored_bytes: int  # tamaño comprimido en disco
+    created_at: datetime
+    last_used_at: datetime
+
+
+class DumpMissing(Exception):
+    """El archivo del dump ya no está o no cuadra con su sha256: tratar como cache miss."""
+
+
+def _key(device_serial: str, record_count: int) -> str:
+    return f"{device_serial}:{int(record_count)}"
+
+
+class DumpWriter:
+    """
+    Comprime y hashea el buffer mientras llega (chunk por chunk, memoria
+    constante). commit() lo registra en el cache; abort() lo descarta (no
+    hace nada después de commit).
+    """
+
+    def __init__(self, cache: "DumpCache", device_serial: str, record_count: int):
+        self._cache = cache
+        self.device_serial = device_serial
+        self.record_count = int(record_count)
+        self._tmp = os.path.join(cache.folder, f".{uuid.uuid4().hex}.tmp")
+        os.makedirs(cache.folder, exist_ok=True)
+        self._fh = open(self._tmp, "wb")
+        self._zip = zlib.compressobj(6)
+        self._hash = hashlib.sha256()
+        self.raw_bytes = 0
+        self._done = False
+
+    def write(self, data: bytes) -> None:
+        self._hash.update(data)
+        self.raw_bytes += len(data)
+        self._fh.write(self._zip.compress(data))
+
+    def commit(self) -> DumpEntry:
+        self._fh.write(self._zip.flush())
+        self._fh.close()
+        self._done = True
+        return self._cache._add(self, self._tmp, self._hash.hexdigest())
+
+    def abort(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        try:
+            self._fh.close()
+        finally:
+            try:
+                os.remove(self._tmp)
+            except OSError:
+                pass
+
+
+class DumpCache:
+    """
+    Cache local de dumps crudos del log de asistencia (el buffer 1503/1504
+    tal como lo manda el reloj), comprimidos con zlib.
+
+    Los archivos se nombran por el sha256 del contenido (<digest>.zz) y un
+    índice JSON (escritura atómica con os.replace) los asocia a
+    (DispositivoSerial, número de registros): mientras read_sizes() del reloj
+    regrese el mismo conteo, un backfill/replay lee el dump local en vez de
+    bajar el log otra vez. Si el total pasa de `max_bytes` se borran los
+    dumps menos usados (LRU por last_used_at).
+
+    Varios procesos pueden usar la misma carpeta (run_pull_by_date y
+    run_reconcile a la vez): cada cambio vuelve a leer el índice y lo
+    escribe bajo un lock de archivo (index.lock), así no se pisan entradas.
+    """
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._items: Dict[str, DumpEntry] = {}
+        self._load()
+
+    # ---- índice ----
+
+    def _load(self) -> None:
+        """Índice desde disco (lo que hayan escrito otros procesos); sin los dumps cuyo archivo ya no está."""
+        self._items = {}
+        path = os.path.join(self.folder, _INDEX)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                raw = json.load(fh)
+            for key, item in raw.items():
+                item["created_at"] = datetime.fromisoformat(item["created_at"])
+                item["last_used_at"] = datetime.fromisoformat(item["last_used_at"])
+                entry = DumpEntry(**item)
+                if os.path.exists(self._blob(entry.digest)):
+                    self._items[key] = entry
+        except Exception as e:
+            # índice corrupto: se empieza vacío (los dumps se vuelven a bajar del reloj)
+            log.warning("No se pudo leer el índice de dumps (%s). Error=%s", path, e)
+            self._items = {}
+
+    @contextmanager
+    def _index_locked(self) -> Iterator[None]:
+        """Lock del hilo + lock de archivo, con el índice recién leído; el llamador hace _persist()."""
+        with self._lock, file_lock(os.path.join(self.folder, _INDEX_LOCK)):
+            self._load()
+            yield
+
+    def _persist(self) -> None:
+        os.makedirs(self.folder, exist_ok=True)
+        payload = {}
+        for key, entry in self._items.items():
+            item = asdict(entry)
+            item["created_at"] = entry.created_at.isoformat()
+            item["last_used_at"] = entry.last_used_at.isoformat()
+            payload[key] = item
+        path = os.path.join(self.folder, _INDEX)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+    def _blob(self, digest: str) -> str:
+        return os.path.join(self.folder, f"{digest}.zz")
+
+    # ---- lectura/escritura ----
+
+    def get(self, device_serial: str, record_count: Optional[int]) -> Optional[DumpEntry]:
+        """Dump del dispositivo con ese conteo de registros (None si no hay)."""
+        if not record_count:
+            return None
+        with self._index_locked():
+            entry = self._items.get(_key(device_serial, record_count))
+            if entry is None:
+                return None
+            entry = DumpEntry(**{**asdict(entry), "last_used_at": datetime.now()})
+            self._items[_key(device_serial, record_count)] = entry
+            try:
+                self._persist()
+            except OSError as e:
+                log.warning("No se pudo guardar el índice de dumps (%s). Error=%s", self.folder, e)
+            return entry
+
+    def read(self, entry: DumpEntry) -> Iterator[bytes]:
+        """
+        Buffer crudo descomprimido, por chunks. Si el archivo ya no está (otro
+        proceso lo desalojó) o no cuadra con su sha256, la entrada se quita
+        del índice y se lanza DumpMissing al leer: el llamador descarta lo
+        leído y baja el log del reloj.
+        """
+        unzip = zlib.decompressobj()
+        digest = hashlib.sha256()
+        try:
+            with open(self._blob(entry.digest), "rb") as fh:
+                while True:
+                    data = fh.read(_READ_CHUNK)
+                    if not data:
+                        break
+                    out = unzip.decompress(data)
+                    if out:
+                        digest.update(out)
+                        yield out
+            tail = unzip.flush()
+        except (FileNotFoundError, zlib.error) as e:
+            self.discard(entry)
+            raise DumpMissing(f"{entry.digest[:12]}: {type(e).__name__}: {e}") from e
+        if tail:
+            digest.update(tail)
+            yield tail
+        if digest.hexdigest() != entry.digest:
+            self.discard(entry)
+            raise DumpMissing(f"{entry.digest[:12]}: sha256 no coincide")
+
+    def discard(self, entry: DumpEntry) -> None:
+        """Quita `entry` del índice (y su archivo si ninguna otra llave lo usa)."""
+        with self._index_locked():
+            key = _key(entry.device_serial, entry.record_count)
+            current = self._items.get(key)
+            if current is not None and current.digest == entry.digest:
+                self._remove_locked(key)
+            try:
+                self._persist()
+            except OSError as e:
+                log.warning("No se pudo guardar el índice de dumps (%s). Error=%s", self.folder, e)
+
+    def writer(self, device_serial: str, record_count: int) -> DumpWriter:
+        return DumpWriter(self, device_serial, record_count)
+
+    def _add(self, writer: DumpWriter, tmp: str, digest: str) -> DumpEntry:
+        blob = self._blob(digest)
+        now = datetime.now()
+        with self._index_locked():
+            if os.path.exists(blob):
+                os.remove(tmp)  # mismo contenido ya guardado
+            else:
+                os.replace(tmp, blob)
+            entry = DumpEntry(
+                device_serial=writer.device_serial,
+                record_count=writer.record_count,
+                digest=digest,
+                raw_bytes=writer.raw_bytes,
+                stored_bytes=os.path.getsize(blob),
+                created_at=now,
+                last_used_at=now,
+            )
+            key = _key(entry.device_serial, entry.record_count)
+            self._items[key] = entry
+            if self.max_bytes:
+                self._evict_locked(self.max_bytes, [k for k in self._items if k != key])
+            self._persist()
+        log.info(
+            "Dump guardado | device=%s | records=%d | raw=%.1fMB | disco=%.1fMB",
+            entry.device_serial, entry.record_count, entry.raw_bytes / 2**20, entry.stored_bytes / 2**20,
+        )
+        return entry
+
+    # ---- administración ----
+
+    def entries(self) -> List[DumpEntry]:
+        with self._lock:
+            self._load()
+            return sorted(self._items.values(), key=lambda e: (e.device_serial, e.record_count))
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._load()
+            return self._total_locked()
+
+    def _total_locked(self) -> int:
+        # un archivo puede estar en dos llaves (mismo contenido): se cuenta una vez
+        return sum({e.digest: e.stored_bytes for e in self._items.values()}.values())
+
+    def _remove_locked(self, key: str) -> DumpEntry:
+        entry = self._items.pop(key)
+        if not any(e.digest == entry.digest for e in self._items.values()):
+            try:
+                os.remove(self._blob(entry.digest))
+            except OSError:
+                pass
+        return entry
+
+    def _evict_locked(self, max_bytes: int, keys: Optional[List[str]] = None) -> List[DumpEntry]:
+        """Borra los menos usados (de `keys`, o de todo el cache) hasta quedar en max_bytes."""
+        removed: List[DumpEntry] = []
+        candidates = list(self._items) if keys is None else keys
+        for key in sorted(candidates, key=lambda k: self._items[k].last_used_at):
+            if self._total_locked() <= max_bytes:
+                break
+            removed.append(self._remove_locked(key))
+        return removed
+
+    def prune(
+        self,
+        *,
+        max_bytes: Optional[int] = None,
+        older_than: Optional[datetime] = None,
+        device_serial: Optional[str] = None,
+        keep_latest: bool = False,
+    ) -> List[DumpEntry]:
+        """
+        Borra dumps de `device_serial` (o de todos): los que no se usan desde
+        `older_than` y luego los menos usados hasta que el cache quede en
+        `max_bytes`. Sin older_than ni max_bytes borra todos. keep_latest
+        conserva el dump más reciente de cada dispositivo. Regresa lo borrado.
+        """
+        with self._index_locked():
+            latest: Dict[str, str] = {}
+            for key, entry in self._items.items():
+                prev = latest.get(entry.device_serial)
+                if prev is None or entry.record_count > self._items[prev].record_count:
+                    latest[entry.device_serial] = key
+            candidates = [
+                key for key, entry in self._items.items()
+                if (device_serial is None or entry.device_serial == device_serial)
+                and not (keep_latest and latest[entry.device_serial] == key)
+            ]
+
+            removed: List[DumpEntry] = []
+            if older_than is not None:
+                expired = [k for k in candidates if self._items[k].last_used_at < older_than]
+                removed += [self._remove_locked(k) for k in expired]
+                candidates = [k for k in candidates if k not in expired]
+            if max_bytes is not None:
+                removed += self._evict_locked(max_bytes, candidates)
+            if older_than is None and max_bytes is None:
+                removed += [self._remove_locked(k) for k in candidates]
+            self._persist()
+        return removed
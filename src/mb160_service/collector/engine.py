@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from mb160_service.collector.health import BREAKERS, CLOSED, HALF_OPEN, BreakerRegistry, probe_device
+from mb160_service.collector.phases import PHASE_METRICS, PHASES
+from mb160_service.collector.pipeline import IngestPipeline
+from mb160_service.collector.poller import PollResult, download_once, poll_once
+from mb160_service.collector.sessions import SESSIONS
+
+try:
+    from zk.exception import ZKNetworkError, ZKErrorResponse  # type: ignore
+except Exception:  # pragma: no cover
+    ZKNetworkError = ZKErrorResponse = ()  # type: ignore
+
+log = logging.getLogger("mb160.collector.engine")
+
+
+class _Unreachable(OSError):
+    """El probe previo al poll no obtuvo respuesta."""
+
+
+@dataclass(frozen=True)
+class DeviceTarget:
+    ip: str
+    port: int
+    interval_seconds: int
+    label: str = ""  # "ip:puerto" cuando varios dispositivos comparten IP
+
+    @property
+    def key(self) -> str:
+        """Identificador para breakers y logs."""
+        return self.label or self.ip
+
+
+@dataclass
+class _CycleStats:
+    polled: int = 0
+    skipped: int = 0
+    inserted: int = 0
+    offline: int = 0
+    errors: int = 0
+    overdue: int = 0
+    breaker_skipped: int = 0
+    poll_seconds: List[float] = field(default_factory=list)
+    lock_seconds: List[float] = field(default_factory=list)
+
+
+class CollectorEngine:
+    """
+    Collector multi-dispositivo de larga duración sobre asyncio.
+
+    Cada dispositivo tiene su propio timer (una task por IP, sin hilo por
+    dispositivo) y nunca se traslapa consigo mismo. poll_once (bloqueante:
+    pyzk + pyodbc) corre en un pool de `max_concurrency` hilos; un semáforo
+    global con el mismo tamaño limita cuántos polls pegan al SQL Server a la vez.
+
+    Si un poll excede `deadline_seconds` se reporta como atrasado; su slot
+    sigue ocupado hasta que termine (un hilo no se puede cancelar), pero los
+    demás dispositivos siguen su propio calendario.
+
+    Cada dispositivo pasa por su circuit breaker (health.BreakerRegistry):
+    si no hay sesión viva en SESSIONS o el breaker está half_open, antes del
+    poll se hace un probe TCP/UDP de `probe_timeout` segundos, así un checador
+    apagado falla en segundos en vez de agotar los reintentos de poll_once, y
+    con el breaker abierto ni siquiera ocupa un slot. Con la sesión viva y el
+    breaker cerrado no se hace probe: el probe UDP es un CMD_CONNECT +
+    CMD_EXIT, un handshake extra en cada poll.
+
+    Con `pipeline` (IngestPipeline) el slot solo cubre la descarga: el reloj
+    se libera en cuanto los logs están en memoria y la escritura a la DB corre
+    en los writers del pipeline, que agrupan varias descargas por transacción.
+    El dispositivo espera su ingesta antes de su
+    siguiente poll, así que tampoco se traslapa consigo mismo.
+
+    `max_cycles` limita los polls por dispositivo (benchmarks, corridas de una
+    sola vuelta); sin él corre hasta stop().
+    """
+
+    def __init__(
+        self,
+        engine,
+        targets: List[DeviceTarget],
+        *,
+        max_concurrency: int = 6,
+        deadline_seconds: Optional[float] = None,
+        report_interval_seconds: int = 300,
+        poll_fn: Callable[..., PollResult] = poll_once,
+        breakers: Optional[BreakerRegistry] = None,
+        probe_timeout: float = 2.0,
+        pipeline: Optional[IngestPipeline] = None,
+        max_cycles: Optional[int] = None,
+    ):
+        self._engine = engine
+        self._targets = list(targets)
+        self._max_concurrency = max(1, int(max_concurrency))
+        self._deadline = deadline_seconds
+        self._report_interval = max(1, int(report_interval_seconds))
+        self._poll_fn = poll_fn
+        self._breakers = breakers or BREAKERS
+        self._probe_timeout = probe_timeout
+        self._pipeline = pipeline
+        self._max_cycles = max_cycles
+        self._stats = _CycleStats()
+        # acumulado desde run() (el de _stats se reinicia en cada Resumen)
+        self.totals = _CycleStats()
+        self._stopping: Optional[asyncio.Event] = None
+
+    async def run(self) -> None:
+        self._stopping = asyncio.Event()
+        slots = asyncio.Semaphore(self._max_concurrency)
+        executor = ThreadPoolExecutor(max_workers=self._max_concurrency, thread_name_prefix="mb160")
+        log.info(
+            "Collector engine iniciado | devices=%d | concurrency=%d | deadline=%ss | pipeline=%s",
+            len(self._targets), self._max_concurrency, self._deadline, self._pipeline is not None,
+        )
+        try:
+            report = asyncio.create_task(self._report_loop(), name="mb160-report")
+            await asyncio.gather(*[
+                asyncio.create_task(self._device_loop(t, idx, slots, executor), name=f"mb160-{t.key}")
+                for idx, t in enumerate(self._targets)
+            ])
+            # solo se llega aquí con stop() o al cumplir max_cycles
+            self.stop()
+            await report
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self) -> None:
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Duerme hasta `seconds` o hasta stop(). Regresa True si hay que salir."""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=max(0.0, seconds))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _device_loop(self, target: DeviceTarget, idx: int, slots: asyncio.Semaphore, executor) -> None:
+        loop = asyncio.get_running_loop()
+
+        # escalona el arranque para no pegarle a todos los relojes en el mismo segundo
+        offset = target.interval_seconds * idx / max(1, len(self._targets))
+        if await self._sleep(offset):
+            return
+
+        next_run = time.monotonic()
+        cycles = 0
+        while not self._stopping.is_set():
+            if not self._breakers.allow(target.key):
+                self._stats.breaker_skipped += 1
+            else:
+                async with slots:
+                    started = time.monotonic()
+                    future = loop.run_in_executor(executor, self._probe_and_poll, target)
+                    done, _ = await asyncio.wait({future}, timeout=self._deadline)
+                    if not done:
+                        self._stats.overdue += 1
+                        log.warning(
+                            "Poll excede deadline | ip=%s | deadline=%ss | esperando a que termine",
+                            target.key, self._deadline,
+                        )
+                        await asyncio.wait({future})
+                if self._pipeline is not None and not future.exception():
+                    # el slot ya se liberó; aquí solo se espera a los writers
+                    future = asyncio.wrap_future(future.result())
+                    await asyncio.wait({future})
+                self._record(target, future, time.monotonic() - started)
+
+            cycles += 1
+            if self._max_cycles is not None and cycles >= self._max_cycles:
+                return
+
+            next_run += target.interval_seconds
+            now = time.monotonic()
+            if next_run < now:
+                # se atrasó más de un intervalo: no acumulamos polls pendientes
+                next_run = now
+            if await self._sleep(next_run - now):
+                return
+
+    def _probe_and_poll(self, target: DeviceTarget):
+        """
+        PollResult, o con pipeline el Future de la ingesta. submit() corre aquí
+        (dentro del slot) para que una cola llena frene a los downloaders.
+        """
+        probe = (
+            self._breakers.get(target.key).state == HALF_OPEN
+            or not SESSIONS.has_session(target.ip, target.port)
+        )
+        if probe and not probe_device(target.ip, target.port, self._probe_timeout):
+            raise _Unreachable(f"sin respuesta TCP/UDP en {self._probe_timeout}s")
+        if self._pipeline is not None:
+            return self._pipeline.submit(download_once(device_ip=target.ip, device_port=target.port))
+        return self._poll_fn(self._engine, device_ip=target.ip, device_port=target.port)
+
+    def _record(self, target: DeviceTarget, future, elapsed: float) -> None:
+        result: Optional[PollResult] = None
+        outcome = "errors"
+        try:
+            result = future.result()
+            outcome = "polled"
+            self._breakers.record_success(target.key)
+        except (ZKNetworkError, _Unreachable, TimeoutError) as e:
+            # sólo red del reloj (TimeoutError = socket.timeout): un OSError del
+            # spool, del disco o del driver de la DB no es culpa del dispositivo
+            outcome = "offline"
+            log.warning("Device offline | ip=%s | %s", target.key, e)
+            self._breakers.record_failure(target.key, f"{type(e).__name__}: {e}")
+        except ZKErrorResponse as e:
+            # el reloj contestó: está vivo aunque el comando haya fallado
+            log.error("Device error | ip=%s | %s", target.key, e)
+            self._breakers.record_success(target.key)
+        except Exception as e:
+            log.error("Pull failed | ip=%s | %s: %s", target.key, type(e).__name__, e)
+
+        for stats in (self._stats, self.totals):
+            stats.poll_seconds.append(elapsed)
+            setattr(stats, outcome, getattr(stats, outcome) + 1)
+            if result is not None:
+                stats.inserted += result.inserted
+                if result.skipped:
+                    stats.skipped += 1
+                else:
+                    stats.lock_seconds.append(result.lock_seconds)
+
+    async def _report_loop(self) -> None:
+        while not await self._sleep(self._report_interval):
+            stats, self._stats = self._stats, _CycleStats()
+            skip_ratio = (stats.skipped / stats.polled) if stats.polled else 0.0
+            slowest = max(stats.poll_seconds, default=0.0)
+            lock_max = max(stats.lock_seconds, default=0.0)
+            lock_avg = (sum(stats.lock_seconds) / len(stats.lock_seconds)) if stats.lock_seconds else 0.0
+            open_breakers = sum(1 for b in self._breakers.snapshot().values() if b["state"] != CLOSED)
+            sessions = SESSIONS.stats()
+            log.info(
+                "Resumen | polled=%d | sin_cambios=%d (%.0f%%) | inserted=%d | offline=%d | errors=%d | "
+                "atrasados=%d | breaker_skip=%d | breakers_abiertos=%d | poll_max=%.1fs | "
+                "lock_avg=%.2fs lock_max=%.2fs | "
+                "sesiones=%d reuse=%d connects=%d connect_avg=%.2fs ahorro=%.1fs",
+                stats.polled, stats.skipped, skip_ratio * 100, stats.inserted,
+                stats.offline, stats.errors, stats.overdue, stats.breaker_skipped, open_breakers, slowest,
+                lock_avg, lock_max,
+                sessions["open_sessions"], sessions["reuses"], sessions["connects"],
+                sessions["avg_connect_seconds"], sessions["saved_seconds"],
+            )
+            phases = PHASE_METRICS.snapshot(reset=True)
+            if phases:
+                log.info("Fases | %s", " | ".join(
+                    f"{phase} n={m['count']} avg={m['avg_seconds']:.2f}s max={m['max_seconds']:.2f}s "
+                    f"total={m['seconds']:.1f}s reintentos={m['retries']} fallas={m['failures']}"
+                    for phase, m in ((p, phases[p]) for p in PHASES if p in phases)
+                ))
+            if self._pipeline is not None:
+                writer = self._pipeline.stats()
+                log.info(
+                    "Writer | txns=%d | filas=%d (%.0f/txn) | %.0f filas/s | cola=%d max=%d | backpressure=%.1fs | "
+                    "spooled=%d",
+                    writer["transactions"], writer["rows_written"], writer["rows_per_txn"],
+                    writer["rows_per_second"], writer["queue_depth"], writer["max_queue_depth"],
+                    writer["blocked_seconds"], writer["spooled"],
+                )
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+from mb160_service.config import get_device_settings
+from mb160_service.utils.zkproto import CMD_CONNECT, CMD_EXIT, USHRT_MAX, pack_packet, unpack_header
+
+log = logging.getLogger("mb160.health")
+
+device_settings = get_device_settings()
+
+CLOSED = "closed"        # sano: se hace poll normal
+OPEN = "open"            # caído: se salta sin tocar la red hasta next_probe_at
+HALF_OPEN = "half_open"  # cooldown vencido: un probe + poll de prueba
+
+
+def probe_tcp(ip: str, port: int, timeout: float = 2.0) -> bool:
+    """Solo abre y cierra el socket TCP: 1 round-trip, sin sesión ZK."""
+    try:
+        with socket.create_connection((ip, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def probe_udp(ip: str, port: int, timeout: float = 2.0) -> bool:
+    """CMD_CONNECT por UDP; si contesta, cierra la sesión con CMD_EXIT."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    try:
+        sock.sendto(pack_packet(CMD_CONNECT, 0, USHRT_MAX - 1), (ip, port))
+        data = sock.recv(1024)
+        if len(data) < 8:
+            return False
+        _cmd, _chk, session_id, reply_id = unpack_header(data)
+        try:
+            sock.sendto(pack_packet(CMD_EXIT, session_id, reply_id), (ip, port))
+        except OSError:
+            pass
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def probe_device(ip: str, port: int, timeout: float = 2.0) -> bool:
+    return probe_tcp(ip, port, timeout) or probe_udp(ip, port, timeout)
+
+
+@dataclass
+class DeviceBreaker:
+    ip: str
+    state: str = CLOSED
+    failures: int = 0
+    opened_count: int = 0
+    next_probe_at: float = 0.0  # time.monotonic()
+    last_error: Optional[str] = None
+    last_change: Optional[datetime] = None
+    last_success: Optional[datetime] = None
+
+
+class BreakerRegistry:
+    """
+    Circuit breaker por IP de checador.
+
+    closed --(failure_threshold fallas seguidas)--> open
+    open --(vence cooldown)--> half_open --(poll OK)--> closed
+                                         \\--(falla)--> open (cooldown x2, hasta max)
+
+    El estado se publica en `state_file` (JSON) para que la API lo exponga.
+    """
+
+    def __init__(
+        self,
+        *,
+        failure_threshold: int = 3,
+        cooldown_seconds: int = 60,
+        max_cooldown_seconds: int = 900,
+        state_file: Optional[str] = None,
+    ):
+        self._threshold = max(1, int(failure_threshold))
+        self._cooldown = max(1, int(cooldown_seconds))
+        self._max_cooldown = max(self._cooldown, int(max_cooldown_seconds))
+        self._state_file = state_file or None
+        self._lock = threading.Lock()
+        self._items: Dict[str, DeviceBreaker] = {}
+
+    def get(self, ip: str) -> DeviceBreaker:
+        with self._lock:
+            return self._items.setdefault(ip, DeviceBreaker(ip=ip))
+
+    def allow(self, ip: str) -> bool:
+        """
+        True si toca intentar el dispositivo. Un breaker abierto con el
+        cooldown vencido pasa a half_open y deja pasar un intento.
+        """
+        with self._lock:
+            br = self._items.setdefault(ip, DeviceBreaker(ip=ip))
+            if br.state == OPEN:
+                if time.monotonic() < br.next_probe_at:
+                    return False
+                self._transition(br, HALF_OPEN)
+            return True
+
+    def record_success(self, ip: str) -> None:
+        with self._lock:
+            br = self._items.setdefault(ip, DeviceBreaker(ip=ip))
+            br.failures = 0
+            br.last_error = None
+            br.last_success = datetime.now()
+            if br.state != CLOSED:
+                br.opened_count = 0
+                self._transition(br, CLOSED)
+
+    def record_failure(self, ip: str, error: str) -> None:
+        with self._lock:
+            br = self._items.setdefault(ip, DeviceBreaker(ip=ip))
+            br.failures += 1
+            br.last_error = error[:500]
+            if br.state == HALF_OPEN or br.failures >= self._threshold:
+                cooldown = min(self._max_cooldown, self._cooldown * (2 ** br.opened_count))
+                br.opened_count += 1
+                br.next_probe_at = time.monotonic() + cooldown
+                self._transition(br, OPEN, cooldown)
+
+    def _transition(self, br: DeviceBreaker, state: str, cooldown: Optional[int] = None) -> None:
+        prev, br.state = br.state, state
+        br.last_change = datetime.now()
+        if state == OPEN:
+            log.warning(
+                "Breaker abierto | ip=%s | failures=%d | reintento_en=%ss | error=%s",
+                br.ip, br.failures, cooldown, br.last_error,
+            )
+        else:
+            log.info("Breaker %s -> %s | ip=%s", prev, state, br.ip)
+        self._persist()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            ip: {
+                "state": br.state,
+                "failures": br.failures,
+                "retry_in_seconds": max(0, int(br.next_probe_at - now)) if br.state == OPEN else 0,
+                "last_error": br.last_error,
+                "last_change": br.last_change.isoformat() if br.last_change else None,
+                "last_success": br.last_success.isoformat() if br.last_success else None,
+            }
+            for ip, br in self._items.items()
+        }
+
+    def _persist(self) -> None:
+        if not self._state_file:
+            return
+        try:
+            folder = os.path.dirname(self._state_file)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            payload = {"updated_at": datetime.now().isoformat(), "devices": self._snapshot()}
+            tmp = f"{self._state_file}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(payload, fh, indent=2, sort_keys=True)
+            os.replace(tmp, self._state_file)
+        except OSError as e:
+            log.warning("No se pudo guardar estado de breakers (%s). Error=%s", self._state_file, e)
+
+
+def read_health_file(path: Optional[str] = None) -> Dict[str, Any]:
+    """Lee el estado publicado por el collector (para la API)."""
+    path = path or device_settings.device_health_file
+    if not path or not os.path.exists(path):
+        return {"updated_at": None, "devices": {}}
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+BREAKERS = BreakerRegistry(
+    failure_threshold=device_settings.breaker_failure_threshold,
+    cooldown_seconds=device_settings.breaker_cooldown_seconds,
+    max_cooldown_seconds=device_settings.breaker_max_cooldown_seconds,
+    state_file=device_settings.device_health_file,
+)
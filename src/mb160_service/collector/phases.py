@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_exponential
+
+from mb160_service.config import get_device_settings
+
+log = logging.getLogger("mb160.collector.phases")
+
+device_settings = get_device_settings()
+
+T = TypeVar("T")
+
+# Fases de un poll, en orden
+CONNECT = "connect"
+USERS = "users"
+ATTENDANCE = "attendance"
+PERSIST = "persist"
+PHASES = (CONNECT, USERS, ATTENDANCE, PERSIST)
+
+
+@dataclass(frozen=True)
+class PhasePolicy:
+    """Presupuesto de reintentos de una fase (attempts incluye el primer intento)."""
+    attempts: int = 3
+    wait_min: float = 1.0
+    wait_max: float = 30.0
+
+
+# presupuestos por fase (POLL_RETRY_*); persist reintenta solo la transacción con las filas en memoria
+POLICIES: Dict[str, PhasePolicy] = {
+    CONNECT: PhasePolicy(attempts=device_settings.poll_retry_connect, wait_max=device_settings.poll_retry_max_wait_seconds),
+    USERS: PhasePolicy(attempts=device_settings.poll_retry_users, wait_max=device_settings.poll_retry_max_wait_seconds),
+    ATTENDANCE: PhasePolicy(
+        attempts=device_settings.poll_retry_attendance, wait_max=device_settings.poll_retry_max_wait_seconds
+    ),
+    PERSIST: PhasePolicy(
+        attempts=device_settings.poll_retry_persist, wait_min=2.0, wait_max=device_settings.poll_retry_max_wait_seconds
+    ),
+}
+
+
+@dataclass
+class PhaseTimings:
+    """Tiempo (incluye esperas entre reintentos) e intentos por fase de un poll."""
+    seconds: Dict[str, float] = field(default_factory=dict)
+    attempts: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, phase: str, seconds: float, attempts: int) -> None:
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.attempts[phase] = self.attempts.get(phase, 0) + attempts
+
+    @property
+    def retries(self) -> int:
+        return sum(max(0, n - 1) for n in self.attempts.values())
+
+    def describe(self) -> str:
+        return " ".join(
+            f"{phase}={self.seconds[phase]:.2f}s" + (f"x{self.attempts[phase]}" if self.attempts.get(phase, 1) > 1 else "")
+            for phase in PHASES if phase in self.seconds
+        )
+
+
+class PhaseMetrics:
+    """Acumulado por fase del proceso (count, segundos, reintentos, fallas)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items: Dict[str, Dict[str, float]] = {}
+
+    def record(self, phase: str, seconds: float, attempts: int, ok: bool) -> None:
+        with self._lock:
+            item = self._items.setdefault(phase, {"count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                                  "retries": 0, "failures": 0})
+            item["count"] += 1
+            item["seconds"] += seconds
+            item["max_seconds"] = max(item["max_seconds"], seconds)
+            item["retries"] += max(0, attempts - 1)
+            if not ok:
+                item["failures"] += 1
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            items = {phase: dict(item) for phase, item in self._items.items()}
+            if reset:
+                self._items = {}
+        for item in items.values():
+            item["avg_seconds"] = item["seconds"] / item["count"] if item["count"] else 0.0
+        return items
+
+
+PHASE_METRICS = PhaseMetrics()
+
+
+def run_phase(
+    phase: str,
+    fn: Callable[[], T],
+    *,
+    retry_on: Callable[[BaseException], bool],
+    timings: Optional[PhaseTimings] = None,
+    policy: Optional[PhasePolicy] = None,
+    before_retry: Optional[Callable[[], None]] = None,
+    label: str = "",
+) -> T:
+    """
+    Corre fn() con el presupuesto de `phase`. Solo reintenta los errores que
+    acepta `retry_on`; before_retry() (p.ej. reconectar el reloj) corre antes
+    de cada reintento. El tiempo total y los intentos quedan en `timings` y
+    en PHASE_METRICS.
+    """
+    policy = policy or POLICIES[phase]
+    attempts = 0
+
+    def _before_sleep(state) -> None:
+        log.warning(
+            "Reintento de fase | %s | fase=%s | intento=%d/%d | %s: %s",
+            label, phase, state.attempt_number, policy.attempts,
+            type(state.outcome.exception()).__name__, state.outcome.exception(),
+        )
+
+    started = time.monotonic()
+    ok = False
+    try:
+        for attempt in Retrying(
+            stop=stop_after_attempt(max(1, policy.attempts)),
+            wait=wait_exponential(multiplier=1, min=policy.wait_min, max=policy.wait_max),
+            retry=retry_if_exception(retry_on),
+            before_sleep=_before_sleep,
+            reraise=True,
+        ):
+            with attempt:
+                attempts += 1
+                if attempts > 1 and before_retry is not None:
+                    before_retry()
+                result = fn()
+        ok = True
+        return result
+    finally:
+        elapsed = time.monotonic() - started
+        if timings is not None:
+            timings.add(phase, elapsed, attempts)
+        PHASE_METRICS.record(phase, elapsed, attempts, ok)
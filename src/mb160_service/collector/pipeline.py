@@ -0,0 +1,256 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from mb160_service.collector.checkpoint import CheckpointStore
+from mb160_service.collector.poller import (
+    INSERT_BATCH_SIZE,
+    SPOOL,
+    DeviceDownload,
+    PollResult,
+    PreparedIngest,
+    finish_ingest,
+    insert_rows,
+    prepare_ingest,
+)
+from mb160_service.collector.phases import PERSIST, PhaseTimings, run_phase
+from mb160_service.collector.spool import DB_UNAVAILABLE, Spool
+from mb160_service.collector.watermark import ingest_transaction
+
+log = logging.getLogger("mb160.collector.pipeline")
+
+_STOP = object()
+
+_Item = Tuple[PreparedIngest, "Future[PollResult]"]
+
+
+class IngestPipeline:
+    """
+    Etapa de escritura compartida por todos los downloaders.
+
+    Los downloaders (download_once) sueltan el reloj en cuanto tienen los logs
+    en memoria; submit() filtra/normaliza en el hilo del downloader y encola
+    las filas. `writers` hilos (default 1) sacan de la cola todo lo que haya
+    hasta `coalesce_rows` filas y lo escriben en una sola transacción, así N
+    dispositivos no abren N transacciones contra dbo.AsistenciaMarcaje y la
+    cola del trigger de dispatch.
+
+    La cola es acotada (`max_pending` descargas): si la DB se atrasa, submit()
+    bloquea al downloader (backpressure) en vez de acumular memoria.
+
+    Cada transacción (agrupada o por descarga) corre en la fase persist con
+    el mismo presupuesto que el poll en serie (POLL_RETRY_PERSIST): un
+    parpadeo de la DB se reintenta antes de mandar nada al spool. Si la
+    transacción agrupada falla por otra cosa, cada descarga se reintenta sola
+    en su propia transacción para que un dispositivo no tumbe a los demás.
+
+    Con spool (default SPOOL) submit() guarda las filas en el spool local
+    antes de encolarlas; si la DB no está disponible la descarga se resuelve
+    como `spooled` y el SpoolDrainer la reenvía después.
+    """
+
+    def __init__(
+        self,
+        engine,
+        *,
+        writers: int = 1,
+        max_pending: int = 32,
+        coalesce_rows: int = INSERT_BATCH_SIZE * 10,
+        batch_size: Optional[int] = None,
+        checkpoints: Optional[CheckpointStore] = None,
+        spool: Optional[Spool] = None,
+    ):
+        self._engine = engine
+        self._spool = spool or SPOOL
+        self._writers = max(1, int(writers))
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(max_pending)))
+        self._coalesce_rows = max(1, int(coalesce_rows))
+        self._batch_size = batch_size
+        self._checkpoints = checkpoints
+        self._threads: List[threading.Thread] = []
+
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._transactions = 0
+        self._rows_written = 0
+        self._inserted = 0
+        self._spooled = 0
+        self._write_seconds = 0.0
+        self._blocked_seconds = 0.0
+        self._max_depth = 0
+        self._started_at = time.monotonic()
+
+    def start(self) -> "IngestPipeline":
+        if self._threads:
+            return self
+        self._started_at = time.monotonic()
+        for idx in range(self._writers):
+            th = threading.Thread(target=self._writer_loop, name=f"mb160-writer-{idx}", daemon=True)
+            th.start()
+            self._threads.append(th)
+        return self
+
+    def submit(self, download: DeviceDownload) -> "Future[PollResult]":
+        """
+        Encola la descarga; el Future se resuelve con el PollResult una vez
+        confirmada la transacción que la contiene.
+        """
+        future: "Future[PollResult]" = Future()
+        try:
+            prepared = prepare_ingest(self._engine, download, checkpoints=self._checkpoints, spool=self._spool)
+            if self._spool is not None:
+                self._spool.append(prepared.rows)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+
+        if not prepared.rows:
+            # nada que escribir (sin cambios o todo ya ingerido): no pasa por la cola
+            future.set_result(finish_ingest(prepared, 0, 0, checkpoints=self._checkpoints))
+            return future
+
+        if not self._threads:
+            raise RuntimeError("IngestPipeline no iniciado (falta start())")
+
+        started = time.monotonic()
+        self._queue.put((prepared, future))
+        blocked = time.monotonic() - started
+        with self._lock:
+            self._submitted += 1
+            self._blocked_seconds += blocked
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+        return future
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Drena lo encolado y detiene los writers."""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for th in self._threads:
+            th.join(timeout)
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Acumulados desde start(): descargas encoladas, transacciones, filas
+        escritas (insertadas + duplicadas), filas/s de escritura, profundidad
+        actual/máxima de la cola y tiempo que los downloaders esperaron por
+        backpressure.
+        """
+        with self._lock:
+            return {
+                "submitted": self._submitted,
+                "transactions": self._transactions,
+                "rows_written": self._rows_written,
+                "inserted": self._inserted,
+                "spooled": self._spooled,
+                "rows_per_txn": (self._rows_written / self._transactions) if self._transactions else 0.0,
+                "rows_per_second": (self._rows_written / self._write_seconds) if self._write_seconds else 0.0,
+                "write_seconds": self._write_seconds,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_depth,
+                "blocked_seconds": self._blocked_seconds,
+                "uptime_seconds": time.monotonic() - self._started_at,
+            }
+
+    def _take_batch(self, first: _Item) -> Tuple[List[_Item], bool]:
+        """Junta lo que ya esté en la cola hasta coalesce_rows filas."""
+        batch = [first]
+        rows = len(first[0].rows)
+        while rows < self._coalesce_rows:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            rows += len(item[0].rows)
+        return batch, False
+
+    def _writer_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch, stop = self._take_batch(item)
+            batch = [(p, f) for p, f in batch if f.set_running_or_notify_cancel()]
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[_Item]) -> None:
+        started = time.monotonic()
+        timings = PhaseTimings()
+
+        def _persist() -> List[Tuple[int, int]]:
+            with ingest_transaction(self._engine) as dbconn:
+                return [
+                    insert_rows(dbconn, prepared.rows, batch_size=self._batch_size)
+                    for prepared, _ in batch
+                ]
+
+        try:
+            # fase persist: se reintenta solo la transacción, las filas siguen en memoria
+            counts = run_phase(
+                PERSIST,
+                _persist,
+                retry_on=lambda e: isinstance(e, DB_UNAVAILABLE),
+                timings=timings,
+                label=f"pipeline descargas={len(batch)}",
+            )
+        except Exception as e:
+            if len(batch) == 1 or isinstance(e, DB_UNAVAILABLE):
+                # la DB siguió caída todo el presupuesto: reintentar por dispositivo solo
+                # multiplicaría la espera; con spool todo se queda ahí
+                for item in batch:
+                    self._fail(item, e)
+                return
+            log.warning(
+                "Transacción agrupada falló (%d descargas), se reintenta por dispositivo | %s: %s",
+                len(batch), type(e).__name__, e,
+            )
+            for item in batch:
+                self._write([item])
+            return
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._transactions += 1
+            self._write_seconds += elapsed
+            self._rows_written += sum(ok + dup for ok, dup in counts)
+            self._inserted += sum(ok for ok, _ in counts)
+
+        for (prepared, future), (inserted, dup_skipped) in zip(batch, counts):
+            prepared.download.phases.add(PERSIST, elapsed, timings.attempts.get(PERSIST, 1))
+            try:
+                if self._spool is not None:
+                    self._spool.discard(prepared.rows)
+                future.set_result(finish_ingest(prepared, inserted, dup_skipped, checkpoints=self._checkpoints))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _fail(self, item: _Item, error: BaseException) -> None:
+        prepared, future = item
+        if self._spool is not None and isinstance(error, DB_UNAVAILABLE):
+            # las filas ya están en el spool: el poll cuenta como hecho
+            with self._lock:
+                self._spooled += len(prepared.rows)
+            try:
+                future.set_result(finish_ingest(
+                    prepared, 0, 0, checkpoints=self._checkpoints, spooled=len(prepared.rows)
+                ))
+            except Exception as e:
+                future.set_exception(e)
+            return
+        log.error(
+            "Ingesta falló | device=%s | ip=%s | %s: %s",
+            prepared.download.device_serial, prepared.download.device_ip, type(error).__name__, error,
+        )
+        future.set_exception(error)
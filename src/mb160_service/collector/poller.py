@@ -1,13 +1,23 @@
 import time
 import logging
+from dataclasses import dataclass, field, replace
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Callable, Dict, Any, List, Set, Tuple
 
-from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
-
-from sqlalchemy import text
-from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy import DateTime, text
+from sqlalchemy.exc import IntegrityError
 
+from mb160_service.collector.attendance_stream import read_attendance, read_attendance_dump
+from mb160_service.collector.batch import AttendanceBatch
+from mb160_service.collector.checkpoint import CheckpointStore
+from mb160_service.collector.dump_cache import DumpCache, DumpMissing
+from mb160_service.collector.phases import ATTENDANCE, PERSIST, USERS, PhaseTimings, run_phase
+from mb160_service.collector.rollup import refresh_after_insert
+from mb160_service.collector.sessions import SESSIONS, DeviceSession, DeviceSessionPool, is_session_error
+from mb160_service.collector.spool import DB_UNAVAILABLE, Spool, SpoolDrainer, drain_all
+from mb160_service.collector.user_cache import USER_MAPS, UserMapCache
+from mb160_service.collector.watermark import ingest_transaction, note_ingested
+from mb160_service.collector.window import TimeWindow
 from mb160_service.config import get_device_settings
 from mb160_service.db import build_engine
 
@@ -18,6 +28,45 @@ device_settings = get_device_settings()
 MB160_IP = device_settings.ip
 MB160_PORT = device_settings.port
 PULL_INTERVAL_SECONDS = device_settings.pull_interval_seconds
+INSERT_BATCH_SIZE = device_settings.insert_batch_size
+DAILY_ROLLUP = device_settings.daily_rollup
+
+# watermark por dispositivo compartido por todos los polls del proceso
+CHECKPOINTS = CheckpointStore(device_settings.checkpoint_file)
+
+# write-ahead local de marcajes descargados (SPOOL_FILE vacío = sin spool)
+SPOOL: Optional[Spool] = Spool(device_settings.spool_file) if device_settings.spool_file else None
+
+# dumps crudos del log por (serial, registros) para backfills (DUMP_CACHE_DIR vacío = sin cache)
+DUMP_CACHE: Optional[DumpCache] = (
+    DumpCache(device_settings.dump_cache_dir, device_settings.dump_cache_max_mb * 2**20)
+    if device_settings.dump_cache_dir else None
+)
+
+_INSERT_SQL = text("""
+    INSERT INTO dbo.AsistenciaMarcaje
+    (DispositivoSerial, DispositivoIP, UsuarioDispositivo, UsuarioNombre,
+     EventoFechaHora, Punch, Estado, WorkCode)
+    VALUES
+    (:DispositivoSerial, :DispositivoIP, :UsuarioDispositivo, :UsuarioNombre,
+     :EventoFechaHora, :Punch, :Estado, :WorkCode)
+""")
+
+# Llave de UQ_AsistenciaMarcaje_Dedupe sin el serial (el serial es fijo por poll)
+MarkKey = Tuple[str, datetime, int, int]
+
+
+@dataclass
+class PollResult:
+    device_serial: str
+    device_ip: str
+    logs: int = 0
+    inserted: int = 0
+    dup_skipped: int = 0
+    skipped: bool = False  # el conteo de registros no cambió, no se descargó nada
+    lock_seconds: float = 0.0  # tiempo con el reloj en disable_device()
+    spooled: int = 0  # filas que se quedaron en el spool (DB no disponible)
+    phases: PhaseTimings = field(default_factory=PhaseTimings)  # segundos/intentos por fase
 
 
 def _get_last_ts(dbconn, device_serial: str) -> Optional[datetime]:
@@ -25,13 +74,12 @@ def _get_last_ts(dbconn, device_serial: str) -> Optional[datetime]:
         SELECT MAX(EventoFechaHora) AS MaxTs
         FROM dbo.AsistenciaMarcaje
         WHERE DispositivoSerial = :DeviceSerial
-    """)
+    """).columns(MaxTs=DateTime)
     row = dbconn.execute(q, {"DeviceSerial": device_serial}).mappings().first()
     return row["MaxTs"] if row and row["MaxTs"] is not None else None
 
 
-def _insert_mark(
-    dbconn,
+def _mark_params(
     *,
     device_serial: str,
     device_ip: str,
@@ -41,16 +89,8 @@ def _insert_mark(
     punch: int,
     estado: int,
     workcode: Optional[int],
-) -> None:
-    ins = text("""
-        INSERT INTO dbo.AsistenciaMarcaje
-        (DispositivoSerial, DispositivoIP, UsuarioDispositivo, UsuarioNombre,
-         EventoFechaHora, Punch, Estado, WorkCode)
-        VALUES
-        (:DispositivoSerial, :DispositivoIP, :UsuarioDispositivo, :UsuarioNombre,
-         :EventoFechaHora, :Punch, :Estado, :WorkCode)
-    """)
-    dbconn.execute(ins, {
+) -> Dict[str, Any]:
+    return {
         "DispositivoSerial": device_serial,
         "DispositivoIP": device_ip,
         "UsuarioDispositivo": str(user_id),
@@ -59,7 +99,276 @@ def _insert_mark(
         "Punch": int(punch or 0),
         "Estado": int(estado or 0),
         "WorkCode": workcode,
-    })
+    }
+
+
+def _mark_key(row: Dict[str, Any]) -> MarkKey:
+    return (row["UsuarioDispositivo"], row["EventoFechaHora"], row["Punch"], row["Estado"])
+
+
+def _select_logs(
+    logs,
+    *,
+    device_serial: str,
+    device_ip: str,
+    min_ts: Optional[datetime],
+    max_ts: Optional[datetime],
+    last_ts: Optional[datetime],
+) -> Tuple[AttendanceBatch, int]:
+    """
+    Aplica los filtros de ventana/incremental sobre el batch (o sobre logs de
+    pyzk, que se pasan a AttendanceBatch), lo ordena por fecha y quita las
+    llaves repetidas. Regresa (batch, duplicados quitados).
+    """
+    batch = logs if isinstance(logs, AttendanceBatch) else AttendanceBatch.from_records(
+        logs, device_serial=device_serial, device_ip=device_ip
+    )
+    batch.device_serial = device_serial
+    batch.device_ip = device_ip
+    # incremental: last_ts es el watermark (ts > last_ts); la ventana se corta por bisección
+    batch = batch.select(min_ts=min_ts, max_ts=max_ts, after_ts=last_ts)
+    # ordenado, cada batch de insert_rows consulta un rango de fechas angosto
+    return batch.sort().dedupe()
+
+
+def _filter_logs(
+    logs,
+    *,
+    device_serial: str,
+    device_ip: str,
+    user_map: Dict[str, str],
+    min_ts: Optional[datetime],
+    max_ts: Optional[datetime],
+    last_ts: Optional[datetime],
+) -> List[Dict[str, Any]]:
+    """
+    Aplica los filtros de ventana/incremental y normaliza cada log a los
+    parámetros del INSERT.
+    """
+    batch, _dups = _select_logs(
+        logs, device_serial=device_serial, device_ip=device_ip, min_ts=min_ts, max_ts=max_ts, last_ts=last_ts,
+    )
+    return batch.to_params(user_map)
+
+
+def _insert_rows_one_by_one(dbconn, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Modo legacy: un INSERT por marcaje, el UNIQUE decide qué es duplicado.
+    Regresa (filas insertadas, dup_skipped).
+    """
+    inserted: List[Dict[str, Any]] = []
+    dup_skipped = 0
+    for row in rows:
+        try:
+            dbconn.execute(_INSERT_SQL, row)
+            inserted.append(row)
+        except IntegrityError:
+            dup_skipped += 1
+    return inserted, dup_skipped
+
+
+def _existing_keys(dbconn, device_serial: str, ts_from: datetime, ts_to: datetime) -> Set[MarkKey]:
+    q = text("""
+        SELECT UsuarioDispositivo, EventoFechaHora, Punch, Estado
+        FROM dbo.AsistenciaMarcaje
+        WHERE DispositivoSerial = :DeviceSerial
+          AND EventoFechaHora >= :TsFrom
+          AND EventoFechaHora <= :TsTo
+    """).columns(EventoFechaHora=DateTime)
+    rows = dbconn.execute(q, {"DeviceSerial": device_serial, "TsFrom": ts_from, "TsTo": ts_to})
+    return {(str(r[0]), r[1], int(r[2]), int(r[3])) for r in rows}
+
+
+def _insert_rows_batched(dbconn, rows: List[Dict[str, Any]], batch_size: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Inserta en batches: por batch hace 1 SELECT de las llaves existentes en su
+    rango de fechas y 1 executemany con las nuevas (fast_executemany en pyodbc),
+    así el trigger de dispatch corre una vez por batch y no por fila.
+
+    Si otro proceso insertó entre el SELECT y el INSERT (IntegrityError), el batch
+    se reintenta fila por fila dentro de un savepoint para no perder el conteo.
+    Regresa (filas insertadas, dup_skipped).
+    """
+    inserted: List[Dict[str, Any]] = []
+    dup_skipped = 0
+
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        device_serial = chunk[0]["DispositivoSerial"]
+        stamps = [r["EventoFechaHora"] for r in chunk]
+        existing = _existing_keys(dbconn, device_serial, min(stamps), max(stamps))
+
+        pending: List[Dict[str, Any]] = []
+        for row in chunk:
+            key = _mark_key(row)
+            if key in existing:
+                dup_skipped += 1
+                continue
+            existing.add(key)  # dedupe dentro del mismo batch
+            pending.append(row)
+
+        if not pending:
+            continue
+
+        try:
+            with dbconn.begin_nested():
+                dbconn.execute(_INSERT_SQL, pending)
+            inserted.extend(pending)
+        except IntegrityError:
+            ok, dup = _insert_rows_one_by_one(dbconn, pending)
+            inserted.extend(ok)
+            dup_skipped += dup
+
+    return inserted, dup_skipped
+
+
+def _staging_table(dbconn) -> str:
+    # SQL Server: tabla temporal de la sesión; SQLite (standin): schema temp
+    return "#MarcajeStaging" if dbconn.dialect.name == "mssql" else "temp.MarcajeStaging"
+
+
+def _staging_collate(dbconn) -> str:
+    # #tablas toman la collation de tempdb: si difiere de la de la DB el join
+    # contra dbo.AsistenciaMarcaje truena ("cannot resolve collation conflict")
+    return "COLLATE DATABASE_DEFAULT" if dbconn.dialect.name == "mssql" else ""
+
+
+def _merge_rows_staging(dbconn, rows: List[Dict[str, Any]], batch_size: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Modo backfill: carga toda la ventana a una tabla staging (executemany por
+    batch) y mete solo las llaves que faltan con un INSERT ... SELECT ... WHERE NOT EXISTS.
+    Pensado para re-pulls por rango donde casi todo ya existe.
+
+    Las filas nuevas salen de un SELECT de la staging con el mismo NOT EXISTS
+    justo antes del INSERT (en la misma transacción). En SQL Server el NOT
+    EXISTS lleva WITH (UPDLOCK, HOLDLOCK): el SELECT deja bloqueado el rango
+    de llaves hasta el commit y otro collector no puede meter una de esas
+    llaves entre el SELECT y el INSERT, así las filas que van al checkpoint
+    y al rollup son exactamente las insertadas. No se usa OUTPUT inserted.*:
+    SQL Server no lo permite sin INTO en una tabla con triggers.
+
+    Si el INSERT choca con otro writer (IntegrityError) se cae al modo batched.
+    Regresa (filas insertadas, dup_skipped).
+    """
+    if not rows:
+        return [], 0
+
+    # dedupe dentro de la ventana: el UNIQUE no admite la misma llave dos veces
+    unique_rows: Dict[MarkKey, Dict[str, Any]] = {}
+    for row in rows:
+        unique_rows.setdefault(_mark_key(row), row)
+    pending = list(unique_rows.values())
+
+    stg = _staging_table(dbconn)
+    collate = _staging_collate(dbconn)
+    dbconn.execute(text(f"DROP TABLE IF EXISTS {stg}"))
+    dbconn.execute(text(f"""
+        CREATE TABLE {stg} (
+            DispositivoSerial    NVARCHAR(50)  {collate} NOT NULL,
+            DispositivoIP        VARCHAR(45)   {collate} NULL,
+            UsuarioDispositivo   NVARCHAR(50)  {collate} NOT NULL,
+            UsuarioNombre        NVARCHAR(150) {collate} NULL,
+            EventoFechaHora      DATETIME2(0)  NOT NULL,
+            Punch                TINYINT       NOT NULL,
+            Estado               TINYINT       NOT NULL,
+            WorkCode             INT           NULL
+        )
+    """))
+
+    for start in range(0, len(pending), batch_size):
+        dbconn.execute(text(f"""
+            INSERT INTO {stg}
+            (DispositivoSerial, DispositivoIP, UsuarioDispositivo, UsuarioNombre,
+             EventoFechaHora, Punch, Estado, WorkCode)
+            VALUES
+            (:DispositivoSerial, :DispositivoIP, :UsuarioDispositivo, :UsuarioNombre,
+             :EventoFechaHora, :Punch, :Estado, :WorkCode)
+        """), pending[start:start + batch_size])
+
+    hold = "WITH (UPDLOCK, HOLDLOCK)" if dbconn.dialect.name == "mssql" else ""
+    missing = f"""
+        FROM {stg} s
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM dbo.AsistenciaMarcaje m {hold}
+            WHERE m.DispositivoSerial = s.DispositivoSerial
+              AND m.UsuarioDispositivo = s.UsuarioDispositivo
+              AND m.EventoFechaHora = s.EventoFechaHora
+              AND m.Punch = s.Punch
+              AND m.Estado = s.Estado
+        )
+    """
+    new_keys = text(f"""
+        SELECT s.UsuarioDispositivo, s.EventoFechaHora, s.Punch, s.Estado
+        {missing}
+    """).columns(EventoFechaHora=DateTime)
+    merge = text(f"""
+        INSERT INTO dbo.AsistenciaMarcaje
+        (DispositivoSerial, DispositivoIP, UsuarioDispositivo, UsuarioNombre,
+         EventoFechaHora, Punch, Estado, WorkCode)
+        SELECT
+            s.DispositivoSerial, s.DispositivoIP, s.UsuarioDispositivo, s.UsuarioNombre,
+            s.EventoFechaHora, s.Punch, s.Estado, s.WorkCode
+        {missing}
+    """)
+    try:
+        with dbconn.begin_nested():
+            keys = {(str(r[0]), r[1], int(r[2]), int(r[3])) for r in dbconn.execute(new_keys)}
+            dbconn.execute(merge)
+        inserted = [row for key, row in unique_rows.items() if key in keys]
+    except IntegrityError:
+        inserted, _dup = _insert_rows_batched(dbconn, pending, batch_size)
+
+    # si algo falla antes, el rollback de la transacción se lleva también la staging
+    dbconn.execute(text(f"DROP TABLE IF EXISTS {stg}"))
+
+    return inserted, len(rows) - len(inserted)
+
+
+def insert_rows(
+    dbconn,
+    rows: List[Dict[str, Any]],
+    *,
+    batch_size: Optional[int] = None,
+    staging: bool = False,
+) -> Tuple[int, int]:
+    """
+    Inserta marcajes normalizados. batch_size <= 1 usa el modo fila por fila;
+    staging=True usa el merge set-based para backfills. Si se insertó algo
+    (y DAILY_ROLLUP) recalcula dbo.AsistenciaDiaria sólo de los días/usuarios
+    de las filas nuevas (no de todo el lote descargado) en la misma
+    transacción y marca sus dispositivos para que ingest_transaction publique
+    su watermark al confirmar.
+    Regresa (inserted, dup_skipped).
+    """
+    size = INSERT_BATCH_SIZE if batch_size is None else int(batch_size)
+    if size <= 1:
+        inserted, dup_skipped = _insert_rows_one_by_one(dbconn, rows)
+    elif staging:
+        inserted, dup_skipped = _merge_rows_staging(dbconn, rows, size)
+    else:
+        inserted, dup_skipped = _insert_rows_batched(dbconn, rows, size)
+    if inserted:
+        if DAILY_ROLLUP:
+            refresh_after_insert(dbconn, inserted)
+        note_ingested(dbconn, inserted)
+    return len(inserted), dup_skipped
+
+
+def _read_sizes(conn_dev) -> Tuple[Optional[int], Optional[int]]:
+    """
+    (registros, usuarios) del dispositivo vía read_sizes(): 1 comando, sin
+    descargar nada. (None, None) si el firmware no lo soporta; los errores de
+    sesión (socket muerto) se propagan.
+    """
+    try:
+        conn_dev.read_sizes()
+        return int(conn_dev.records), int(conn_dev.users)
+    except Exception as e:
+        if is_session_error(e):
+            raise
+        log.debug("read_sizes no disponible. Error=%s", e)
+        return None, None
 
 
 def _build_user_map(conn_dev) -> Dict[str, str]:
@@ -68,130 +377,652 @@ def _build_user_map(conn_dev) -> Dict[str, str]:
     Nota: el nombre no viene en cada log, se obtiene desde get_users().
     """
     user_map: Dict[str, str] = {}
+    for u in conn_dev.get_users() or []:
+        uid = str(getattr(u, "user_id", "")).strip()
+        name = str(getattr(u, "name", "")).strip()
+        if uid:
+            user_map[uid] = name
+    return user_map
+
+
+def _get_user_map(
+    session: DeviceSession,
+    cache: UserMapCache,
+    user_count: Optional[int],
+    *,
+    timings: PhaseTimings,
+    reconnect: Callable[[], None],
+) -> Dict[str, str]:
+    """
+    Fase users: mapa de nombres desde el cache o get_users() con su propio
+    presupuesto de reintentos. Si se agota se sigue sin nombres (no se cachea).
+    """
+    cached = cache.get(session.serial, user_count)
+    if cached is not None:
+        return cached
     try:
-        users = conn_dev.get_users() or []
-        for u in users:
-            uid = str(getattr(u, "user_id", "")).strip()
-            name = str(getattr(u, "name", "")).strip()
-            if uid:
-                user_map[uid] = name
+        user_map = run_phase(
+            USERS,
+            lambda: _build_user_map(session.conn),
+            retry_on=is_session_error,
+            timings=timings,
+            before_retry=reconnect,
+            label=f"device={session.serial}",
+        )
     except Exception as e:
         log.warning("No se pudo obtener lista de usuarios (get_users). Continuando sin nombres. Error=%s", e)
+        return {}
+    cache.put(session.serial, user_map, user_count)
     return user_map
 
 
-@retry(
-    wait=wait_exponential(multiplier=1, min=2, max=30),
-    stop=stop_after_attempt(10),
-    retry=retry_if_exception_type((OperationalError, OSError, TimeoutError)),
-    reraise=True,
-)
-def poll_once(
-    engine,
+@dataclass
+class DeviceDownload:
+    """
+    Resultado de la etapa de descarga: los logs ya en memoria (en columnas) y
+    el reloj ya liberado. La etapa de ingesta (ingest_download) no toca el reloj.
+    """
+    device_serial: str
+    device_ip: str
+    logs: AttendanceBatch
+    user_map: Dict[str, str]
+    record_count: int
+    lock_seconds: float = 0.0  # tiempo con el reloj en disable_device()
+    skipped: bool = False
+    phases: PhaseTimings = field(default_factory=PhaseTimings)
+    scanned: int = 0  # registros leídos del reloj (logs trae solo los que pasaron la ventana)
+    from_dump: bool = False  # los logs salieron del DumpCache, no del reloj
+
+
+def _download_session(
+    session: DeviceSession,
     *,
+    store: CheckpointStore,
+    user_cache: UserMapCache,
+    use_last_ts: bool,
+    pool: DeviceSessionPool,
+    timings: PhaseTimings,
     min_ts: Optional[datetime] = None,
     max_ts: Optional[datetime] = None,
-    use_last_ts: bool = True,
-    device_ip: Optional[str] = None,
-    device_port: Optional[int] = None,
-) -> None:
-    target_ip = (device_ip or MB160_IP or "").strip()
-    target_port = int(device_port or MB160_PORT)
-    if not target_ip:
-        raise RuntimeError("No hay IP de MB160 configurada (MB160_IP o device_ip)")
+    dump_cache: Optional[DumpCache] = None,
+) -> DeviceDownload:
+    device_serial = session.serial
+
+    try:
+        device_records, device_users = _read_sizes(session.conn)
+    except Exception as e:
+        if not is_session_error(e):
+            raise
+        # sesión de un poll anterior que el reloj ya cerró: conexión nueva (fase connect)
+        log.info("Sesión reutilizada sin respuesta, reconectando | device=%s | %s: %s", device_serial, type(e).__name__, e)
+        pool.reconnect(session, timings)
+        device_records, device_users = _read_sizes(session.conn)
+    checkpoint = store.get(device_serial)
 
-    # Import local para no romper si aún no instalas pyzk en algunos ambientes
-    from zk import ZK  # type: ignore
+    if (
+        use_last_ts
+        and checkpoint is not None
+        and device_records is not None
+        and device_records == checkpoint.record_count
+    ):
+        return DeviceDownload(
+            device_serial=device_serial,
+            device_ip=session.ip,
+            logs=AttendanceBatch(device_serial, session.ip),
+            user_map={},
+            record_count=device_records,
+            skipped=True,
+            phases=timings,
+        )
 
-    zk = ZK(target_ip, port=target_port, timeout=10, password=0)
-    conn_dev = None
+    # la ventana se aplica mientras se lee el buffer; el watermark del checkpoint
+    # solo si el reloj no tiene menos registros (log borrado: se re-decide en la ingesta)
+    after_ts = None
+    if (
+        use_last_ts
+        and checkpoint is not None
+        and (device_records is None or device_records >= checkpoint.record_count)
+    ):
+        after_ts = checkpoint.last_ts
+    read_stats: Dict[str, int] = {}
 
-    try:
-        conn_dev = zk.connect()
+    # mismo conteo que un dump del cache: el log no cambió, se lee del disco sin bloquear el reloj
+    dump = dump_cache.get(device_serial, device_records) if dump_cache is not None else None
+    if dump is not None:
+        try:
+            logs = run_phase(
+                ATTENDANCE,
+                lambda: read_attendance_dump(
+                    dump_cache.read(dump), record_count=device_records, device_serial=device_serial,
+                    device_ip=session.ip, min_ts=min_ts, max_ts=max_ts, after_ts=after_ts, stats=read_stats,
+                ),
+                retry_on=lambda e: False,
+                timings=timings,
+                label=f"device={device_serial}",
+            )
+        except DumpMissing as e:
+            # otro proceso lo desalojó o el archivo está dañado: cache miss, se baja del reloj
+            log.warning("Dump no disponible, se baja del reloj | device=%s | %s", device_serial, e)
+            dump = None
+            read_stats.clear()
+    if dump is not None:
+        user_map = _get_user_map(
+            session, user_cache, device_users, timings=timings,
+            reconnect=lambda: pool.reconnect(session, timings),
+        )
+        log.info("Dump desde cache | device=%s | records=%d | digest=%s", device_serial, device_records, dump.digest[:12])
+        return DeviceDownload(
+            device_serial=device_serial,
+            device_ip=session.ip,
+            logs=logs,
+            user_map=user_map,
+            record_count=device_records,
+            phases=timings,
+            scanned=read_stats.get("scanned", len(logs)),
+            from_dump=True,
+        )
 
+    def _read_logs() -> AttendanceBatch:
+        if not device_settings.stream_attendance:
+            logs = session.conn.get_attendance() or []
+            read_stats["scanned"] = len(logs)
+            return AttendanceBatch.from_records(logs, device_serial=device_serial, device_ip=session.ip)
+        writer = None
+        if dump_cache is not None and device_records:
+            writer = dump_cache.writer(device_serial, device_records)
+        return read_attendance(
+            session.conn, record_count=device_records, device_serial=device_serial, device_ip=session.ip,
+            min_ts=min_ts, max_ts=max_ts, after_ts=after_ts, stats=read_stats, dump=writer,
+        )
+
+    # el pre-check es de solo lectura; bloqueamos el reloj solo si hay que descargar
+    disabled = False
+
+    def _disable() -> None:
+        nonlocal disabled
         try:
-            conn_dev.disable_device()
+            session.conn.disable_device()
+            disabled = True
         except Exception:
             pass
 
-        try:
-            device_serial = conn_dev.get_serialnumber() or target_ip
-        except Exception:
-            device_serial = target_ip
+    def _reconnect() -> None:
+        # reintento de una fase: conexión nueva y el reloj otra vez bloqueado;
+        # lo que ya se bajó (usuarios) se conserva
+        pool.reconnect(session, timings)
+        _disable()
+
+    locked_at = time.monotonic()
+    try:
+        _disable()
 
         # ===== NUEVO: mapa user_id -> name =====
-        user_map = _build_user_map(conn_dev)
-
-        logs = conn_dev.get_attendance() or []
-
-        with engine.begin() as dbconn:
-            last_ts = _get_last_ts(dbconn, device_serial) if use_last_ts else None
-
-            inserted = 0
-            dup_skipped = 0
-
-            for a in logs:
-                ts = getattr(a, "timestamp", None)
-                if ts is None:
-                    continue
-
-                if min_ts is not None and ts < min_ts:
-                    continue
-                if max_ts is not None and ts >= max_ts:
-                    continue
-                # incremental
-                if last_ts is not None and ts <= last_ts:
-                    continue
-
-                user_id = str(getattr(a, "user_id", "")).strip()
-                user_name = user_map.get(user_id)  # puede ser None
-
-                estado = getattr(a, "status", 0)
-                punch = getattr(a, "punch", 0)
-                workcode = getattr(a, "workcode", None)
-
-                try:
-                    _insert_mark(
-                        dbconn,
-                        device_serial=device_serial,
-                        device_ip=target_ip,
-                        user_id=user_id,
-                        user_name=user_name,
-                        ts_local=ts,
-                        punch=int(punch or 0),
-                        estado=int(estado or 0),
-                        workcode=workcode,
-                    )
-                    inserted += 1
-                except IntegrityError:
-                    dup_skipped += 1
-
-            if min_ts is None and max_ts is None:
-                log.info(
-                    "Poll OK | device=%s | ip=%s | logs=%d | inserted=%d | dup_skipped=%d | last_ts=%s",
-                    device_serial, target_ip, len(logs), inserted, dup_skipped, last_ts
-                )
-            else:
-                log.info(
-                    "Poll OK | device=%s | ip=%s | logs=%d | inserted=%d | dup_skipped=%d | min_ts=%s | max_ts=%s",
-                    device_serial, target_ip, len(logs), inserted, dup_skipped, min_ts, max_ts
-                )
+        user_map = _get_user_map(session, user_cache, device_users, timings=timings, reconnect=_reconnect)
 
+        logs = run_phase(
+            ATTENDANCE,
+            _read_logs,
+            retry_on=is_session_error,
+            timings=timings,
+            before_retry=_reconnect,
+            label=f"device={device_serial}",
+        )
     finally:
-        if conn_dev:
+        # se libera el reloj en cuanto los logs están en memoria, antes de la DB
+        if disabled:
             try:
-                conn_dev.enable_device()
+                session.conn.enable_device()
             except Exception:
                 pass
+        lock_seconds = time.monotonic() - locked_at
+
+    return DeviceDownload(
+        device_serial=device_serial,
+        device_ip=session.ip,
+        logs=logs,
+        user_map=user_map,
+        record_count=device_records if device_records is not None else len(logs),
+        lock_seconds=lock_seconds if disabled else 0.0,
+        phases=timings,
+        scanned=read_stats.get("scanned", len(logs)),
+    )
+
+
+@dataclass
+class PreparedIngest:
+    """
+    Descarga ya filtrada y normalizada (filas listas para INSERT), con lo
+    necesario para confirmar el checkpoint después del commit. Es lo que viaja
+    por la cola del pipeline de escritura.
+    """
+    download: DeviceDownload
+    rows: List[Dict[str, Any]]
+    last_ts: Optional[datetime]
+    base_ts: Optional[datetime]
+    commit_checkpoint: bool
+    min_ts: Optional[datetime] = None
+    max_ts: Optional[datetime] = None
+    duplicates: int = 0  # llaves repetidas dentro de la descarga (cuentan como dup_skipped)
+
+
+def prepare_ingest(
+    engine,
+    download: DeviceDownload,
+    *,
+    min_ts: Optional[datetime] = None,
+    max_ts: Optional[datetime] = None,
+    use_last_ts: bool = True,
+    checkpoints: Optional[CheckpointStore] = None,
+    spool: Optional[Spool] = None,
+) -> PreparedIngest:
+    """
+    Resuelve el watermark y filtra los logs; no escribe en la DB. Con spool,
+    si la DB no responde en arranque en frío se toman todos los logs (el
+    reenvío del spool descarta los que ya existan).
+    """
+    store = checkpoints or CHECKPOINTS
+    spool = spool or SPOOL
+    device_serial = download.device_serial
+    if download.skipped:
+        return PreparedIngest(
+            download=download, rows=[], last_ts=None, base_ts=None, commit_checkpoint=False,
+            min_ts=min_ts, max_ts=max_ts,
+        )
+
+    checkpoint = store.get(device_serial)
+    if checkpoint is not None and download.record_count < checkpoint.record_count:
+        log.warning(
+            "Checkpoint inconsistente | device=%s | records=%d < checkpoint=%d | se relee de la DB",
+            device_serial, download.record_count, checkpoint.record_count,
+        )
+        store.invalidate(device_serial)
+        checkpoint = None
+
+    last_ts = None
+    if use_last_ts:
+        if checkpoint is not None:
+            last_ts = checkpoint.last_ts
+        else:
+            def _watermark() -> Optional[datetime]:
+                with engine.connect() as dbconn:
+                    return _get_last_ts(dbconn, device_serial)
+
             try:
-                conn_dev.disconnect()
-            except Exception:
-                pass
+                last_ts = run_phase(
+                    PERSIST,
+                    _watermark,
+                    retry_on=lambda e: isinstance(e, DB_UNAVAILABLE),
+                    timings=download.phases,
+                    label=f"device={device_serial}",
+                )
+            except DB_UNAVAILABLE as e:
+                if spool is None:
+                    raise
+                log.warning(
+                    "DB no disponible para el watermark | device=%s | se mandan todos los logs al spool | %s",
+                    device_serial, e.__class__.__name__,
+                )
+
+    batch, duplicates = _select_logs(
+        download.logs,
+        device_serial=device_serial,
+        device_ip=download.device_ip,
+        min_ts=min_ts,
+        max_ts=max_ts,
+        last_ts=last_ts,
+    )
+    return PreparedIngest(
+        download=download,
+        rows=batch.to_params(download.user_map),
+        last_ts=last_ts,
+        base_ts=checkpoint.last_ts if checkpoint is not None else last_ts,
+        # sólo el poll incremental mueve el checkpoint: un pull por rango no vio
+        # lo que llegó fuera de su ventana, y con el record_count actual el
+        # siguiente poll incremental se saltaría esos marcajes
+        commit_checkpoint=use_last_ts,
+        min_ts=min_ts,
+        max_ts=max_ts,
+        duplicates=duplicates,
+    )
+
+
+def finish_ingest(
+    prepared: PreparedIngest,
+    inserted: int,
+    dup_skipped: int,
+    *,
+    checkpoints: Optional[CheckpointStore] = None,
+    spooled: int = 0,
+) -> PollResult:
+    """
+    Se llama después del commit (o de dejar las filas en el spool con
+    `spooled`): mueve el checkpoint y arma el PollResult.
+    """
+    store = checkpoints or CHECKPOINTS
+    download = prepared.download
+    device_serial = download.device_serial
+    target_ip = download.device_ip
+    dup_skipped += prepared.duplicates
+
+    if download.skipped:
+        checkpoint = store.get(device_serial)
+        log.info(
+            "Poll sin cambios | device=%s | ip=%s | records=%d | last_ts=%s",
+            device_serial, target_ip, download.record_count, checkpoint.last_ts if checkpoint else None
+        )
+        return PollResult(
+            device_serial=device_serial,
+            device_ip=target_ip,
+            logs=download.record_count,
+            skipped=True,
+            phases=download.phases,
+        )
+
+    # tras el commit todo lo filtrado ya está en la DB (insertado o duplicado) o en el spool
+    if prepared.commit_checkpoint:
+        # las filas van ordenadas por fecha (_select_logs)
+        window_max = prepared.rows[-1]["EventoFechaHora"] if prepared.rows else None
+        new_ts = max((t for t in (prepared.base_ts, window_max) if t is not None), default=None)
+        store.commit(device_serial, last_ts=new_ts, record_count=download.record_count)
+
+    if spooled:
+        log.warning(
+            "Poll en spool | device=%s | ip=%s | logs=%d | spooled=%d | lock=%.2fs | DB no disponible",
+            device_serial, target_ip, download.scanned, spooled, download.lock_seconds,
+        )
+    elif prepared.min_ts is None and prepared.max_ts is None:
+        log.info(
+            "Poll OK | device=%s | ip=%s | logs=%d | inserted=%d | dup_skipped=%d | lock=%.2fs | last_ts=%s | %s",
+            device_serial, target_ip, download.scanned, inserted, dup_skipped, download.lock_seconds,
+            prepared.last_ts, download.phases.describe()
+        )
+    else:
+        log.info(
+            "Poll OK | device=%s | ip=%s | logs=%d | inserted=%d | dup_skipped=%d | lock=%.2fs | "
+            "min_ts=%s | max_ts=%s | %s",
+            device_serial, target_ip, download.scanned, inserted, dup_skipped, download.lock_seconds,
+            prepared.min_ts, prepared.max_ts, download.phases.describe()
+        )
+
+    return PollResult(
+        device_serial=device_serial,
+        device_ip=target_ip,
+        logs=download.scanned,
+        inserted=inserted,
+        dup_skipped=dup_skipped,
+        lock_seconds=download.lock_seconds,
+        spooled=spooled,
+        phases=download.phases,
+    )
+
+
+def ingest_download(
+    engine,
+    download: DeviceDownload,
+    *,
+    min_ts: Optional[datetime] = None,
+    max_ts: Optional[datetime] = None,
+    use_last_ts: bool = True,
+    batch_size: Optional[int] = None,
+    staging: Optional[bool] = None,
+    checkpoints: Optional[CheckpointStore] = None,
+    spool: Optional[Spool] = None,
+) -> PollResult:
+    """
+    Etapa de ingesta: filtra por watermark/ventana, inserta y confirma el
+    checkpoint. Corre fuera del lock del dispositivo.
+
+    Con spool (SPOOL_FILE) las filas se guardan primero en el spool local;
+    si el INSERT falla porque la DB no está disponible se quedan ahí para el
+    SpoolDrainer y el poll termina bien (PollResult.spooled), sin reintentar
+    la descarga del dispositivo.
+    """
+    if staging is None:
+        staging = not use_last_ts
+    spool = spool or SPOOL
+    prepared = prepare_ingest(
+        engine, download, min_ts=min_ts, max_ts=max_ts, use_last_ts=use_last_ts,
+        checkpoints=checkpoints, spool=spool,
+    )
+
+    inserted = 0
+    dup_skipped = 0
+    if prepared.rows:
+        if spool is not None:
+            spool.append(prepared.rows)
+        def _persist() -> Tuple[int, int]:
+            with ingest_transaction(engine) as dbconn:
+                return insert_rows(dbconn, prepared.rows, batch_size=batch_size, staging=staging)
+
+        try:
+            # fase persist: se reintenta solo la transacción, las filas siguen en memoria
+            inserted, dup_skipped = run_phase(
+                PERSIST,
+                _persist,
+                retry_on=lambda e: isinstance(e, DB_UNAVAILABLE),
+                timings=download.phases,
+                label=f"device={download.device_serial}",
+            )
+        except DB_UNAVAILABLE:
+            if spool is None:
+                raise
+            return finish_ingest(prepared, 0, 0, checkpoints=checkpoints, spooled=len(prepared.rows))
+        if spool is not None:
+            spool.discard(prepared.rows)
+
+    return finish_ingest(prepared, inserted, dup_skipped, checkpoints=checkpoints)
+
+
+def download_once(
+    *,
+    use_last_ts: bool = True,
+    device_ip: Optional[str] = None,
+    device_port: Optional[int] = None,
+    checkpoints: Optional[CheckpointStore] = None,
+    user_maps: Optional[UserMapCache] = None,
+    sessions: Optional[DeviceSessionPool] = None,
+    min_ts: Optional[datetime] = None,
+    max_ts: Optional[datetime] = None,
+    use_dump_cache: Optional[bool] = None,
+) -> DeviceDownload:
+    """
+    Etapa de descarga: toma la sesión del reloj, baja usuarios/logs y lo
+    libera (enable_device + fin del lock de sesión) antes de regresar.
+
+    Los logs se leen en streaming (attendance_stream): solo se conservan los
+    de la ventana [min_ts, max_ts) posteriores al watermark del checkpoint.
+
+    use_dump_cache (default: not use_last_ts, es decir backfills por rango)
+    lee el log del DUMP_CACHE si el reloj reporta el mismo número de
+    registros que un dump guardado, y si no guarda el buffer crudo al bajarlo.
+    """
+    if use_dump_cache is None:
+        use_dump_cache = not use_last_ts
+    target_ip = (device_ip or MB160_IP or "").strip()
+    target_port = int(device_port or MB160_PORT)
+    if not target_ip:
+        raise RuntimeError("No hay IP de MB160 configurada (MB160_IP o device_ip)")
+
+    pool = sessions or SESSIONS
+    timings = PhaseTimings()
+    return pool.run(
+        target_ip,
+        target_port,
+        lambda session: _download_session(
+            session,
+            store=checkpoints or CHECKPOINTS,
+            user_cache=user_maps or USER_MAPS,
+            use_last_ts=use_last_ts,
+            pool=pool,
+            timings=timings,
+            min_ts=min_ts,
+            max_ts=max_ts,
+            dump_cache=DUMP_CACHE if use_dump_cache else None,
+        ),
+        timings=timings,
+    )
+
+
+def poll_once(
+    engine,
+    *,
+    min_ts: Optional[datetime] = None,
+    max_ts: Optional[datetime] = None,
+    use_last_ts: bool = True,
+    device_ip: Optional[str] = None,
+    device_port: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    staging: Optional[bool] = None,
+    checkpoints: Optional[CheckpointStore] = None,
+    user_maps: Optional[UserMapCache] = None,
+    sessions: Optional[DeviceSessionPool] = None,
+    spool: Optional[Spool] = None,
+    use_dump_cache: Optional[bool] = None,
+) -> PollResult:
+    """
+    Descarga los marcajes del MB160 y los inserta en dbo.AsistenciaMarcaje.
+    batch_size controla el tamaño de cada executemany (INSERT_BATCH_SIZE por
+    default); con batch_size <= 1 se inserta fila por fila.
+    staging (default: not use_last_ts) usa el merge por tabla staging, pensado
+    para backfills por rango donde casi todo ya existe en la DB.
+
+    El watermark incremental sale del CheckpointStore; solo se consulta
+    SELECT MAX(EventoFechaHora) en arranque en frío o si el checkpoint no
+    cuadra con el dispositivo (menos registros que los vistos: log borrado).
+
+    En modo incremental, si el conteo de registros del dispositivo
+    (read_sizes) es igual al del checkpoint, no se descarga nada: se omiten
+    get_users, get_attendance y la transacción (PollResult.skipped=True).
+    El mapa de nombres sale de USER_MAPS mientras el conteo de usuarios no cambie.
+
+    La conexión al reloj sale de SESSIONS (se reutiliza entre polls y se
+    comparte con el user sync). El poll corre en dos etapas: download_once
+    (reloj bloqueado solo mientras baja los logs) e ingest_download (DB, con
+    el reloj ya liberado); PollResult.lock_seconds mide la primera.
+
+    Cada fase tiene su propio presupuesto de reintentos (POLL_RETRY_*):
+    connect, users, attendance (reconectan y siguen desde la fase que falló)
+    y persist (solo la transacción, con las filas ya en memoria). El tiempo
+    e intentos por fase quedan en PollResult.phases.
+
+    Con SPOOL activo, si persist agota sus reintentos por DB caída el poll no
+    falla: las filas quedan en el spool local (PollResult.spooled).
+
+    Los backfills por rango (use_last_ts=False) usan el DUMP_CACHE: si el
+    log del reloj no cambió desde el último pull se lee del disco. No mueven
+    el checkpoint (ni last_ts ni record_count).
+    """
+    download = download_once(
+        use_last_ts=use_last_ts,
+        device_ip=device_ip,
+        device_port=device_port,
+        checkpoints=checkpoints,
+        user_maps=user_maps,
+        sessions=sessions,
+        min_ts=min_ts,
+        max_ts=max_ts,
+        use_dump_cache=use_dump_cache,
+    )
+    return ingest_download(
+        engine,
+        download,
+        min_ts=min_ts,
+        max_ts=max_ts,
+        use_last_ts=use_last_ts,
+        batch_size=batch_size,
+        staging=staging,
+        checkpoints=checkpoints,
+        spool=spool,
+    )
+
+
+def poll_windows(
+    engine,
+    windows: List[TimeWindow],
+    *,
+    device_ip: Optional[str] = None,
+    device_port: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    checkpoints: Optional[CheckpointStore] = None,
+    user_maps: Optional[UserMapCache] = None,
+    sessions: Optional[DeviceSessionPool] = None,
+    spool: Optional[Spool] = None,
+    use_dump_cache: Optional[bool] = None,
+) -> List[PollResult]:
+    """
+    Backfill de varias ventanas [min_ts, max_ts) con una sola descarga del
+    reloj: se baja la envolvente de las ventanas, se cortan todas con el mismo
+    índice (AttendanceBatch.select_windows) y cada una se ingesta como un
+    poll_once(use_last_ts=False). Regresa un PollResult por ventana.
+    """
+    if not windows:
+        return []
+    starts = [w.min_ts for w in windows]
+    ends = [w.max_ts for w in windows]
+    download = download_once(
+        use_last_ts=False,
+        device_ip=device_ip,
+        device_port=device_port,
+        checkpoints=checkpoints,
+        user_maps=user_maps,
+        sessions=sessions,
+        min_ts=None if None in starts else min(starts),
+        max_ts=None if None in ends else max(ends),
+        use_dump_cache=use_dump_cache,
+    )
+    parts = download.logs.select_windows(windows)
+    return [
+        ingest_download(
+            engine,
+            replace(download, logs=part),
+            min_ts=window.min_ts,
+            max_ts=window.max_ts,
+            use_last_ts=False,
+            batch_size=batch_size,
+            checkpoints=checkpoints,
+            spool=spool,
+        )
+        for window, part in zip(windows, parts)
+    ]
+
+
+def start_spool_drainer(engine, spool: Optional[Spool] = None) -> Optional[SpoolDrainer]:
+    """Arranca el hilo que reenvía el spool a la DB (None si no hay spool)."""
+    spool = spool or SPOOL
+    if spool is None:
+        return None
+    pending = spool.pending()
+    if pending:
+        log.info("Spool con %d filas pendientes | %s", pending, spool.path)
+    return SpoolDrainer(
+        engine,
+        spool,
+        batch_rows=device_settings.spool_drain_batch_rows,
+        interval_seconds=device_settings.spool_drain_interval_seconds,
+    ).start()
+
+
+def flush_spool(engine, spool: Optional[Spool] = None) -> int:
+    """
+    Para scripts de una sola corrida: intenta vaciar el spool en la DB.
+    Regresa las filas que siguen pendientes (la DB puede seguir caída).
+    """
+    spool = spool or SPOOL
+    if spool is None:
+        return 0
+    try:
+        inserted, dup_skipped = drain_all(engine, spool, batch_rows=device_settings.spool_drain_batch_rows)
+        if inserted or dup_skipped:
+            log.info("Spool drenado | inserted=%d | dup_skipped=%d", inserted, dup_skipped)
+    except DB_UNAVAILABLE as e:
+        log.warning("Spool: DB no disponible, quedan %d filas | %s", spool.pending(), e.__class__.__name__)
+    return spool.pending()
 
 
 def run_forever() -> None:
     engine = build_engine()
     log.info("Collector iniciado | MB160=%s:%s | interval=%ss", MB160_IP, MB160_PORT, PULL_INTERVAL_SECONDS)
+    start_spool_drainer(engine)
 
     while True:
         try:
@@ -0,0 +1,204 @@
+"""
+Reconciliación dispositivo vs dbo.AsistenciaMarcaje por día.
+
+Para cada día de la ventana se compara un digest de lo que tiene el reloj
+con el mismo digest calculado en SQL Server (GROUP BY día) y solo los días
+que no cuadran se reenvían con el merge por staging, que inserta las llaves
+que faltan. Los días que ya cuadran no generan escrituras.
+
+El digest es (registros, Σ segundos del día, Σ UsuarioDispositivo numérico,
+Σ punch*256+estado): se calcula igual en Python y en SQL sin traer filas.
+Un falso positivo solo cuesta un merge sin inserts.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+
+from mb160_service.collector.batch import AttendanceBatch
+from mb160_service.collector.checkpoint import CheckpointStore
+from mb160_service.collector.poller import _select_logs, download_once, insert_rows
+from mb160_service.collector.sessions import DeviceSessionPool
+from mb160_service.collector.user_cache import UserMapCache
+from mb160_service.collector.watermark import ingest_transaction
+from mb160_service.collector.window import TimeWindow
+
+log = logging.getLogger("mb160.reconcile")
+
+
+class DayDigest(NamedTuple):
+    records: int
+    seconds: int
+    users: int
+    codes: int
+
+
+@dataclass(frozen=True)
+class DayDrift:
+    day: date
+    device_records: int
+    db_records: int
+
+
+@dataclass
+class ReconcileResult:
+    device_serial: str
+    device_ip: str
+    days_checked: int = 0
+    drift: List[DayDrift] = field(default_factory=list)  # días que no cuadran
+    missing: int = 0  # registros del reloj que faltaban en la DB (por conteo)
+    extra: int = 0  # registros en la DB que el reloj ya no tiene (por conteo)
+    inserted: int = 0
+    dup_skipped: int = 0
+    from_dump: bool = False
+
+
+_BIGINT_MAX = 2**63 - 1
+
+
+def _user_number(user_id: str) -> int:
+    # mismo criterio que TRY_CAST(... AS BIGINT): lo que no es numérico cuenta 0.
+    # Sólo dígitos ASCII: isdigit() también acepta '²' o '٣', que SQL Server no convierte
+    value = user_id.strip()
+    if not (value.isascii() and value.isdigit()):
+        return 0
+    number = int(value)
+    # fuera de BIGINT TRY_CAST regresa NULL
+    return number if number <= _BIGINT_MAX else 0
+
+
+def device_day_digests(batch: AttendanceBatch) -> Dict[date, DayDigest]:
+    """Digest por día de un batch ya filtrado y sin llaves repetidas."""
+    user_numbers = [_user_number(u) for u in batch.users]
+    acc: Dict[int, List[int]] = {}
+    for ts, uidx, punch, status in zip(batch.ts, batch.user, batch.punch, batch.status):
+        day, seconds = divmod(ts, 86400)
+        item = acc.get(day)
+        if item is None:
+            item = acc[day] = [0, 0, 0, 0]
+        item[0] += 1
+        item[1] += seconds
+        item[2] += user_numbers[uidx]
+        item[3] += punch * 256 + status
+    epoch = date(1970, 1, 1)
+    return {epoch + timedelta(days=day): DayDigest(*item) for day, item in acc.items()}
+
+
+_DIGEST_SQL = {
+    "mssql": """
+        SELECT
+            CAST(EventoFechaHora AS date) AS Dia,
+            COUNT(*) AS Registros,
+            SUM(CAST(DATEDIFF(SECOND, CAST(CAST(EventoFechaHora AS date) AS datetime2(0)), EventoFechaHora) AS BIGINT)),
+            SUM(ISNULL(TRY_CAST(LTRIM(RTRIM(UsuarioDispositivo)) AS BIGINT), 0)),
+            SUM(CAST(Punch AS BIGINT) * 256 + Estado)
+        FROM dbo.AsistenciaMarcaje
+        WHERE DispositivoSerial = :DeviceSerial
+          AND EventoFechaHora >= :TsFrom
+          AND EventoFechaHora < :TsTo
+        GROUP BY CAST(EventoFechaHora AS date)
+    """,
+    # SQLite (standin)
+    "sqlite": """
+        SELECT
+            date(EventoFechaHora) AS Dia,
+            COUNT(*) AS Registros,
+            SUM(CAST(strftime('%s', EventoFechaHora) AS INTEGER) - CAST(strftime('%s', date(EventoFechaHora)) AS INTEGER)),
+            SUM(CASE WHEN trim(UsuarioDispositivo) GLOB '[0-9]*' AND trim(UsuarioDispositivo) NOT GLOB '*[^0-9]*'
+                     THEN CAST(trim(UsuarioDispositivo) AS INTEGER) ELSE 0 END),
+            SUM(Punch * 256 + Estado)
+        FROM dbo.AsistenciaMarcaje
+        WHERE DispositivoSerial = :DeviceSerial
+          AND EventoFechaHora >= :TsFrom
+          AND EventoFechaHora < :TsTo
+        GROUP BY date(EventoFechaHora)
+    """,
+}
+
+
+def db_day_digests(dbconn, device_serial: str, ts_from: datetime, ts_to: datetime) -> Dict[date, DayDigest]:
+    """El mismo digest por día calculado en la DB (una sola consulta agrupada)."""
+    sql = _DIGEST_SQL["mssql" if dbconn.dialect.name == "mssql" else "sqlite"]
+    rows = dbconn.execute(text(sql), {"DeviceSerial": device_serial, "TsFrom": ts_from, "TsTo": ts_to})
+    out: Dict[date, DayDigest] = {}
+    for day, records, seconds, users, codes in rows:
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        elif isinstance(day, datetime):
+            day = day.date()
+        out[day] = DayDigest(int(records), int(seconds or 0), int(users or 0), int(codes or 0))
+    return out
+
+
+def reconcile_device(
+    engine,
+    *,
+    start: datetime,
+    end: datetime,
+    device_ip: Optional[str] = None,
+    device_port: Optional[int] = None,
+    dry_run: bool = False,
+    batch_size: Optional[int] = None,
+    checkpoints: Optional[CheckpointStore] = None,
+    user_maps: Optional[UserMapCache] = None,
+    sessions: Optional[DeviceSessionPool] = None,
+) -> ReconcileResult:
+    """
+    Compara [start, end) día por día entre el reloj y la DB e inserta (merge
+    por staging) solo los días con diferencias. dry_run solo reporta.
+    El log sale del DUMP_CACHE si el reloj no cambió desde la última lectura.
+    """
+    download = download_once(
+        use_last_ts=False,
+        device_ip=device_ip,
+        device_port=device_port,
+        checkpoints=checkpoints,
+        user_maps=user_maps,
+        sessions=sessions,
+        min_ts=start,
+        max_ts=end,
+        use_dump_cache=True,
+    )
+    serial = download.device_serial
+    batch, _dups = _select_logs(
+        download.logs, device_serial=serial, device_ip=download.device_ip,
+        min_ts=start, max_ts=end, last_ts=None,
+    )
+    device = device_day_digests(batch)
+    with engine.connect() as dbconn:
+        db = db_day_digests(dbconn, serial, start, end)
+
+    result = ReconcileResult(device_serial=serial, device_ip=download.device_ip, from_dump=download.from_dump)
+    result.days_checked = len(set(device) | set(db))
+    for day in sorted(set(device) | set(db)):
+        dev, stored = device.get(day), db.get(day)
+        if dev == stored:
+            continue
+        dev_n = dev.records if dev else 0
+        db_n = stored.records if stored else 0
+        result.drift.append(DayDrift(day, dev_n, db_n))
+        result.missing += max(0, dev_n - db_n)
+        result.extra += max(0, db_n - dev_n)
+
+    # solo los días que el reloj tiene y no cuadran; lo que solo está en la DB no se toca
+    windows = [
+        TimeWindow(datetime.combine(d.day, datetime.min.time()), datetime.combine(d.day + timedelta(days=1), datetime.min.time()))
+        for d in result.drift if d.device_records
+    ]
+    if windows and not dry_run:
+        rows = []
+        for part in batch.select_windows(windows):
+            rows += part.to_params(download.user_map)
+        with ingest_transaction(engine) as dbconn:
+            result.inserted, result.dup_skipped = insert_rows(dbconn, rows, batch_size=batch_size, staging=True)
+
+    log.info(
+        "Reconciliación | device=%s | ip=%s | días=%d | con diferencias=%d | faltantes=%d | extra_db=%d | "
+        "inserted=%d | dup_skipped=%d | dump=%s%s",
+        serial, download.device_ip, result.days_checked, len(result.drift), result.missing, result.extra,
+        result.inserted, result.dup_skipped, "cache" if download.from_dump else "reloj",
+        " | dry-run" if dry_run else "",
+    )
+    return result
@@ -0,0 +1,200 @@
+"""
+Resumen diario de asistencia: dbo.AsistenciaDiaria, una fila por
+(UsuarioDispositivo, Fecha) con las ventanas de sp_ProcessMarcajeQueue:
+
+    PrimeraEntrada  primer marcaje antes de las 12:00
+    SalidaComida    1er marcaje en 12:50–15:59
+    EntradaComida   2do marcaje en 12:50–15:59
+    UltimaSalida    último marcaje desde las 16:00
+
+Igual que el SP, un marcaje a ≤60s del anterior del mismo empleado en el día
+es doble-tap y no cuenta (Marcajes sí cuenta todas las filas del día).
+
+insert_rows lo mantiene al insertar: los días (usuario, fecha) que tocó el
+lote se recalculan completos desde dbo.AsistenciaMarcaje en la misma
+transacción (seek por IX_AsistenciaMarcaje_Usuario_Fecha), así el resultado
+es el mismo sin importar el orden en que lleguen los marcajes.
+"""
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+log = logging.getLogger("mb160.rollup")
+
+DayKey = Tuple[str, date]
+
+_DIALECT = {
+    "mssql": {
+        "keys": "#RollupKeys",
+        # #RollupKeys toma la collation de tempdb; el join contra dbo.AsistenciaMarcaje necesita la de la DB
+        "collate": "COLLATE DATABASE_DEFAULT",
+        "hora": "CAST(EventoFechaHora AS time(0))",
+        "gap": "DATEDIFF(SECOND, Anterior, EventoFechaHora)",
+        "delete": """
+            DELETE d
+            FROM dbo.AsistenciaDiaria d
+            INNER JOIN #RollupKeys k
+                ON k.UsuarioDispositivo = d.UsuarioDispositivo
+               AND k.Fecha = d.Fecha
+        """,
+    },
+    # SQLite (standin)
+    "sqlite": {
+        "keys": "temp.RollupKeys",
+        "collate": "",
+        "hora": "time(EventoFechaHora)",
+        "gap": "CAST(strftime('%s', EventoFechaHora) AS INTEGER) - CAST(strftime('%s', Anterior) AS INTEGER)",
+        "delete": """
+            DELETE FROM dbo.AsistenciaDiaria
+            WHERE (UsuarioDispositivo, Fecha) IN (SELECT UsuarioDispositivo, Fecha FROM temp.RollupKeys)
+        """,
+    },
+}
+
+_INSERT_DAILY = """
+    INSERT INTO dbo.AsistenciaDiaria
+    (UsuarioDispositivo, Fecha, PrimeraEntrada, SalidaComida, EntradaComida, UltimaSalida, Marcajes)
+"""
+
+# SQL Server pide el WITH antes del INSERT; SQLite lo acepta después (y así
+# el driver reporta rowcount)
+_REFRESH_SQL = """
+    {insert_before}
+    WITH base AS (
+        SELECT m.UsuarioDispositivo, k.Fecha, m.EventoFechaHora, COUNT(*) AS Registros
+        FROM {keys} k
+        INNER JOIN dbo.AsistenciaMarcaje m
+            ON m.UsuarioDispositivo = k.UsuarioDispositivo
+           AND m.EventoFechaHora >= k.Desde
+           AND m.EventoFechaHora < k.Hasta
+        GROUP BY m.UsuarioDispositivo, k.Fecha, m.EventoFechaHora
+    ),
+    seq AS (
+        SELECT UsuarioDispositivo, Fecha, EventoFechaHora, Registros,
+               LAG(EventoFechaHora) OVER (
+                   PARTITION BY UsuarioDispositivo, Fecha ORDER BY EventoFechaHora
+               ) AS Anterior
+        FROM base
+    ),
+    valid AS (
+        SELECT UsuarioDispositivo, Fecha, EventoFechaHora, Registros,
+               {hora} AS Hora,
+               CASE WHEN Anterior IS NULL OR {gap} > 60 THEN 1 ELSE 0 END AS Valido
+        FROM seq
+    ),
+    ranked AS (
+        -- Comida = 1: marcaje válido en 12:50–15:59; rn = orden dentro de su grupo
+        SELECT UsuarioDispositivo, Fecha, EventoFechaHora, Registros, Hora, Valido, Comida,
+               ROW_NUMBER() OVER (
+                   PARTITION BY UsuarioDispositivo, Fecha, Comida ORDER BY EventoFechaHora
+               ) AS rn
+        FROM (
+            SELECT UsuarioDispositivo, Fecha, EventoFechaHora, Registros, Hora, Valido,
+                   CASE WHEN Valido = 1 AND Hora >= '12:50:00' AND Hora < '16:00:00' THEN 1 ELSE 0 END AS Comida
+            FROM valid
+        ) v
+    )
+    {insert_after}
+    SELECT
+        UsuarioDispositivo,
+        Fecha,
+        MIN(CASE WHEN Valido = 1 AND Hora < '12:00:00' THEN EventoFechaHora END),
+        MAX(CASE WHEN Comida = 1 AND rn = 1 THEN EventoFechaHora END),
+        MAX(CASE WHEN Comida = 1 AND rn = 2 THEN EventoFechaHora END),
+        MAX(CASE WHEN Valido = 1 AND Hora >= '16:00:00' THEN EventoFechaHora END),
+        SUM(Registros)
+    FROM ranked
+    GROUP BY UsuarioDispositivo, Fecha
+"""
+
+
+def _sql(dbconn) -> Dict[str, str]:
+    return _DIALECT["mssql" if dbconn.dialect.name == "mssql" else "sqlite"]
+
+
+def rollup_keys(rows: Iterable[Dict[str, Any]]) -> Set[DayKey]:
+    """(UsuarioDispositivo, día) de filas con el formato de insert_rows."""
+    return {(row["UsuarioDispositivo"], row["EventoFechaHora"].date()) for row in rows}
+
+
+def refresh_daily(dbconn, keys: Iterable[DayKey], *, batch_size: int = 1000) -> int:
+    """
+    Recalcula dbo.AsistenciaDiaria para `keys` (borra y vuelve a insertar
+    esos días; un día sin marcajes queda sin fila). Regresa las filas escritas.
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return 0
+    sql = _sql(dbconn)
+    tmp = sql["keys"]
+    collate = sql["collate"]
+    dbconn.execute(text(f"DROP TABLE IF EXISTS {tmp}"))
+    dbconn.execute(text(f"""
+        CREATE TABLE {tmp} (
+            UsuarioDispositivo NVARCHAR(50) {collate} NOT NULL,
+            Fecha              DATE         NOT NULL,
+            Desde              DATETIME2(0) NOT NULL,
+            Hasta              DATETIME2(0) NOT NULL,
+            PRIMARY KEY (UsuarioDispositivo, Fecha)
+        )
+    """))
+    params = []
+    for user_id, day in keys:
+        start = datetime.combine(day, time())
+        params.append({"UsuarioDispositivo": user_id, "Fecha": day, "Desde": start, "Hasta": start + timedelta(days=1)})
+    for start in range(0, len(params), batch_size):
+        dbconn.execute(
+            text(f"INSERT INTO {tmp} (UsuarioDispositivo, Fecha, Desde, Hasta) VALUES (:UsuarioDispositivo, :Fecha, :Desde, :Hasta)"),
+            params[start:start + batch_size],
+        )
+
+    dbconn.execute(text(sql["delete"]))
+    mssql = dbconn.dialect.name == "mssql"
+    refresh = _REFRESH_SQL.format(
+        keys=tmp, hora=sql["hora"], gap=sql["gap"],
+        insert_before="" if mssql else _INSERT_DAILY, insert_after=_INSERT_DAILY if mssql else "",
+    )
+    written = int(dbconn.execute(text(refresh)).rowcount or 0)
+    dbconn.execute(text(f"DROP TABLE IF EXISTS {tmp}"))
+    return written
+
+
+def refresh_after_insert(dbconn, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    Lo que llama insert_rows. Corre en un savepoint: si el resumen falla (p.
+    ej. falta crear dbo.AsistenciaDiaria) los marcajes se guardan igual y el
+    día se puede reconstruir con scripts/run_daily_rollup.py.
+    """
+    keys = rollup_keys(rows)
+    try:
+        with dbconn.begin_nested():
+            return refresh_daily(dbconn, keys)
+    except DBAPIError as e:
+        log.warning(
+            "No se pudo actualizar AsistenciaDiaria | días=%d | %s: %s",
+            len(keys), type(e).__name__, getattr(e, "orig", e),
+        )
+        return 0
+
+
+def rebuild_daily(dbconn, day: date, *, user_id: Optional[str] = None) -> int:
+    """Reconstruye un día completo (todos los usuarios o uno) desde dbo.AsistenciaMarcaje."""
+    start = datetime.combine(day, time())
+    params: Dict[str, Any] = {"Desde": start, "Hasta": start + timedelta(days=1), "Fecha": day}
+    user_sql = ""
+    if user_id:
+        user_sql = "AND UsuarioDispositivo = :user_id"
+        params["user_id"] = user_id
+    users = [
+        r[0] for r in dbconn.execute(text(f"""
+            SELECT DISTINCT UsuarioDispositivo
+            FROM dbo.AsistenciaMarcaje
+            WHERE EventoFechaHora >= :Desde AND EventoFechaHora < :Hasta {user_sql}
+        """), params)
+    ]
+    # usuarios que ya no tienen marcajes ese día: su fila se borra
+    dbconn.execute(text(f"DELETE FROM dbo.AsistenciaDiaria WHERE Fecha = :Fecha {user_sql}"), params)
+    return refresh_daily(dbconn, [(u, day) for u in users])
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from mb160_service.collector.phases import CONNECT, PhaseTimings, run_phase
+from mb160_service.config import get_device_settings
+
+try:
+    from zk.exception import ZKError, ZKErrorResponse  # type: ignore
+except Exception:  # pragma: no cover
+    ZKError = ZKErrorResponse = ()  # type: ignore
+
+log = logging.getLogger("mb160.sessions")
+
+device_settings = get_device_settings()
+
+T = TypeVar("T")
+
+
+def is_session_error(e: BaseException) -> bool:
+    """Errores que invalidan la conexión (socket muerto, sesión rechazada)."""
+    if isinstance(e, (OSError, TimeoutError)):
+        return True
+    return isinstance(e, ZKError) and not isinstance(e, ZKErrorResponse)
+
+
+@dataclass
+class DeviceSession:
+    ip: str
+    port: int
+    conn: Any  # conexión pyzk ya autenticada
+    serial: str
+    connected_at: float
+    last_used: float
+
+
+class DeviceSessionPool:
+    """
+    Mantiene una conexión pyzk viva por (ip, port) entre polls, con el serial
+    ya leído. Cada dispositivo tiene su lock: el poller de asistencia y el
+    worker de user sync se turnan la misma sesión en vez de abrir conexiones
+    que compitan en el MB160.
+
+    run() no reintenta: si fn falla por red la sesión se cierra y el error
+    sube. Quien usa la sesión decide cuándo reconectar (reconnect(), con los
+    reintentos de la fase connect); así un reloj caído cuesta
+    POLL_RETRY_CONNECT intentos y no el doble. Otros errores (DB) se
+    propagan y la sesión se conserva.
+    """
+
+    def __init__(self, *, timeout: int = 10, max_idle_seconds: int = 900, omit_ping: bool = False):
+        self._timeout = timeout
+        self._omit_ping = omit_ping
+        self._max_idle = max_idle_seconds
+        self._lock = threading.Lock()
+        self._device_locks: Dict[Tuple[str, int], threading.Lock] = {}
+        self._sessions: Dict[Tuple[str, int], DeviceSession] = {}
+        self._connects = 0
+        self._reuses = 0
+        self._reconnects = 0
+        self._connect_seconds = 0.0
+
+    def _device_lock(self, key: Tuple[str, int]) -> threading.Lock:
+        with self._lock:
+            return self._device_locks.setdefault(key, threading.Lock())
+
+    def _connect(self, ip: str, port: int, timings: Optional[PhaseTimings] = None) -> DeviceSession:
+        # Import local para no romper si aún no instalas pyzk en algunos ambientes
+        from zk import ZK  # type: ignore
+
+        started = time.monotonic()
+        # fase connect: reintentos propios (POLL_RETRY_CONNECT) antes de dar el reloj por caído
+        conn = run_phase(
+            CONNECT,
+            lambda: ZK(ip, port=port, timeout=self._timeout, password=0, ommit_ping=self._omit_ping).connect(),
+            retry_on=is_session_error,
+            timings=timings,
+            label=f"ip={ip}:{port}",
+        )
+        try:
+            serial = conn.get_serialnumber() or ip
+        except Exception:
+            serial = ip
+        now = time.monotonic()
+        with self._lock:
+            self._connects += 1
+            self._connect_seconds += now - started
+        return DeviceSession(ip=ip, port=port, conn=conn, serial=serial, connected_at=now, last_used=now)
+
+    @staticmethod
+    def _close(session: DeviceSession) -> None:
+        try:
+            session.conn.disconnect()
+        except Exception:
+            pass
+
+    def run(
+        self, ip: str, port: int, fn: Callable[[DeviceSession], T], *, timings: Optional[PhaseTimings] = None
+    ) -> T:
+        """
+        Ejecuta fn(session) con acceso exclusivo al dispositivo. Si hay que
+        conectar, el tiempo e intentos quedan en `timings` (fase connect).
+        La sesión puede venir de un poll anterior y estar muerta del lado del
+        reloj: fn la detecta en su primer comando y llama reconnect().
+        """
+        key = (ip, int(port))
+        with self._device_lock(key):
+            session = self._sessions.pop(key, None)
+            if session is not None and time.monotonic() - session.last_used > self._max_idle:
+                self._close(session)
+                session = None
+
+            if session is None:
+                session = self._connect(ip, port, timings)
+            else:
+                with self._lock:
+                    self._reuses += 1
+
+            try:
+                result = fn(session)
+            except Exception as e:
+                if is_session_error(e):
+                    self._close(session)
+                else:
+                    # error de DB u otro: la conexión al reloj sigue sirviendo
+                    session.last_used = time.monotonic()
+                    self._sessions[key] = session
+                raise
+
+            session.last_used = time.monotonic()
+            self._sessions[key] = session
+            return result
+
+    def has_session(self, ip: str, port: int) -> bool:
+        """Hay una sesión abierta (no vencida por inactividad) que el siguiente run() va a reutilizar."""
+        with self._lock:
+            session = self._sessions.get((ip, int(port)))
+        return session is not None and time.monotonic() - session.last_used <= self._max_idle
+
+    def reconnect(self, session: DeviceSession, timings: Optional[PhaseTimings] = None) -> None:
+        """
+        Reemplaza la conexión de `session` por una nueva (dentro de run(), con
+        el lock del dispositivo tomado). Lo usan los reintentos por fase para
+        no repetir las fases que ya terminaron, y el primer comando de un
+        poll/batch si la sesión reutilizada ya estaba muerta.
+        """
+        self._close(session)
+        with self._lock:
+            self._reconnects += 1
+        fresh = self._connect(session.ip, session.port, timings)
+        session.conn = fresh.conn
+        session.connected_at = fresh.connected_at
+        session.last_used = fresh.last_used
+
+    def drop(self, ip: str, port: int) -> None:
+        key = (ip, int(port))
+        with self._device_lock(key):
+            session = self._sessions.pop(key, None)
+            if session is not None:
+                self._close(session)
+
+    def close_all(self) -> None:
+        for ip, port in list(self._sessions):
+            self.drop(ip, port)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        connects/reuses acumulados y el costo promedio de un connect(); el
+        ahorro estimado es reuses * costo promedio.
+        """
+        with self._lock:
+            avg = (self._connect_seconds / self._connects) if self._connects else 0.0
+            return {
+                "open_sessions": len(self._sessions),
+                "connects": self._connects,
+                "reuses": self._reuses,
+                "reconnects": self._reconnects,
+                "avg_connect_seconds": avg,
+                "saved_seconds": avg * self._reuses,
+            }
+
+
+# sesiones compartidas por el poller y el user sync del mismo proceso
+SESSIONS = DeviceSessionPool(
+    max_idle_seconds=device_settings.session_max_idle_seconds,
+    omit_ping=device_settings.omit_ping,
+)
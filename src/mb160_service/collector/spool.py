@@ -0,0 +1,295 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from mb160_service.collector.watermark import ingest_transaction
+
+log = logging.getLogger("mb160.spool")
+
+# errores de conexión (VPN caída, SQL Server reiniciando): los marcajes se quedan en el spool
+DB_UNAVAILABLE = (OperationalError, InterfaceError)
+
+_COLUMNS = (
+    "DispositivoSerial", "DispositivoIP", "UsuarioDispositivo", "UsuarioNombre",
+    "EventoFechaHora", "Punch", "Estado", "WorkCode",
+)
+
+_DDL = """
+    CREATE TABLE IF NOT EXISTS SpoolMarcaje (
+        SpoolID              INTEGER PRIMARY KEY AUTOINCREMENT,
+        DispositivoSerial    TEXT NOT NULL,
+        DispositivoIP        TEXT NULL,
+        UsuarioDispositivo   TEXT NOT NULL,
+        UsuarioNombre        TEXT NULL,
+        EventoFechaHora      TEXT NOT NULL,
+        Punch                INTEGER NOT NULL,
+        Estado               INTEGER NOT NULL,
+        WorkCode             INTEGER NULL,
+        Intentos             INTEGER NOT NULL DEFAULT 0,
+        FechaSpool           TEXT NOT NULL,
+        UNIQUE (DispositivoSerial, UsuarioDispositivo, EventoFechaHora, Punch, Estado)
+    )
+"""
+
+_INSERT = f"""
+    INSERT OR IGNORE INTO SpoolMarcaje ({", ".join(_COLUMNS)}, FechaSpool)
+    VALUES ({", ".join("?" for _ in _COLUMNS)}, ?)
+"""
+
+_DELETE_KEY = """
+    DELETE FROM SpoolMarcaje
+    WHERE DispositivoSerial = ? AND UsuarioDispositivo = ? AND EventoFechaHora = ?
+      AND Punch = ? AND Estado = ?
+"""
+
+
+def _key(row: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (
+        row["DispositivoSerial"], row["UsuarioDispositivo"], row["EventoFechaHora"].isoformat(sep=" "),
+        row["Punch"], row["Estado"],
+    )
+
+
+class Spool:
+    """
+    Write-ahead local de marcajes normalizados (SQLite embebido, stdlib).
+
+    Las filas se guardan en cuanto se descargan, antes de tocar SQL Server;
+    cuando el INSERT en dbo.AsistenciaMarcaje confirma se borran (discard).
+    Si la DB no está disponible se quedan aquí y SpoolDrainer las reenvía
+    después en batches grandes. La llave UNIQUE es la misma de
+    UQ_AsistenciaMarcaje_Dedupe, así que volver a descargar un log ya
+    encolado no lo duplica, y el reenvío es idempotente contra la DB.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.RLock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # se abre en el primer uso: importar el poller no crea el archivo
+        with self._lock:
+            if self._db is None:
+                folder = os.path.dirname(self._path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=FULL")
+                conn.execute(_DDL)
+                self._db = conn
+            return self._db
+
+    def append(self, rows: List[Dict[str, Any]]) -> int:
+        """Guarda las filas (una transacción con fsync). Regresa cuántas eran nuevas."""
+        if not rows:
+            return 0
+        now = datetime.now().isoformat(sep=" ", timespec="seconds")
+        params = [
+            tuple(r[c].isoformat(sep=" ") if c == "EventoFechaHora" else r[c] for c in _COLUMNS) + (now,)
+            for r in rows
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(_INSERT, params)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def discard(self, rows: List[Dict[str, Any]]) -> None:
+        """Quita filas que ya quedaron en la DB (insertadas o duplicadas)."""
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(_DELETE_KEY, [_key(r) for r in rows])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def take(self, limit: int) -> Tuple[List[int], List[Dict[str, Any]]]:
+        """Las `limit` filas más viejas: (SpoolIDs, filas con el formato de insert_rows)."""
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT SpoolID, {', '.join(_COLUMNS)} FROM SpoolMarcaje ORDER BY SpoolID LIMIT ?",
+                (max(1, int(limit)),),
+            )
+            records = cur.fetchall()
+        ids: List[int] = []
+        rows: List[Dict[str, Any]] = []
+        for rec in records:
+            ids.append(rec[0])
+            row = dict(zip(_COLUMNS, rec[1:]))
+            row["EventoFechaHora"] = datetime.fromisoformat(row["EventoFechaHora"])
+            rows.append(row)
+        return ids, rows
+
+    def ack(self, ids: List[int]) -> None:
+        """Borra por SpoolID lo que el drainer ya confirmó en la DB."""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("DELETE FROM SpoolMarcaje WHERE SpoolID = ?", [(i,) for i in ids])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def mark_failed(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE SpoolMarcaje SET Intentos = Intentos + 1 WHERE SpoolID = ?", [(i,) for i in ids]
+            )
+
+    def pending(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM SpoolMarcaje").fetchone()[0])
+
+    def stats(self) -> Dict[str, Any]:
+        """Filas pendientes, por dispositivo, y el marcaje/spool más viejo."""
+        with self._lock:
+            total, oldest_event, oldest_spool = self._conn.execute(
+                "SELECT COUNT(*), MIN(EventoFechaHora), MIN(FechaSpool) FROM SpoolMarcaje"
+            ).fetchone()
+            by_device = dict(self._conn.execute(
+                "SELECT DispositivoSerial, COUNT(*) FROM SpoolMarcaje GROUP BY DispositivoSerial"
+            ).fetchall())
+        return {
+            "pending": int(total or 0),
+            "by_device": by_device,
+            "oldest_event": oldest_event,
+            "oldest_spooled_at": oldest_spool,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def drain_once(engine, spool: Spool, *, batch_rows: int = 5000, batch_size: Optional[int] = None) -> Tuple[int, int, int]:
+    """
+    Reenvía un batch del spool a dbo.AsistenciaMarcaje con el merge por
+    staging (idempotente: lo que ya existe cuenta como duplicado) y lo borra
+    del spool tras el commit. Regresa (enviadas, inserted, dup_skipped).
+    Los errores de la DB se propagan; las filas se quedan en el spool.
+    """
+    from mb160_service.collector.poller import insert_rows
+
+    ids, rows = spool.take(batch_rows)
+    if not rows:
+        return 0, 0, 0
+    try:
+        with ingest_transaction(engine) as dbconn:
+            inserted, dup_skipped = insert_rows(dbconn, rows, batch_size=batch_size, staging=True)
+    except Exception:
+        spool.mark_failed(ids)
+        raise
+    spool.ack(ids)
+    return len(rows), inserted, dup_skipped
+
+
+def drain_all(engine, spool: Spool, *, batch_rows: int = 5000) -> Tuple[int, int]:
+    """Vacía el spool (para scripts de una sola corrida). Regresa (inserted, dup_skipped)."""
+    inserted = dup_skipped = 0
+    while True:
+        sent, ins, dup = drain_once(engine, spool, batch_rows=batch_rows)
+        if not sent:
+            return inserted, dup_skipped
+        inserted += ins
+        dup_skipped += dup
+
+
+class SpoolDrainer:
+    """
+    Hilo que vacía el spool hacia SQL Server. Mientras haya filas manda
+    batches de `batch_rows` seguidos; si la DB no responde espera con backoff
+    exponencial (de `interval_seconds` hasta `max_backoff_seconds`) sin
+    afectar el polling de los dispositivos.
+    """
+
+    def __init__(
+        self,
+        engine,
+        spool: Spool,
+        *,
+        batch_rows: int = 5000,
+        interval_seconds: float = 5.0,
+        max_backoff_seconds: float = 300.0,
+    ):
+        self._engine = engine
+        self._spool = spool
+        self._batch_rows = max(1, int(batch_rows))
+        self._interval = max(0.1, float(interval_seconds))
+        self._max_backoff = max(self._interval, float(max_backoff_seconds))
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.drained = 0
+        self.inserted = 0
+        self.failures = 0
+
+    def start(self) -> "SpoolDrainer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="mb160-spool-drainer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        backoff = self._interval
+        while not self._stopping.is_set():
+            try:
+                sent, inserted, dup_skipped = drain_once(self._engine, self._spool, batch_rows=self._batch_rows)
+            except DB_UNAVAILABLE as e:
+                self.failures += 1
+                log.warning(
+                    "Spool: DB no disponible, reintento en %.0fs | pendientes=%d | %s",
+                    backoff, self._spool.pending(), e.__class__.__name__,
+                )
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self._max_backoff)
+                continue
+            except Exception as e:
+                self.failures += 1
+                log.exception("Spool: error al drenar: %s", e)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self._max_backoff)
+                continue
+
+            backoff = self._interval
+            if not sent:
+                self._stopping.wait(self._interval)
+                continue
+            self.drained += sent
+            self.inserted += inserted
+            log.info(
+                "Spool drenado | filas=%d | inserted=%d | dup_skipped=%d | pendientes=%d",
+                sent, inserted, dup_skipped, self._spool.pending(),
+            )
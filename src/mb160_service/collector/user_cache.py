@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Dict, FrozenSet, Set
+
+from mb160_service.config import get_device_settings
+
+log = logging.getLogger("mb160.user_cache")
+
+device_settings = get_device_settings()
+
+
+def parse_rosters(raw: str) -> Dict[str, str]:
+    """
+    USER_MAP_ROSTERS=planta=SERIAL1|SERIAL2,oficina=SERIAL3|SERIAL4
+    -> {"SERIAL1": "planta", "SERIAL2": "planta", "SERIAL3": "oficina", ...}
+    """
+    rosters: Dict[str, str] = {}
+    for group in (raw or "").split(","):
+        name, _, serials = group.partition("=")
+        name = name.strip()
+        if not name:
+            continue
+        for serial in serials.split("|"):
+            serial = serial.strip()
+            if serial:
+                rosters[serial] = name
+    return rosters
+
+
+@dataclass
+class _Entry:
+    user_map: Dict[str, str]
+    user_count: Optional[int]  # conteo del dispositivo que llenó la entrada
+    expires_at: float
+    base_ids: FrozenSet[str] = frozenset()
+    # user_ids que upsert_user agregó a cada dispositivo (serial -> ids) fuera de base_ids
+    added: Dict[str, Set[str]] = field(default_factory=dict)
+
+    def expected_count(self, device_serial: str) -> Optional[int]:
+        if self.user_count is None:
+            return None
+        return self.user_count + len(self.added.get(device_serial, ()))
+
+
+class UserMapCache:
+    """
+    Cache de user_id -> name por DispositivoSerial para no llamar get_users()
+    en cada poll. Una entrada se invalida si el conteo de usuarios del
+    dispositivo (read_sizes) cambia o si vence el TTL.
+
+    Dispositivos con la misma plantilla se pueden agrupar en `rosters`
+    (serial -> nombre de grupo) para compartir una sola entrada; el conteo
+    esperado es por dispositivo (un set_user en uno no cambia el de los demás).
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, rosters: Optional[Dict[str, str]] = None):
+        self._ttl = max(0, int(ttl_seconds))
+        self._rosters = dict(rosters or {})
+        self._lock = threading.Lock()
+        self._items: Dict[str, _Entry] = {}
+
+    def _key(self, device_serial: str) -> str:
+        return self._rosters.get(device_serial, device_serial)
+
+    def get(self, device_serial: str, user_count: Optional[int]) -> Optional[Dict[str, str]]:
+        with self._lock:
+            entry = self._items.get(self._key(device_serial))
+            if entry is None:
+                return None
+            if time.monotonic() >= entry.expires_at:
+                return None
+            expected = entry.expected_count(device_serial)
+            if user_count is not None and expected is not None and user_count != expected:
+                return None
+            return entry.user_map
+
+    def put(self, device_serial: str, user_map: Dict[str, str], user_count: Optional[int]) -> None:
+        with self._lock:
+            self._items[self._key(device_serial)] = _Entry(
+                user_map=dict(user_map),
+                user_count=user_count,
+                expires_at=time.monotonic() + self._ttl,
+                base_ids=frozenset(user_map),
+            )
+
+    def upsert_user(self, device_serial: str, user_id: str, name: str) -> None:
+        """
+        Refleja un set_user() recién hecho (user_sync) sin esperar a que el
+        conteo cambie y fuerce un get_users() completo.
+        """
+        with self._lock:
+            entry = self._items.get(self._key(device_serial))
+            if entry is None:
+                return
+            user_id = str(user_id).strip()
+            if user_id not in entry.base_ids:
+                # sólo este dispositivo tiene un usuario más; los demás del roster no cambian
+                entry.added.setdefault(device_serial, set()).add(user_id)
+            user_map = dict(entry.user_map)  # copy-on-write: los polls leen sin lock
+            user_map[user_id] = str(name).strip()
+            entry.user_map = user_map
+
+    def invalidate(self, device_serial: str) -> None:
+        with self._lock:
+            self._items.pop(self._key(device_serial), None)
+
+
+# cache compartido entre el poller de asistencia y el worker de user sync
+USER_MAPS = UserMapCache(
+    ttl_seconds=device_settings.user_map_ttl_seconds,
+    rosters=parse_rosters(device_settings.user_map_rosters),
+)
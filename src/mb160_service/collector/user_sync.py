@@ -1,13 +1,15 @@
 import time
 import logging
 import inspect
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
 
 from sqlalchemy import text
 from sqlalchemy.exc import OperationalError
 
+from mb160_service.collector.sessions import SESSIONS, DeviceSession, DeviceSessionPool, is_session_error
+from mb160_service.collector.user_cache import USER_MAPS
 from mb160_service.config import get_device_settings
 
 log = logging.getLogger("mb160.user_sync")
@@ -51,6 +53,30 @@ def _dequeue_batch(dbconn, batch_size: int) -> List[Dict[str, Any]]:
     return [dict(r) for r in rows]
 
 
+def _has_pending(dbconn) -> bool:
+    """Sólo lectura: ¿hay algo en Pendiente/Error? (no toma filas ni suma Intentos)."""
+    q = text("""
+        SELECT CASE WHEN EXISTS (
+            SELECT 1 FROM dbo.MB160UserSyncQueue WHERE Estatus IN (0, 3)
+        ) THEN 1 ELSE 0 END
+    """)
+    return bool(dbconn.execute(q).scalar())
+
+
+def _release(dbconn, queue_id: int) -> None:
+    """Regresa a Pendiente una fila tomada que no llegó al reloj, sin contar el intento."""
+    dbconn.execute(
+        text("""
+            UPDATE dbo.MB160UserSyncQueue
+            SET Estatus = 0,
+                Intentos = CASE WHEN Intentos > 0 THEN Intentos - 1 ELSE 0 END,
+                UltimoCambio = SYSDATETIME()
+            WHERE MB160UserSyncQueueID = :id
+        """),
+        {"id": queue_id},
+    )
+
+
 def _mark_done(dbconn, queue_id: int) -> None:
     dbconn.execute(
         text("""
@@ -114,38 +140,92 @@ def _set_user_compat(conn_dev, *, user_id: str, name: str) -> None:
     fn(0, str(name), 0, "", "", str(user_id), 0)
 
 
+# solo errores de la DB: los reintentos de conexión al reloj ya los hace
+# DeviceSessionPool (POLL_RETRY_CONNECT) y repetir aquí volvería a sacar el
+# batch de la cola (Intentos + 1 por cada vuelta)
 @retry(
     wait=wait_exponential(multiplier=1, min=2, max=30),
     stop=stop_after_attempt(10),
-    retry=retry_if_exception_type((OperationalError, OSError, TimeoutError)),
+    retry=retry_if_exception_type(OperationalError),
     reraise=True,
 )
-def sync_users_once(engine) -> None:
-    if not MB160_IP:
+def sync_users_once(
+    engine,
+    *,
+    device_ip: Optional[str] = None,
+    device_port: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    sessions: Optional[DeviceSessionPool] = None,
+) -> int:
+    """
+    Procesa un batch de dbo.MB160UserSyncQueue. Regresa cuántas filas tomó
+    (0 = cola vacía).
+
+    El batch se saca de la cola (Estatus=1, Intentos+1) ya con la sesión del
+    reloj abierta. Si el reloj no responde, las filas que no llegaron a él
+    regresan a Pendiente sin contar el intento: un reloj apagado no hace
+    girar la cola ni sube Intentos en cada ciclo.
+    """
+    target_ip = (device_ip or MB160_IP or "").strip()
+    target_port = int(device_port or MB160_PORT)
+    if not target_ip:
         raise RuntimeError("MB160_IP no está definido en .env")
 
-    from zk import ZK  # type: ignore
+    # si no hay pendientes no se toca el reloj
+    with engine.connect() as dbconn:
+        if not _has_pending(dbconn):
+            return 0
+
+    pool = sessions or SESSIONS
+    taken: List[Dict[str, Any]] = []
+    pending: Dict[int, Dict[str, Any]] = {}
+
+    def _sync(session: DeviceSession) -> None:
+        with engine.begin() as dbconn:
+            taken.extend(_dequeue_batch(dbconn, batch_size or USER_SYNC_BATCH_SIZE))
+        pending.update((int(item["MB160UserSyncQueueID"]), item) for item in taken)
+        if pending:
+            _push_batch(engine, session, pending, pool)
 
-    zk = ZK(MB160_IP, port=MB160_PORT, timeout=10, password=0)
-    conn_dev = None
+    try:
+        pool.run(target_ip, target_port, _sync)
+    except Exception as e:
+        # no dejar filas en 'Procesando' (las ya marcadas no se tocan)
+        with engine.begin() as dbconn:
+            for qid in pending:
+                if is_session_error(e):
+                    _release(dbconn, qid)
+                else:
+                    _mark_error(dbconn, qid, f"{type(e).__name__}: {e}")
+        raise
+    return len(taken)
 
+
+def _disable(conn_dev) -> None:
     try:
-        conn_dev = zk.connect()
-        try:
-            conn_dev.disable_device()
-        except Exception:
-            pass
+        conn_dev.disable_device()
+    except Exception:
+        pass
 
-        try:
-            device_serial = conn_dev.get_serialnumber() or MB160_IP
-        except Exception:
-            device_serial = MB160_IP
 
-        with engine.begin() as dbconn:
-            batch = _dequeue_batch(dbconn, USER_SYNC_BATCH_SIZE)
+def _push_batch(
+    engine,
+    session: DeviceSession,
+    pending: Dict[int, Dict[str, Any]],
+    pool: DeviceSessionPool,
+) -> None:
+    """
+    set_user fila por fila y su Estatus en la cola; cada fila marcada sale de
+    `pending`. Si se cae el socket (o la sesión reutilizada ya estaba muerta)
+    se reconecta una vez y se reintenta la fila; una segunda caída aborta el
+    batch (lo que quede en `pending` lo regresa sync_users_once).
+    """
+    device_serial = session.serial
+    batch = list(pending.values())
+    reconnected = False
 
-        if not batch:
-            return
+    try:
+        _disable(session.conn)
 
         ok_count = 0
         err_count = 0
@@ -157,16 +237,31 @@ def sync_users_once(engine) -> None:
             name = str(item["UsuarioNombre"])
 
             try:
-                _set_user_compat(conn_dev, user_id=user_id, name=name)
+                try:
+                    _set_user_compat(session.conn, user_id=user_id, name=name)
+                except Exception as e:
+                    if reconnected or not is_session_error(e):
+                        raise
+                    log.warning("UserSync reconectando | device=%s | %s: %s", device_serial, type(e).__name__, e)
+                    reconnected = True
+                    pool.reconnect(session)
+                    _disable(session.conn)
+                    _set_user_compat(session.conn, user_id=user_id, name=name)
+                # el poller ve el nombre nuevo sin esperar a un get_users() completo
+                USER_MAPS.upsert_user(device_serial, user_id, name)
 
                 with engine.begin() as dbconn:
                     _mark_done(dbconn, qid)
 
                 ok_count += 1
             except Exception as e:
+                if is_session_error(e):
+                    # sin conexión el resto de las filas fallaría igual
+                    raise
                 with engine.begin() as dbconn:
                     _mark_error(dbconn, qid, str(e))
                 err_count += 1
+            pending.pop(qid, None)
 
         log.info(
             "UserSync OK | device=%s | processed=%d | ok=%d | error=%d",
@@ -174,15 +269,10 @@ def sync_users_once(engine) -> None:
         )
 
     finally:
-        if conn_dev:
-            try:
-                conn_dev.enable_device()
-            except Exception:
-                pass
-            try:
-                conn_dev.disconnect()
-            except Exception:
-                pass
+        try:
+            session.conn.enable_device()
+        except Exception:
+            pass
 
 
 def run_user_sync_forever(engine) -> None:
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from mb160_service.config import get_device_settings
+from mb160_service.utils.filelock import file_lock
+
+log = logging.getLogger("mb160.watermark")
+
+device_settings = get_device_settings()
+
+# dbconn.info: seriales con marcajes nuevos en la transacción en curso
+_PENDING = "mb160.ingested_devices"
+
+
+@dataclass(frozen=True)
+class WatermarkSnapshot:
+    """
+    Versión de ingesta por DispositivoSerial tal como estaba publicada al
+    leerla. La versión cambia cada vez que se confirma una transacción con
+    marcajes nuevos del dispositivo.
+    """
+    devices: Dict[str, int] = field(default_factory=dict)
+
+    def token(self, device_serial: Optional[str] = None) -> str:
+        """Versión de un dispositivo; sin serial, un digest de todos (cambia si cambia cualquiera)."""
+        if device_serial:
+            return str(self.devices.get(device_serial, 0))
+        raw = json.dumps(self.devices, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class IngestWatermarks:
+    """
+    Watermark de ingesta por dispositivo para la cache de respuestas de la
+    API. El collector lo publica después de cada commit con marcajes nuevos
+    (ingest_transaction) en un JSON local (escritura atómica con os.replace);
+    la API lo lee sin tocar la DB y sólo vuelve a parsear el archivo si
+    cambió (stat).
+
+    Varios procesos pueden publicar al mismo archivo (collector, pulls por
+    cron): leer-modificar-escribir corre bajo un lock de archivo
+    (`<path>.lock`), así no se pierde la versión que publicó otro proceso.
+
+    path vacío/None = no se publica (la API no cachea).
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path or None
+        self._lock = threading.Lock()
+        self._stat: Optional[Tuple[int, int, int]] = None
+        self._snapshot = WatermarkSnapshot()
+
+    @property
+    def enabled(self) -> bool:
+        return self._path is not None
+
+    def _read(self) -> Dict[str, int]:
+        if not self._path or not os.path.exists(self._path):
+            return {}
+        try:
+            with open(self._path, "r", encoding="utf-8") as fh:
+                raw = json.load(fh)
+            return {str(serial): int(item["version"]) for serial, item in raw.get("devices", {}).items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            log.warning("No se pudo leer watermarks de ingesta (%s). Error=%s", self._path, e)
+            return {}
+
+    def publish(self, device_serials: Iterable[str]) -> None:
+        serials = {s for s in device_serials if s}
+        if not self._path or not serials:
+            return
+        with self._lock:
+            try:
+                # file_lock crea la carpeta si hace falta
+                with file_lock(f"{self._path}.lock"):
+                    devices = self._read()
+                    now = time.time_ns()
+                    for serial in serials:
+                        devices[serial] = max(now, devices.get(serial, 0) + 1)
+                    payload = {
+                        "updated_at": datetime.now().isoformat(),
+                        "devices": {serial: {"version": version} for serial, version in devices.items()},
+                    }
+                    tmp = f"{self._path}.{os.getpid()}.tmp"
+                    with open(tmp, "w", encoding="utf-8") as fh:
+                        json.dump(payload, fh, indent=2, sort_keys=True)
+                    os.replace(tmp, self._path)
+            except OSError as e:
+                log.warning("No se pudo publicar watermarks de ingesta (%s). Error=%s", self._path, e)
+                return
+            self._stat = None
+
+    def snapshot(self) -> WatermarkSnapshot:
+        """Lo publicado (para la API). Sin cambios en el archivo no se vuelve a leer."""
+        if not self._path:
+            return self._snapshot
+        try:
+            st = os.stat(self._path)
+            stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except OSError:
+            stat = None
+        with self._lock:
+            if stat is None or stat != self._stat:
+                self._snapshot = WatermarkSnapshot(self._read())
+                self._stat = stat
+            return self._snapshot
+
+
+def note_ingested(dbconn, rows: Iterable[Dict[str, Any]]) -> None:
+    """Lo que llama insert_rows: marca los dispositivos del lote para publicarlos al confirmar."""
+    dbconn.info.setdefault(_PENDING, set()).update(row["DispositivoSerial"] for row in rows)
+
+
+@contextmanager
+def ingest_transaction(engine, watermarks: Optional["IngestWatermarks"] = None) -> Iterator[Any]:
+    """
+    engine.begin() que, si la transacción se confirma, publica el watermark
+    de los dispositivos con marcajes nuevos. Se publica después del commit:
+    la API nunca guarda en cache datos sin confirmar con una versión nueva.
+    """
+    watermarks = watermarks or WATERMARKS
+    with engine.begin() as dbconn:
+        # info vive con la conexión del pool: limpiar lo de una transacción anterior que falló
+        dbconn.info.pop(_PENDING, None)
+        yield dbconn
+        pending = dbconn.info.pop(_PENDING, set())
+    watermarks.publish(pending)
+
+
+# compartido por collector (publica) y API (lee)
+WATERMARKS = IngestWatermarks(device_settings.ingest_watermark_file)
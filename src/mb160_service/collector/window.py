@@ -0,0 +1,86 @@
+"""
+Selección de ventanas de tiempo sobre las fechas de un AttendanceBatch.
+
+El log del reloj viene ordenado por fecha salvo, a veces, una cola corta
+(cambio de hora del reloj, registros reinsertados). WindowIndex revisa una
+vez hasta dónde llega el prefijo ordenado: las ventanas se cortan en ese
+prefijo por bisección y la cola se revisa registro por registro. Si la cola
+desordenada es grande, se ordena todo una sola vez y se bisecta completo.
+Un mismo índice sirve para varias ventanas (p.ej. varios días de un pull).
+"""
+import bisect
+import itertools
+import operator
+from array import array
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# cola desordenada máxima (fracción del batch) antes de ordenar todo
+_SORT_TAIL_RATIO = 8
+
+_MIN = -(1 << 62)
+_MAX = 1 << 62
+
+Bounds = Tuple[Optional[int], Optional[int]]  # [lo, hi) en segundos; None = sin límite
+
+
+class TimeWindow(NamedTuple):
+    """Ventana [min_ts, max_ts); None = sin límite."""
+    min_ts: Optional[datetime] = None
+    max_ts: Optional[datetime] = None
+
+
+def sorted_prefix(ts: Sequence[int]) -> int:
+    """Largo del prefijo no decreciente de `ts`."""
+    # primer i con ts[i-1] > ts[i]
+    breaks = itertools.compress(itertools.count(1), map(operator.gt, ts, itertools.islice(ts, 1, None)))
+    return next(breaks, len(ts))
+
+
+class WindowIndex:
+    """Índice de bisección sobre una columna de fechas (epoch); ver docstring del módulo."""
+
+    __slots__ = ("_ts", "_keys", "_order", "_prefix", "sorted")
+
+    def __init__(self, ts: array):
+        self._ts = ts
+        n = len(ts)
+        prefix = sorted_prefix(ts)
+        self.sorted = prefix == n
+        self._order: Optional[List[int]] = None
+        if n - prefix > n // _SORT_TAIL_RATIO:
+            self._order = sorted(range(n), key=ts.__getitem__)
+            self._keys = array("q", map(ts.__getitem__, self._order))
+            self._prefix = n
+        else:
+            self._keys = ts
+            self._prefix = prefix
+
+    def _span(self, lo: Optional[int], hi: Optional[int]) -> Tuple[int, int]:
+        end = self._prefix
+        start = 0 if lo is None else bisect.bisect_left(self._keys, lo, 0, end)
+        stop = end if hi is None else bisect.bisect_left(self._keys, hi, 0, end)
+        return start, max(start, stop)
+
+    def indexes(self, lo: Optional[int], hi: Optional[int]) -> Sequence[int]:
+        """Posiciones con lo <= ts < hi (la parte ordenada primero, luego la cola)."""
+        return self.indexes_many([(lo, hi)])[0]
+
+    def indexes_many(self, bounds: List[Bounds]) -> List[Sequence[int]]:
+        """Posiciones de cada ventana; la cola desordenada se recorre una sola vez."""
+        spans = [self._span(lo, hi) for lo, hi in bounds]
+        if self._order is not None:
+            return [self._order[start:stop] for start, stop in spans]
+
+        n = len(self._ts)
+        if self._prefix == n:
+            return [range(start, stop) for start, stop in spans]
+
+        out: List[List[int]] = [list(range(start, stop)) for start, stop in spans]
+        limits = [(_MIN if lo is None else lo, _MAX if hi is None else hi) for lo, hi in bounds]
+        for i in range(self._prefix, n):
+            t = self._ts[i]
+            for selected, (lo_v, hi_v) in zip(out, limits):
+                if lo_v <= t < hi_v:
+                    selected.append(i)
+        return out
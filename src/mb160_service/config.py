@@ -1,10 +1,14 @@
 import os
 from dataclasses import dataclass
+from pathlib import Path
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# raíz del repo (la misma que usa bootstrap.py): los archivos de state/ no dependen del cwd
+ROOT = Path(__file__).resolve().parents[2]
+
 
 def _env_int(var: str, default: int) -> int:
     try:
@@ -13,6 +17,26 @@ def _env_int(var: str, default: int) -> int:
         return default
 
 
+def _env_path(var: str, default: str) -> str:
+    """
+    Ruta de archivo/carpeta local. Relativa = respecto a la raíz del repo, así
+    collector, scripts por cron y API ven el mismo archivo sin importar desde
+    dónde se lancen. Vacía = deshabilitado ("").
+    """
+    raw = os.environ.get(var, default).strip()
+    if not raw:
+        return ""
+    path = Path(raw).expanduser()
+    return str(path if path.is_absolute() else ROOT / path)
+
+
+def _env_bool(var: str, default: bool = False) -> bool:
+    raw = os.environ.get(var)
+    if raw is None or not raw.strip():
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "si", "sí")
+
+
 @dataclass(frozen=True)
 class DBSettings:
     host: str
@@ -32,11 +56,39 @@ class DeviceSettings:
     pull_interval_seconds: int = 60
     user_sync_interval_seconds: int = 10
     user_sync_batch_size: int = 20
+    insert_batch_size: int = 500
+    checkpoint_file: str = "state/checkpoints.json"
+    user_map_ttl_seconds: int = 3600
+    user_map_rosters: str = ""
+    breaker_failure_threshold: int = 3
+    breaker_cooldown_seconds: int = 60
+    breaker_max_cooldown_seconds: int = 900
+    breaker_probe_timeout_seconds: int = 2
+    device_health_file: str = "state/device_health.json"
+    session_max_idle_seconds: int = 900
+    omit_ping: bool = False
+    spool_file: str = "state/spool.db"
+    spool_drain_batch_rows: int = 5000
+    spool_drain_interval_seconds: int = 5
+    poll_retry_connect: int = 3
+    poll_retry_users: int = 2
+    poll_retry_attendance: int = 3
+    poll_retry_persist: int = 5
+    poll_retry_max_wait_seconds: int = 30
+    stream_attendance: bool = True
+    dump_cache_dir: str = "state/dumps"
+    dump_cache_max_mb: int = 512
+    daily_rollup: bool = True
+    ingest_watermark_file: str = "state/ingest_watermarks.json"
 
 
 @dataclass(frozen=True)
 class ApiSettings:
     port: int = 8000
+    export_chunk_rows: int = 5000
+    marks_cache_entries: int = 1024
+    marks_cache_max_mb: int = 64
+    marks_cache_max_age_seconds: int = 300
 
 
 def get_db_settings() -> DBSettings:
@@ -59,8 +111,38 @@ def get_device_settings() -> DeviceSettings:
         pull_interval_seconds=_env_int("PULL_INTERVAL_SECONDS", 60),
         user_sync_interval_seconds=_env_int("USER_SYNC_INTERVAL_SECONDS", 10),
         user_sync_batch_size=_env_int("USER_SYNC_BATCH_SIZE", 20),
+        insert_batch_size=_env_int("INSERT_BATCH_SIZE", 500),
+        checkpoint_file=_env_path("CHECKPOINT_FILE", "state/checkpoints.json"),
+        user_map_ttl_seconds=_env_int("USER_MAP_TTL_SECONDS", 3600),
+        user_map_rosters=os.environ.get("USER_MAP_ROSTERS", ""),
+        breaker_failure_threshold=_env_int("BREAKER_FAILURE_THRESHOLD", 3),
+        breaker_cooldown_seconds=_env_int("BREAKER_COOLDOWN_SECONDS", 60),
+        breaker_max_cooldown_seconds=_env_int("BREAKER_MAX_COOLDOWN_SECONDS", 900),
+        breaker_probe_timeout_seconds=_env_int("BREAKER_PROBE_TIMEOUT_SECONDS", 2),
+        device_health_file=_env_path("DEVICE_HEALTH_FILE", "state/device_health.json"),
+        session_max_idle_seconds=_env_int("SESSION_MAX_IDLE_SECONDS", 900),
+        omit_ping=_env_bool("MB160_OMIT_PING", False),
+        spool_file=_env_path("SPOOL_FILE", "state/spool.db"),
+        spool_drain_batch_rows=_env_int("SPOOL_DRAIN_BATCH_ROWS", 5000),
+        spool_drain_interval_seconds=_env_int("SPOOL_DRAIN_INTERVAL_SECONDS", 5),
+        poll_retry_connect=_env_int("POLL_RETRY_CONNECT", 3),
+        poll_retry_users=_env_int("POLL_RETRY_USERS", 2),
+        poll_retry_attendance=_env_int("POLL_RETRY_ATTENDANCE", 3),
+        poll_retry_persist=_env_int("POLL_RETRY_PERSIST", 5),
+        poll_retry_max_wait_seconds=_env_int("POLL_RETRY_MAX_WAIT_SECONDS", 30),
+        stream_attendance=_env_bool("MB160_STREAM_ATTENDANCE", True),
+        dump_cache_dir=_env_path("DUMP_CACHE_DIR", "state/dumps"),
+        dump_cache_max_mb=_env_int("DUMP_CACHE_MAX_MB", 512),
+        daily_rollup=_env_bool("DAILY_ROLLUP", True),
+        ingest_watermark_file=_env_path("INGEST_WATERMARK_FILE", "state/ingest_watermarks.json"),
     )
 
 
 def get_api_settings() -> ApiSettings:
-    return ApiSettings(port=_env_int("API_PORT", 8000))
+    return ApiSettings(
+        port=_env_int("API_PORT", 8000),
+        export_chunk_rows=max(1, _env_int("EXPORT_CHUNK_ROWS", 5000)),
+        marks_cache_entries=max(0, _env_int("MARKS_CACHE_ENTRIES", 1024)),
+        marks_cache_max_mb=max(0, _env_int("MARKS_CACHE_MAX_MB", 64)),
+        marks_cache_max_age_seconds=max(0, _env_int("MARKS_CACHE_MAX_AGE_SECONDS", 300)),
+    )
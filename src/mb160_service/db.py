@@ -7,13 +7,16 @@ from sqlalchemy.engine import Engine
 from mb160_service.config import DBSettings, get_db_settings
 
 
-def build_engine(settings: Optional[DBSettings] = None) -> Engine:
+def build_engine(settings: Optional[DBSettings] = None, *, fast_executemany: bool = True) -> Engine:
     """
     Cross-platform (macOS + Windows) SQL Server connection using ODBC + SQLAlchemy.
     Uses odbc_connect to handle:
       - DB names with spaces (e.g., "db_name")
       - host/port formatting
       - consistent behavior across OS
+
+    fast_executemany=True makes pyodbc send executemany() batches as a single
+    parameter array instead of one round-trip per row (bulk insert path).
     """
     s = settings or get_db_settings()
 
@@ -33,6 +36,7 @@ def build_engine(settings: Optional[DBSettings] = None) -> Engine:
         pool_pre_ping=True,
         pool_recycle=1800,  # helps with VPN/network drops
         future=True,
+        fast_executemany=fast_executemany,
     )
     return engine
 
@@ -0,0 +1,525 @@
+"""
+Simulador de checadores MB160 a nivel protocolo (TCP y UDP) para pruebas de
+carga sin hardware.
+
+Habla lo suficiente del protocolo ZK para que pyzk pueda hacer connect,
+get_serialnumber, read_sizes, get_users, get_attendance (lectura por buffer
+1503/1504, en chunks), set_user, disable/enable_device y live_capture.
+
+    with FakeDeviceFarm(22, records=5000, latency=0.02) as farm:
+        farm.targets  # [("127.0.0.1", 41234), ...]
+
+Cada dispositivo escucha TCP y UDP en el mismo puerto. `latency` se aplica a
+cada respuesta; `loss` es la probabilidad de perder un paquete: en UDP la
+petición se descarta (el cliente agota su timeout), en TCP se simula la
+retransmisión con `retransmit_seconds` de retraso extra.
+"""
+import logging
+import random
+import socket
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from mb160_service.utils import zkproto as zp
+
+log = logging.getLogger("mb160.fake_device")
+
+_USER_72 = struct.Struct("<HB8s24sIx7sx24s")   # formato ZK8 (MB160 por TCP)
+_USER_WRQ_28 = struct.Struct("HB5s8sIxBHI")    # set_user() de pyzk en formato ZK6
+_ATT_40 = struct.Struct("<H24sB4sB8s")
+_EVENT_32 = struct.Struct("<24sBB6s")
+_UDP_CHUNK = 1024
+
+Response = Tuple[int, bytes]
+
+
+@dataclass
+class FakeUser:
+    uid: int
+    user_id: str
+    name: str
+    privilege: int = 0
+    password: str = ""
+    group_id: str = ""
+    card: int = 0
+
+
+@dataclass
+class FakePunch:
+    user_id: str
+    timestamp: datetime
+    status: int = 1
+    punch: int = 0
+
+
+def default_users(count: int, *, prefixes: Iterable[int] = (2, 3, 4, 5)) -> List[FakeUser]:
+    """Usuarios con el primer dígito de EmpresaConfig (2..5) rotando."""
+    prefixes = list(prefixes) or [2]
+    users = []
+    for idx in range(count):
+        user_id = f"{prefixes[idx % len(prefixes)]}{idx + 1:04d}"
+        users.append(FakeUser(uid=idx + 1, user_id=user_id, name=f"Empleado {user_id}"))
+    return users
+
+
+def default_punches(users: List[FakeUser], count: int, *, seed: int = 0, end: Optional[datetime] = None) -> List[FakePunch]:
+    """
+    Registros ordenados por fecha que terminan en `end` (default: ahora),
+    repartidos entre los usuarios (determinístico por seed).
+    """
+    if not users or count <= 0:
+        return []
+    rnd = random.Random(seed)
+    ts = (end or datetime.now()).replace(microsecond=0)
+    punches = []
+    for _ in range(count):
+        punches.append(FakePunch(user_id=rnd.choice(users).user_id, timestamp=ts, status=1, punch=rnd.randint(0, 1)))
+        ts -= timedelta(seconds=rnd.randint(5, 300))
+    punches.reverse()
+    return punches
+
+
+Transport = Callable[[int, int, int, bytes], None]  # (session_id, command, reply_id, data)
+
+
+class _Session:
+    def __init__(self, session_id: int, transport: Transport):
+        self.session_id = session_id
+        self._transport = transport
+        self.buffer = b""
+        self.event_flags = 0
+
+    def send(self, command: int, reply_id: int, data: bytes = b"") -> None:
+        self._transport(self.session_id, command, reply_id, data)
+
+
+class FakeMB160:
+    """
+    Estado de un checador simulado (usuarios, registros, habilitado) y la
+    lógica de comandos; el transporte lo pone FakeMB160Server.
+    """
+
+    def __init__(
+        self,
+        serial: str,
+        *,
+        users: int = 50,
+        records: int = 1000,
+        seed: int = 0,
+        end: Optional[datetime] = None,
+        user_list: Optional[List[FakeUser]] = None,
+        punches: Optional[Iterable[FakePunch]] = None,
+        latency: float = 0.0,
+        loss: float = 0.0,
+        retransmit_seconds: float = 0.2,
+    ):
+        self.serial = serial
+        self.users: List[FakeUser] = list(user_list) if user_list is not None else default_users(users)
+        self.punches: List[FakePunch] = (
+            list(punches) if punches is not None
+            else default_punches(self.users, records, seed=seed, end=end)
+        )
+        self.latency = max(0.0, float(latency))
+        self.loss = min(1.0, max(0.0, float(loss)))
+        self.retransmit_seconds = retransmit_seconds
+        self.enabled = True
+        self.commands = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_session = 1
+        self._subscribers: List[_Session] = []
+
+    # ---- estado ----
+
+    def new_session(self, transport: Transport) -> _Session:
+        with self._lock:
+            session_id = self._next_session
+            self._next_session = self._next_session % (zp.USHRT_MAX - 1) + 1
+        return _Session(session_id, transport)
+
+    def close_session(self, session: _Session) -> None:
+        with self._lock:
+            if session in self._subscribers:
+                self._subscribers.remove(session)
+
+    def lose_packet(self) -> bool:
+        return self.loss > 0 and self._rnd.random() < self.loss
+
+    def add_punch(self, user_id: str, timestamp: Optional[datetime] = None, *, status: int = 1, punch: int = 0) -> FakePunch:
+        """Registra una checada y la manda a las sesiones en live_capture."""
+        mark = FakePunch(user_id=str(user_id), timestamp=(timestamp or datetime.now()).replace(microsecond=0),
+                         status=status, punch=punch)
+        with self._lock:
+            self.punches.append(mark)
+            subscribers = list(self._subscribers)
+        event = _EVENT_32.pack(mark.user_id.encode(), mark.status, mark.punch, zp.encode_timehex(mark.timestamp))
+        for session in subscribers:
+            try:
+                session.send(zp.CMD_REG_EVENT, 0, event)
+            except OSError:
+                self.close_session(session)
+        return mark
+
+    def random_punch(self) -> Optional[FakePunch]:
+        if not self.users:
+            return None
+        user = self._rnd.choice(self.users)
+        return self.add_punch(user.user_id, punch=self._rnd.randint(0, 1))
+
+    # ---- payloads ----
+
+    def _sizes_payload(self) -> bytes:
+        fields = [0] * 20
+        fields[4] = len(self.users)
+        fields[8] = len(self.punches)
+        fields[14], fields[15], fields[16] = 3000, 3000, 100000
+        fields[17] = 3000
+        fields[18] = max(0, 3000 - len(self.users))
+        fields[19] = max(0, 100000 - len(self.punches))
+        return struct.pack("<20i", *fields) + struct.pack("<3i", 0, 0, 0)
+
+    def _users_buffer(self) -> bytes:
+        body = b"".join(
+            _USER_72.pack(
+                u.uid, u.privilege, u.password.encode(), u.name.encode(), u.card,
+                u.group_id.encode(), u.user_id.encode(),
+            )
+            for u in self.users
+        )
+        return struct.pack("<I", len(body)) + body
+
+    def _attendance_buffer(self) -> bytes:
+        uids = {u.user_id: u.uid for u in self.users}
+        body = b"".join(
+            _ATT_40.pack(
+                uids.get(p.user_id, 0) & 0xFFFF, p.user_id.encode(), p.status,
+                struct.pack("<I", zp.encode_time(p.timestamp)), p.punch, b"",
+            )
+            for p in self.punches
+        )
+        return struct.pack("<I", len(body)) + body
+
+    def _set_user(self, data: bytes) -> None:
+        if len(data) >= _USER_72.size:
+            uid, privilege, password, name, card, group_id, user_id = _USER_72.unpack(data[:_USER_72.size])
+            user_id = user_id.split(b"\x00")[0].decode(errors="ignore")
+            group_id = group_id.split(b"\x00")[0].decode(errors="ignore")
+        else:
+            uid, privilege, password, name, card, group_id, _tz, user_id = _USER_WRQ_28.unpack(
+                data.ljust(_USER_WRQ_28.size, b"\x00")[:_USER_WRQ_28.size]
+            )
+            user_id, group_id = str(user_id), str(group_id)
+        name = name.split(b"\x00")[0].decode(errors="ignore")
+        password = password.split(b"\x00")[0].decode(errors="ignore")
+        with self._lock:
+            current = next((u for u in self.users if u.user_id == user_id), None)
+            if current is None and uid:
+                current = next((u for u in self.users if u.uid == uid), None)
+            if current is None:
+                uid = uid or max((u.uid for u in self.users), default=0) + 1
+                self.users.append(FakeUser(uid=uid, user_id=user_id, name=name, privilege=privilege,
+                                           password=password, group_id=group_id, card=card))
+            else:
+                current.user_id, current.name, current.privilege = user_id, name, privilege
+                current.password, current.group_id, current.card = password, group_id, card
+
+    def _option(self, key: str) -> Optional[str]:
+        return {
+            "~SerialNumber": self.serial,
+            "~Platform": "ZMM220_TFT",
+            "~DeviceName": "MB160",
+            "MAC": "00:17:61:00:00:00",
+            "~ZKFPVersion": "10",
+            "ZKFaceVersion": "7",
+            "~PIN2Width": "9",
+            "FaceFunOn": "1",
+            "~ExtendFmt": "1",
+            "~UserExtFmt": "1",
+            "CompatOldFirmware": "0",
+            "IPAddress": "127.0.0.1",
+            "NetMask": "255.255.255.0",
+            "GATEIPAddress": "0.0.0.0",
+        }.get(key)
+
+    # ---- comandos ----
+
+    def handle(self, session: _Session, command: int, data: bytes, *, tcp: bool) -> List[Response]:
+        """Respuestas (command, data) a un paquete; [] = no se contesta."""
+        self.commands += 1
+        ok: List[Response] = [(zp.CMD_ACK_OK, b"")]
+
+        if command in (zp.CMD_CONNECT, zp.CMD_AUTH, zp.CMD_EXIT, zp.CMD_REFRESHDATA, zp.CMD_OPTIONS_WRQ,
+                       zp.CMD_CANCELCAPTURE, zp.CMD_STARTVERIFY):
+            return ok
+        if command == zp.CMD_ACK_OK:
+            return []  # ack del cliente a un evento en vivo
+        if command == zp.CMD_ENABLEDEVICE:
+            self.enabled = True
+            return ok
+        if command == zp.CMD_DISABLEDEVICE:
+            self.enabled = False
+            return ok
+        if command == zp.CMD_GET_VERSION:
+            return [(zp.CMD_ACK_OK, b"Ver 6.60 Sim\x00")]
+        if command == zp.CMD_GET_TIME:
+            return [(zp.CMD_ACK_OK, struct.pack("<I", zp.encode_time(datetime.now())))]
+        if command == zp.CMD_OPTIONS_RRQ:
+            key = data.split(b"\x00")[0].decode(errors="ignore")
+            value = self._option(key)
+            if value is None:
+                return [(zp.CMD_ACK_ERROR, b"")]
+            return [(zp.CMD_ACK_OK, f"{key}={value}\x00".encode())]
+        if command == zp.CMD_GET_FREE_SIZES:
+            with self._lock:
+                return [(zp.CMD_ACK_OK, self._sizes_payload())]
+        if command == zp.CMD_USER_WRQ:
+            self._set_user(data)
+            return ok
+        if command == zp.CMD_CLEAR_ATTLOG:
+            with self._lock:
+                self.punches = []
+            return ok
+        if command == zp.CMD_REG_EVENT:
+            session.event_flags = struct.unpack("<I", data[:4])[0] if len(data) >= 4 else 0
+            with self._lock:
+                if session.event_flags & zp.EF_ATTLOG:
+                    if session not in self._subscribers:
+                        self._subscribers.append(session)
+                elif session in self._subscribers:
+                    self._subscribers.remove(session)
+            return ok
+        if command == zp.CMD_PREPARE_BUFFER:
+            _one, target, _fct, _ext = struct.unpack("<bhii", data[:11])
+            with self._lock:
+                if target == zp.CMD_USERTEMP_RRQ:
+                    session.buffer = self._users_buffer()
+                elif target == zp.CMD_ATTLOG_RRQ:
+                    session.buffer = self._attendance_buffer()
+                else:
+                    session.buffer = b""
+            return [(zp.CMD_ACK_OK, struct.pack("<BI", 0, len(session.buffer)) + b"\x00" * 4)]
+        if command == zp.CMD_READ_BUFFER:
+            start, size = struct.unpack("<ii", data[:8])
+            chunk = session.buffer[start:start + size]
+            if tcp:
+                return [(zp.CMD_DATA, chunk)]
+            # UDP: PREPARE_DATA + paquetes de 1024 + ACK_OK, como el reloj real
+            packets = [(zp.CMD_PREPARE_DATA, struct.pack("<I", len(chunk)))]
+            packets += [(zp.CMD_DATA, chunk[i:i + _UDP_CHUNK]) for i in range(0, len(chunk), _UDP_CHUNK)]
+            packets.append((zp.CMD_ACK_OK, b""))
+            return packets
+        if command == zp.CMD_FREE_DATA:
+            session.buffer = b""
+            return ok
+
+        log.debug("Comando no soportado | serial=%s | command=%s", self.serial, command)
+        return [(zp.CMD_ACK_UNKNOWN, b"")]
+
+
+def _recv_exact(conn: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size > 0:
+        chunk = conn.recv(size)
+        if not chunk:
+            raise ConnectionError("conexión cerrada")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class FakeMB160Server:
+    """Escucha TCP y UDP en (host, port) para un FakeMB160. port=0 = efímero."""
+
+    def __init__(self, device: FakeMB160, *, host: str = "127.0.0.1", port: int = 0):
+        self.device = device
+        self.host = host
+        self._tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._tcp.bind((host, port))
+        self.port = self._tcp.getsockname()[1]
+        self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._udp.bind((host, self.port))
+        self._udp_sessions: Dict[Tuple[str, int], _Session] = {}
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+    def start(self) -> "FakeMB160Server":
+        self._tcp.listen(64)
+        self._tcp.settimeout(0.5)
+        self._udp.settimeout(0.5)
+        for target, name in ((self._accept_loop, "tcp"), (self._udp_loop, "udp")):
+            th = threading.Thread(target=target, name=f"fake-{self.device.serial}-{name}", daemon=True)
+            th.start()
+            self._threads.append(th)
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()
+        for th in self._threads:
+            th.join(2)
+        self._tcp.close()
+        self._udp.close()
+
+    def _delay(self) -> None:
+        if self.device.latency:
+            time.sleep(self.device.latency)
+
+    # ---- TCP ----
+
+    def _accept_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                conn, _addr = self._tcp.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._tcp_conn, args=(conn,), daemon=True).start()
+
+    def _tcp_conn(self, conn: socket.socket) -> None:
+        send_lock = threading.Lock()
+
+        def transport(session_id: int, command: int, reply_id: int, data: bytes) -> None:
+            packet = zp.tcp_frame(zp.pack_packet(command, session_id, reply_id, data))
+            # los eventos en vivo salen desde otro hilo
+            with send_lock:
+                conn.sendall(packet)
+
+        session = self.device.new_session(transport)
+        try:
+            while not self._stopping.is_set():
+                length = zp.tcp_length(_recv_exact(conn, 8))
+                if length < 8:
+                    return
+                packet = _recv_exact(conn, length)
+                command, _chk, _sid, reply_id = zp.unpack_header(packet)
+                responses = self.device.handle(session, command, packet[8:], tcp=True)
+                if not responses:
+                    continue
+                self._delay()
+                if self.device.lose_packet():
+                    # TCP no pierde el paquete: lo retransmite después del RTO
+                    time.sleep(self.device.retransmit_seconds)
+                for resp_cmd, resp_data in responses:
+                    session.send(resp_cmd, reply_id, resp_data)
+                if command == zp.CMD_EXIT:
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.device.close_session(session)
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    # ---- UDP ----
+
+    def _udp_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                packet, addr = self._udp.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if len(packet) < 8:
+                continue
+            if self.device.lose_packet():
+                continue
+            command, _chk, _sid, reply_id = zp.unpack_header(packet)
+            session = self._udp_sessions.get(addr)
+            if session is None or command == zp.CMD_CONNECT:
+                session = self.device.new_session(self._udp_transport(addr))
+                self._udp_sessions[addr] = session
+            responses = self.device.handle(session, command, packet[8:], tcp=False)
+            if not responses:
+                continue
+            self._delay()
+            for resp_cmd, resp_data in responses:
+                session.send(resp_cmd, reply_id, resp_data)
+            if command == zp.CMD_EXIT:
+                self.device.close_session(self._udp_sessions.pop(addr))
+
+    def _udp_transport(self, addr: Tuple[str, int]) -> Transport:
+        def transport(session_id: int, command: int, reply_id: int, data: bytes) -> None:
+            self._udp.sendto(zp.pack_packet(command, session_id, reply_id, data), addr)
+
+        return transport
+
+
+class FakeDeviceFarm:
+    """
+    N checadores simulados en puertos distintos del mismo host. `live_interval`
+    (segundos) genera checadas nuevas en cada dispositivo, que llegan a los
+    live_capture abiertos y aumentan el conteo de registros.
+    `per_device(idx, serial)` puede regresar kwargs propios de cada
+    dispositivo (p.ej. user_list/punches de utils.simulator).
+    """
+
+    def __init__(
+        self,
+        count: int,
+        *,
+        host: str = "127.0.0.1",
+        base_port: int = 0,
+        serial_prefix: str = "SIM",
+        seed: int = 0,
+        live_interval: Optional[float] = None,
+        per_device: Optional[Callable[[int, str], Dict[str, Any]]] = None,
+        **device_kwargs,
+    ):
+        self.servers: List[FakeMB160Server] = []
+        for idx in range(count):
+            serial = f"{serial_prefix}{idx + 1:05d}"
+            kwargs = dict(device_kwargs, **(per_device(idx, serial) if per_device else {}))
+            device = FakeMB160(serial, seed=seed + idx, **kwargs)
+            port = base_port + idx if base_port else 0
+            self.servers.append(FakeMB160Server(device, host=host, port=port))
+        self._live_interval = live_interval
+        self._stopping = threading.Event()
+        self._ticker: Optional[threading.Thread] = None
+
+    @property
+    def devices(self) -> List[FakeMB160]:
+        return [s.device for s in self.servers]
+
+    @property
+    def targets(self) -> List[Tuple[str, int]]:
+        return [s.address for s in self.servers]
+
+    def start(self) -> "FakeDeviceFarm":
+        for server in self.servers:
+            server.start()
+        if self._live_interval:
+            self._ticker = threading.Thread(target=self._tick_loop, name="fake-live", daemon=True)
+            self._ticker.start()
+        log.info("Dispositivos simulados | count=%d | %s", len(self.servers),
+                 ",".join(f"{h}:{p}" for h, p in self.targets))
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._ticker is not None:
+            self._ticker.join(2)
+        for server in self.servers:
+            server.stop()
+
+    def _tick_loop(self) -> None:
+        while not self._stopping.wait(self._live_interval):
+            for device in self.devices:
+                device.random_punch()
+
+    def __enter__(self) -> "FakeDeviceFarm":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
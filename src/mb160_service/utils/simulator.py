@@ -1,7 +1,39 @@
 # simulator.py
+"""
+Generador de marcajes simulados.
+
+`simulated_attendance_batch` es el lote aleatorio de siempre (unos cuantos
+marcajes de los últimos 2 minutos). `shift_punches` modela turnos reales
+para pruebas de carga: entrada antes de 12:00, par de comida en
+12:50–15:59, salida desde 16:00, doble-tap del checador (≤60s), marcajes en
+zona gris (12:00–12:49) y los prefijos de empresa de EmpresaConfig (2..5).
+
+Es determinista por `seed` y trabaja por día: en memoria sólo vive un día de
+marcajes a la vez, así que puede generar millones de filas como generador
+(`shift_punches` / `attendance_rows`) o escribirlas directo a la base
+(`load_attendance`).
+"""
+import itertools
 import os
 import random
-from datetime import datetime, timedelta
+import zlib
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# EmpresaConfig.EmpresaPrefix: primer dígito de UsuarioDispositivo
+EMPRESA_PREFIXES = (2, 3, 4, 5)
+
+# Ventanas de sp_ProcessMarcajeQueue
+ENTRY_END = time(12, 0)
+LUNCH_START = time(12, 50)
+EXIT_START = time(16, 0)
+
+DOUBLE_TAP_SECONDS = 60
+
+_FIRST_NAMES = ("Ana", "Luis", "María", "José", "Carmen", "Jorge", "Lucía", "Pedro", "Sofía", "Miguel")
+_LAST_NAMES = ("García", "López", "Hernández", "Martínez", "Pérez", "Sánchez", "Ramírez", "Torres", "Flores", "Díaz")
+
 
 def simulated_attendance_batch():
     serial = os.environ.get("SIMULATED_DEVICE_SERIAL", "SIM-MB160-001")
@@ -24,3 +56,210 @@ def simulated_attendance_batch():
             "workcode": workcode,
         })
     return batch
+
+
+@dataclass(frozen=True)
+class ShiftProfile:
+    """Probabilidades del día de un empleado (por empleado y día)."""
+    weekdays: Tuple[int, ...] = (0, 1, 2, 3, 4, 5)  # lunes..sábado
+    absent_rate: float = 0.03
+    lunch_rate: float = 0.85
+    missed_punch_rate: float = 0.02  # olvida checar una de sus marcas
+    double_tap_rate: float = 0.04  # por marca: repite la checada en ≤60s
+    gray_zone_rate: float = 0.02  # marca extra entre 12:00 y 12:49
+
+
+@dataclass(frozen=True)
+class SimEmployee:
+    user_id: str
+    name: str
+    empresa_id: int
+    device_serial: str
+    entry_minute: int  # minuto del día de la entrada habitual
+    exit_minute: int  # minuto del día de la salida habitual
+
+
+@dataclass(frozen=True)
+class SimPunch:
+    """
+    Marcaje generado. Tiene los mismos campos que FakePunch (user_id,
+    timestamp, status, punch), así que se puede pasar tal cual como
+    `punches=` de FakeMB160.
+    """
+    device_serial: str
+    user_id: str
+    user_name: str
+    timestamp: datetime
+    punch: int
+    status: int
+    kind: str  # entrada, salida_comida, entrada_comida, salida, zona_gris, doble_tap
+
+
+def simulated_employees(
+    count: int,
+    *,
+    devices: Sequence[str] = ("SIM00001",),
+    prefixes: Iterable[int] = EMPRESA_PREFIXES,
+    seed: int = 0,
+) -> List[SimEmployee]:
+    """
+    `count` empleados repartidos entre las empresas de `prefixes` y los
+    `devices`, cada uno con su horario habitual (entrada 6:30–9:30,
+    salida 16:30–19:30). UsuarioDispositivo = prefijo + consecutivo.
+    """
+    prefixes = list(prefixes) or [EMPRESA_PREFIXES[0]]
+    devices = list(devices) or ["SIM00001"]
+    rnd = random.Random(seed)
+    employees = []
+    for idx in range(count):
+        prefix = prefixes[idx % len(prefixes)]
+        user_id = f"{prefix}{idx // len(prefixes) + 1:04d}"
+        employees.append(SimEmployee(
+            user_id=user_id,
+            name=f"{rnd.choice(_FIRST_NAMES)} {rnd.choice(_LAST_NAMES)}",
+            empresa_id=prefix,
+            device_serial=devices[idx % len(devices)],
+            entry_minute=rnd.randrange(6 * 60 + 30, 9 * 60 + 31, 15),
+            exit_minute=rnd.randrange(16 * 60 + 30, 19 * 60 + 31, 15),
+        ))
+    return employees
+
+
+def _at(day: date, minute_of_day: float) -> datetime:
+    return datetime.combine(day, time()) + timedelta(seconds=int(minute_of_day * 60))
+
+
+def _clamp(ts: datetime, lo: datetime, hi: datetime) -> datetime:
+    return min(max(ts, lo), hi)
+
+
+def _employee_day(rnd: random.Random, emp: SimEmployee, day: date, profile: ShiftProfile) -> List[SimPunch]:
+    if rnd.random() < profile.absent_rate:
+        return []
+
+    midnight = datetime.combine(day, time())
+    entry_end = datetime.combine(day, ENTRY_END) - timedelta(seconds=1)
+    lunch_start = datetime.combine(day, LUNCH_START)
+    lunch_end = datetime.combine(day, EXIT_START) - timedelta(seconds=1)
+    exit_start = datetime.combine(day, EXIT_START)
+    day_end = midnight + timedelta(hours=23, minutes=59, seconds=59)
+
+    # (kind, timestamp, punch)
+    marks: List[Tuple[str, datetime, int]] = [
+        ("entrada", _clamp(_at(day, emp.entry_minute + rnd.gauss(0, 12)), midnight, entry_end), 0),
+    ]
+    if rnd.random() < profile.lunch_rate:
+        out = _clamp(_at(day, rnd.uniform(12 * 60 + 50, 14 * 60 + 30)), lunch_start, lunch_end)
+        back = _clamp(out + timedelta(minutes=rnd.uniform(30, 60)), out + timedelta(seconds=61), lunch_end)
+        marks.append(("salida_comida", out, 1))
+        if back > out:
+            marks.append(("entrada_comida", back, 0))
+    marks.append(("salida", _clamp(_at(day, emp.exit_minute + rnd.gauss(0, 20)), exit_start, day_end), 1))
+
+    if len(marks) > 1 and rnd.random() < profile.missed_punch_rate:
+        marks.pop(rnd.randrange(len(marks)))
+    if rnd.random() < profile.gray_zone_rate:
+        marks.append(("zona_gris", _at(day, rnd.uniform(12 * 60, 12 * 60 + 49)), rnd.randint(0, 1)))
+
+    punches = []
+    for kind, ts, punch in marks:
+        punches.append(SimPunch(emp.device_serial, emp.user_id, emp.name, ts, punch, 1, kind))
+        if rnd.random() < profile.double_tap_rate:
+            tap = ts + timedelta(seconds=rnd.randint(1, DOUBLE_TAP_SECONDS))
+            punches.append(SimPunch(emp.device_serial, emp.user_id, emp.name, tap, punch, 1, "doble_tap"))
+    return punches
+
+
+def shift_punches(
+    employees: Sequence[SimEmployee],
+    start: date,
+    days: int,
+    *,
+    seed: int = 0,
+    profile: Optional[ShiftProfile] = None,
+) -> Iterator[SimPunch]:
+    """
+    Marcajes de `days` días a partir de `start`, en orden cronológico.
+    Mismos empleados + seed + fechas = mismos marcajes (cada día usa su
+    propia semilla, así que generar un rango parcial da las mismas filas).
+    """
+    profile = profile or ShiftProfile()
+    for offset in range(max(0, days)):
+        day = start + timedelta(days=offset)
+        if day.weekday() not in profile.weekdays:
+            continue
+        rnd = random.Random(seed * 1_000_003 + day.toordinal())
+        punches: List[SimPunch] = []
+        for emp in employees:
+            punches.extend(_employee_day(rnd, emp, day, profile))
+        punches.sort(key=lambda p: (p.timestamp, p.device_serial, p.user_id))
+        yield from punches
+
+
+def attendance_rows(punches: Iterable[SimPunch], *, device_ip: str = "127.0.0.1") -> Iterator[Dict[str, Any]]:
+    """Marcajes como filas de dbo.AsistenciaMarcaje (mismo formato que el collector)."""
+    from mb160_service.collector.poller import _mark_params
+
+    for p in punches:
+        yield _mark_params(
+            device_serial=p.device_serial,
+            device_ip=device_ip,
+            user_id=p.user_id,
+            user_name=p.user_name,
+            ts_local=p.timestamp,
+            punch=p.punch,
+            estado=p.status,
+            workcode=None,
+        )
+
+
+def load_attendance(
+    engine,
+    rows: Iterable[Dict[str, Any]],
+    *,
+    chunk_rows: int = 50_000,
+    batch_size: Optional[int] = None,
+    staging: bool = False,
+) -> Tuple[int, int]:
+    """
+    Escribe `rows` en dbo.AsistenciaMarcaje en transacciones de `chunk_rows`
+    filas, consumiendo el generador sobre la marcha. Regresa
+    (inserted, dup_skipped).
+    """
+    from mb160_service.collector.poller import insert_rows
+    from mb160_service.collector.watermark import ingest_transaction
+
+    inserted = dup_skipped = 0
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, max(1, chunk_rows)))
+        if not chunk:
+            break
+        with ingest_transaction(engine) as dbconn:
+            ins, dup = insert_rows(dbconn, chunk, batch_size=batch_size, staging=staging)
+        inserted += ins
+        dup_skipped += dup
+    return inserted, dup_skipped
+
+
+def fake_device_history(
+    serial: str,
+    employees: Sequence[SimEmployee],
+    start: date,
+    days: int,
+    *,
+    seed: int = 0,
+    profile: Optional[ShiftProfile] = None,
+) -> Dict[str, Any]:
+    """
+    kwargs de FakeMB160 (user_list + punches) con los empleados y marcajes
+    del dispositivo `serial`; sirve como `per_device` de FakeDeviceFarm.
+    """
+    from mb160_service.utils.fake_mb160 import FakeUser
+
+    own = [emp for emp in employees if emp.device_serial == serial]
+    return {
+        "user_list": [FakeUser(uid=idx + 1, user_id=emp.user_id, name=emp.name) for idx, emp in enumerate(own)],
+        # semilla distinta por serial para que los dispositivos no repitan el mismo patrón
+        "punches": shift_punches(own, start, days, seed=seed ^ zlib.crc32(serial.encode()), profile=profile),
+    }
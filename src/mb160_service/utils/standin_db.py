@@ -0,0 +1,139 @@
+# standin_db.py
+"""
+Base de datos local (SQLite) que imita dbo.AsistenciaMarcaje,
+dbo.AsistenciaDiaria y dbo.MB160UserSyncQueue para benchmarks sin SQL Server. El esquema `dbo` se monta con ATTACH para que el SQL del
+collector (dbo.AsistenciaMarcaje) corra sin cambios.
+"""
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+
+_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS dbo.AsistenciaMarcaje (
+        AsistenciaMarcajeID  INTEGER PRIMARY KEY AUTOINCREMENT,
+        DispositivoSerial    TEXT NOT NULL,
+        DispositivoIP        TEXT NULL,
+        UsuarioDispositivo   TEXT NOT NULL,
+        UsuarioNombre        TEXT NULL,
+        EventoFechaHora      DATETIME NOT NULL,
+        Punch                INTEGER NOT NULL DEFAULT 0,
+        Estado               INTEGER NOT NULL DEFAULT 0,
+        WorkCode             INTEGER NULL,
+        FechaRegistro        DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT UQ_AsistenciaMarcaje_Dedupe UNIQUE
+            (DispositivoSerial, UsuarioDispositivo, EventoFechaHora, Punch, Estado)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS dbo.IX_AsistenciaMarcaje_Device_Fecha
+        ON AsistenciaMarcaje (DispositivoSerial, EventoFechaHora DESC)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS dbo.IX_AsistenciaMarcaje_Usuario_Fecha
+        ON AsistenciaMarcaje (UsuarioDispositivo, EventoFechaHora DESC)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS dbo.IX_AsistenciaMarcaje_Fecha
+        ON AsistenciaMarcaje (EventoFechaHora DESC)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dbo.AsistenciaDiaria (
+        UsuarioDispositivo   TEXT NOT NULL,
+        Fecha                DATE NOT NULL,
+        PrimeraEntrada       DATETIME NULL,
+        SalidaComida         DATETIME NULL,
+        EntradaComida        DATETIME NULL,
+        UltimaSalida         DATETIME NULL,
+        Marcajes             INTEGER NOT NULL,
+        UltimoCambio         DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (Fecha, UsuarioDispositivo)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS dbo.IX_AsistenciaDiaria_Usuario_Fecha
+        ON AsistenciaDiaria (UsuarioDispositivo, Fecha)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dbo.MB160UserSyncQueue (
+        MB160UserSyncQueueID INTEGER PRIMARY KEY AUTOINCREMENT,
+        EmpresaID            INTEGER NOT NULL,
+        PersonaID            INTEGER NOT NULL,
+        UsuarioDispositivo   TEXT NOT NULL,
+        UsuarioNombre        TEXT NOT NULL,
+        Estatus              INTEGER NOT NULL DEFAULT 0,
+        Intentos             INTEGER NOT NULL DEFAULT 0,
+        UltimoError          TEXT NULL,
+        FechaRegistro        DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UltimoCambio         DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        ProcesadoEn          DATETIME NULL,
+        CONSTRAINT UQ_MB160UserSyncQueue UNIQUE (EmpresaID, PersonaID)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS dbo.IX_MB160UserSyncQueue_Estatus
+        ON MB160UserSyncQueue (Estatus, MB160UserSyncQueueID)
+    """,
+]
+
+
+def build_standin_engine(path: Optional[str] = None) -> Engine:
+    """
+    Crea (o abre) la base local en `path`. Sin path usa un archivo temporal.
+    """
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="mb160_standin_", suffix=".db")
+        os.close(fd)
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        future=True,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        # pysqlite maneja BEGIN por su cuenta y rompe SAVEPOINT; lo controlamos nosotros
+        dbapi_conn.isolation_level = None
+        dbapi_conn.execute(f"ATTACH DATABASE '{path}' AS dbo")
+        # funciones de SQL Server que usa el SQL del collector/user sync
+        dbapi_conn.create_function("SYSDATETIME", 0, lambda: datetime.now().isoformat(sep=" "))
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    with engine.begin() as conn:
+        for ddl in _DDL:
+            conn.execute(text(ddl))
+
+    return engine
+
+
+def dequeue_user_sync_batch(dbconn, batch_size: int) -> List[Dict[str, Any]]:
+    """
+    Equivalente SQLite de user_sync._dequeue_batch (sin hints de bloqueo ni
+    OUTPUT: UPDATE ... RETURNING). Los benchmarks lo ponen en lugar del de
+    SQL Server.
+    """
+    q = text("""
+        UPDATE dbo.MB160UserSyncQueue
+        SET
+            Estatus = 1,
+            Intentos = Intentos + 1,
+            UltimoCambio = SYSDATETIME()
+        WHERE MB160UserSyncQueueID IN (
+            SELECT MB160UserSyncQueueID
+            FROM dbo.MB160UserSyncQueue
+            WHERE Estatus IN (0, 3)
+            ORDER BY MB160UserSyncQueueID
+            LIMIT :batch_size
+        )
+        RETURNING MB160UserSyncQueueID, EmpresaID, PersonaID, UsuarioDispositivo, UsuarioNombre, Intentos
+    """)
+    rows = dbconn.execute(q, {"batch_size": batch_size}).mappings().all()
+    return sorted((dict(r) for r in rows), key=lambda r: r["MB160UserSyncQueueID"])
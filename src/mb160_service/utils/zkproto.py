@@ -0,0 +1,120 @@
+"""
+Piezas mínimas del protocolo ZK (el que habla pyzk con el MB160), sin
+depender de pyzk: checksum, headers UDP/TCP y codificación de fechas.
+
+Las usan el probe de health y el simulador de dispositivos (fake_mb160).
+"""
+import struct
+from datetime import datetime
+
+USHRT_MAX = 65535
+
+CMD_USER_WRQ = 8
+CMD_USERTEMP_RRQ = 9
+CMD_OPTIONS_RRQ = 11
+CMD_OPTIONS_WRQ = 12
+CMD_ATTLOG_RRQ = 13
+CMD_CLEAR_ATTLOG = 15
+CMD_DELETE_USER = 18
+CMD_GET_FREE_SIZES = 50
+CMD_STARTVERIFY = 60
+CMD_CANCELCAPTURE = 62
+CMD_GET_TIME = 201
+CMD_REG_EVENT = 500
+CMD_CONNECT = 1000
+CMD_EXIT = 1001
+CMD_ENABLEDEVICE = 1002
+CMD_DISABLEDEVICE = 1003
+CMD_REFRESHDATA = 1013
+CMD_GET_VERSION = 1100
+CMD_AUTH = 1102
+CMD_PREPARE_DATA = 1500
+CMD_DATA = 1501
+CMD_FREE_DATA = 1502
+CMD_PREPARE_BUFFER = 1503
+CMD_READ_BUFFER = 1504
+
+CMD_ACK_OK = 2000
+CMD_ACK_ERROR = 2001
+CMD_ACK_UNAUTH = 2005
+CMD_ACK_UNKNOWN = 0xFFFF
+
+EF_ATTLOG = 1
+
+TCP_MAGIC_1 = 0x5050
+TCP_MAGIC_2 = 0x7D82  # 32130 (el comentario de pyzk dice 0x7282, el valor real es 0x7D82)
+
+_HEADER = struct.Struct("<4H")
+_TCP_TOP = struct.Struct("<HHI")
+
+
+def checksum(payload: bytes) -> int:
+    # mismo algoritmo que pyzk (__create_checksum, copiado de zkemsdk.c)
+    if len(payload) % 2:
+        payload += b"\x00"
+    total = 0
+    for (word,) in struct.iter_unpack("<H", payload):
+        total += word
+        if total > USHRT_MAX:
+            total -= USHRT_MAX
+    while total > USHRT_MAX:
+        total -= USHRT_MAX
+    total = ~total
+    while total < 0:
+        total += USHRT_MAX
+    return total
+
+
+def pack_packet(command: int, session_id: int, reply_id: int, data: bytes = b"") -> bytes:
+    """Header de 8 bytes (command, checksum, session, reply) + datos."""
+    chk = checksum(_HEADER.pack(command, 0, session_id, reply_id) + data)
+    return _HEADER.pack(command, chk, session_id, reply_id) + data
+
+
+def unpack_header(packet: bytes):
+    """(command, checksum, session_id, reply_id) de un paquete."""
+    return _HEADER.unpack(packet[:8])
+
+
+def tcp_frame(packet: bytes) -> bytes:
+    """Sobre TCP cada paquete va precedido de 0x5050 0x7D82 + longitud."""
+    return _TCP_TOP.pack(TCP_MAGIC_1, TCP_MAGIC_2, len(packet)) + packet
+
+
+def tcp_length(top: bytes) -> int:
+    """Longitud del paquete según el top header TCP (0 si no es válido)."""
+    if len(top) < 8:
+        return 0
+    magic1, magic2, length = _TCP_TOP.unpack(top[:8])
+    if magic1 != TCP_MAGIC_1 or magic2 != TCP_MAGIC_2:
+        return 0
+    return length
+
+
+def encode_time(ts: datetime) -> int:
+    """Fecha de un registro de asistencia (EncodeTime de zkemsdk.c)."""
+    return (
+        ((ts.year % 100) * 12 * 31 + ((ts.month - 1) * 31) + ts.day - 1) * (24 * 60 * 60)
+        + (ts.hour * 60 + ts.minute) * 60
+        + ts.second
+    )
+
+
+def encode_timehex(ts: datetime) -> bytes:
+    """Fecha de un evento en vivo: 6 bytes (año-2000, mes, día, h, m, s)."""
+    return struct.pack("6B", ts.year - 2000, ts.month, ts.day, ts.hour, ts.minute, ts.second)
+
+
+def decode_time(value: int) -> datetime:
+    """Inverso de encode_time (DecodeTime de zkemsdk.c)."""
+    second = value % 60
+    value //= 60
+    minute = value % 60
+    value //= 60
+    hour = value % 24
+    value //= 24
+    day = value % 31 + 1
+    value //= 31
+    month = value % 12 + 1
+    value //= 12
+    return datetime(value + 2000, month, day, hour, minute, second)
@@ -0,0 +1,145 @@
+import argparse
+import gc
+import random
+import struct
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+
+bootstrap.add_src_to_path()
+
+from mb160_service.collector.attendance_stream import _Parser
+from mb160_service.collector.batch import AttendanceBatch
+from mb160_service.collector.poller import _mark_params, _select_logs
+from mb160_service.utils import zkproto as zp
+
+SEED = 160
+_ATT_40 = struct.Struct("<H24sBIB8s")
+
+
+class _Attendance:
+    """Igual que zk.attendance.Attendance (lo que armaba get_attendance)."""
+
+    def __init__(self, user_id, timestamp, status, punch=0, uid=0):
+        self.uid = uid
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.status = status
+        self.punch = punch
+
+
+def _raw_buffer(records: int, users: int, dup_ratio: float) -> bytes:
+    """Buffer de asistencia como lo manda el reloj (registros de 40 bytes, ordenados)."""
+    rnd = random.Random(SEED)
+    start = datetime(2026, 1, 1, 7, 0, 0)
+    ids = [str(10000 + i) for i in range(users)]
+    out = bytearray()
+    prev = None
+    for i in range(records):
+        if prev is not None and rnd.random() < dup_ratio:
+            out += prev  # la misma checada dos veces (log del reloj repetido)
+            continue
+        ts = start + timedelta(seconds=i * 23)
+        user = rnd.choice(ids)
+        prev = _ATT_40.pack(i % 65535, user.encode(), 1, zp.encode_time(ts), rnd.choice((0, 1, 4, 5)), b"\x00" * 8)
+        out += prev
+    return bytes(out)
+
+
+def _legacy(buf: bytes, *, serial: str, min_ts, user_map):
+    """Camino anterior: un Attendance por registro y un dict por fila filtrada."""
+    logs = []
+    for uid, raw_user, status, encoded, punch, _r in _ATT_40.iter_unpack(buf):
+        user_id = raw_user.split(b"\x00")[0].decode(errors="ignore")
+        logs.append(_Attendance(user_id, zp.decode_time(encoded), status, punch, uid))
+    rows = []
+    for a in logs:
+        if a.timestamp < min_ts:
+            continue
+        user_id = str(a.user_id).strip()
+        rows.append(_mark_params(
+            device_serial=serial, device_ip="127.0.0.1", user_id=user_id, user_name=user_map.get(user_id),
+            ts_local=a.timestamp, punch=a.punch, estado=a.status, workcode=None,
+        ))
+    return logs, rows
+
+
+def _columnar(buf: bytes, *, serial: str, min_ts, user_map):
+    """Camino actual: el parser llena un AttendanceBatch, luego ventana/orden/dedupe y params."""
+    batch = AttendanceBatch(serial, "127.0.0.1")
+    parser = _Parser(len(buf) // _ATT_40.size, None, None, batch)
+    parser.feed(struct.pack("<I", len(buf)) + buf)
+    selected, _dups = _select_logs(
+        batch, device_serial=serial, device_ip="127.0.0.1", min_ts=min_ts, max_ts=None, last_ts=None,
+    )
+    return batch, selected.to_params(user_map)
+
+
+def _measure(fn, *args, repeat: int = 3, **kwargs):
+    # CPU sin tracemalloc (lo frena); mejor de `repeat` corridas
+    cpu = None
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        t0 = time.process_time()
+        held, rows = fn(*args, **kwargs)
+        elapsed = time.process_time() - t0
+        cpu = elapsed if cpu is None else min(cpu, elapsed)
+        del held, rows
+
+    gc.collect()
+    tracemalloc.start()
+    held, rows = fn(*args, **kwargs)
+    _cur, peak = tracemalloc.get_traced_memory()
+    n_held, n_rows = len(held), len(rows)
+    # lo que se queda en DeviceDownload.logs entre la descarga y la ingesta
+    del rows
+    gc.collect()
+    resident, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return cpu, peak, resident, n_held, n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Attendance+dict vs AttendanceBatch (CPU y memoria).")
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--dup-ratio", type=float, default=0.01)
+    parser.add_argument("--window-days", type=float, default=7.0, help="ventana min_ts (desde el último registro)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    buf = _raw_buffer(args.records, args.users, args.dup_ratio)
+    last = zp.decode_time(_ATT_40.unpack_from(buf, len(buf) - _ATT_40.size)[3])
+    min_ts = last - timedelta(days=args.window_days)
+    user_map = {str(10000 + i): f"Empleado {i}" for i in range(args.users)}
+
+    print(f"records={args.records} users={args.users} dup_ratio={args.dup_ratio:g} min_ts={min_ts}")
+    results = {}
+    for label, fn in (("legacy", _legacy), ("batch", _columnar)):
+        cpu, peak, resident, held, rows = _measure(
+            fn, buf, serial="BENCH", min_ts=min_ts, user_map=user_map, repeat=args.repeat,
+        )
+        results[label] = (cpu, peak, resident)
+        print(
+            f"{label:<7} cpu={cpu:6.2f}s  peak={peak / 2**20:7.1f}MB  logs_en_memoria={resident / 2**20:7.1f}MB  "
+            f"logs={held} filas={rows}"
+        )
+
+    (cpu_a, peak_a, res_a), (cpu_b, peak_b, res_b) = results["legacy"], results["batch"]
+    print(
+        f"batch vs legacy: cpu x{cpu_a / cpu_b if cpu_b else 0:.1f}  peak x{peak_a / peak_b if peak_b else 0:.1f}  "
+        f"logs_en_memoria x{res_a / res_b if res_b else 0:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
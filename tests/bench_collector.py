@@ -0,0 +1,350 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# el benchmark no debe tocar el estado real del collector (checkpoints/breakers)
+os.environ["CHECKPOINT_FILE"] = ""
+os.environ["DEVICE_HEALTH_FILE"] = ""
+os.environ["SPOOL_FILE"] = ""
+os.environ["DUMP_CACHE_DIR"] = ""
+os.environ["MB160_OMIT_PING"] = "1"
+
+import bootstrap
+
+bootstrap.add_src_to_path()
+
+from mb160_service.utils.fake_mb160 import FakeDeviceFarm, default_punches, default_users
+
+SCENARIOS = ("poll", "backfill", "multi", "user_sync")
+SEED = 160
+# fin fijo del historial simulado: mismos registros en cada corrida
+HISTORY_END = datetime(2026, 1, 15, 18, 0, 0)
+
+
+@dataclass(frozen=True)
+class Workload:
+    scenario: str
+    records: int
+    devices: int
+    dup_ratio: float
+    latency_ms: float
+    db_rtt_ms: float
+    users: int
+    batch_size: int
+
+    def key(self) -> str:
+        return (
+            f"{self.scenario}|records={self.records}|devices={self.devices}|dup={self.dup_ratio:g}"
+            f"|latency={self.latency_ms:g}ms|db_rtt={self.db_rtt_ms:g}ms|users={self.users}|batch={self.batch_size}"
+        )
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss: KB en Linux, bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _seed_duplicates(engine, workload: Workload) -> None:
+    """Carga a la DB la fracción dup_ratio de los registros de cada dispositivo."""
+    import random
+
+    from mb160_service.collector.poller import _mark_params, insert_rows
+
+    users = default_users(workload.users)
+    for idx in range(workload.devices):
+        punches = default_punches(users, workload.records, seed=SEED + idx, end=HISTORY_END)
+        count = int(len(punches) * workload.dup_ratio)
+        if not count:
+            continue
+        if workload.scenario == "backfill":
+            # re-pull por rango: los duplicados quedan repartidos en la ventana
+            chosen = random.Random(SEED + idx).sample(punches, count)
+        else:
+            # incremental: lo ya ingerido es lo más viejo
+            chosen = punches[:count]
+        rows = [
+            _mark_params(
+                device_serial=f"SIM{idx + 1:05d}",
+                device_ip="127.0.0.1",
+                user_id=p.user_id,
+                user_name=None,
+                ts_local=p.timestamp,
+                punch=p.punch,
+                estado=p.status,
+                workcode=None,
+            )
+            for p in chosen
+        ]
+        with engine.begin() as dbconn:
+            insert_rows(dbconn, rows, batch_size=workload.batch_size)
+
+
+def _run_workload(workload: Workload, targets, out) -> None:
+    """Corre en un proceso aparte: memoria pico y estado global limpios."""
+    import asyncio
+    import logging
+
+    from sqlalchemy import event, text
+
+    from mb160_service.collector.engine import CollectorEngine, DeviceTarget
+    from mb160_service.collector.pipeline import IngestPipeline
+    from mb160_service.collector.poller import poll_once
+    from mb160_service.collector import user_sync
+    from mb160_service.collector.user_sync import sync_users_once
+    from mb160_service.utils.standin_db import build_standin_engine, dequeue_user_sync_batch
+
+    logging.basicConfig(level=logging.WARNING)
+
+    engine = build_standin_engine()
+    _seed_duplicates(engine, workload)
+
+    round_trips = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*_a):
+        round_trips["n"] += 1
+        if workload.db_rtt_ms:
+            time.sleep(workload.db_rtt_ms / 1000.0)
+
+    records = inserted = dup_skipped = 0
+    locks = []
+    started = time.perf_counter()
+
+    if workload.scenario in ("poll", "backfill"):
+        for ip, port in targets:
+            result = poll_once(
+                engine,
+                device_ip=ip,
+                device_port=port,
+                use_last_ts=workload.scenario == "poll",
+                batch_size=workload.batch_size,
+            )
+            records += result.logs
+            inserted += result.inserted
+            dup_skipped += result.dup_skipped
+            locks.append(result.lock_seconds)
+
+    elif workload.scenario == "multi":
+        pipeline = IngestPipeline(engine, batch_size=workload.batch_size).start()
+        collector = CollectorEngine(
+            engine,
+            [DeviceTarget(ip, port, 0, label=f"{ip}:{port}") for ip, port in targets],
+            max_concurrency=min(6, len(targets)),
+            pipeline=pipeline,
+            max_cycles=1,
+            report_interval_seconds=3600,
+        )
+        asyncio.run(collector.run())
+        pipeline.close()
+        records = workload.records * len(targets)
+        inserted = collector.totals.inserted
+        locks = collector.totals.lock_seconds
+
+    elif workload.scenario == "user_sync":
+        # el dequeue de producción es T-SQL (READPAST/OUTPUT): en SQLite va el del standin
+        user_sync._dequeue_batch = dequeue_user_sync_batch
+        with engine.begin() as dbconn:
+            dbconn.execute(
+                text("""
+                    INSERT INTO dbo.MB160UserSyncQueue (EmpresaID, PersonaID, UsuarioDispositivo, UsuarioNombre)
+                    VALUES (:EmpresaID, :PersonaID, :UsuarioDispositivo, :UsuarioNombre)
+                """),
+                [
+                    {"EmpresaID": 2, "PersonaID": i, "UsuarioDispositivo": f"2{i:05d}", "UsuarioNombre": f"Bench {i}"}
+                    for i in range(workload.records)
+                ],
+            )
+        round_trips["n"] = 0
+        started = time.perf_counter()
+        ip, port = targets[0]
+        while True:
+            taken = sync_users_once(engine, device_ip=ip, device_port=port)
+            if not taken:
+                break
+            records += taken
+        inserted = records
+
+    elapsed = time.perf_counter() - started
+    out.put({
+        "elapsed_seconds": round(elapsed, 3),
+        "records": records,
+        "inserted": inserted,
+        "dup_skipped": dup_skipped,
+        "records_per_second": round(records / elapsed, 1) if elapsed else None,
+        "db_round_trips": round_trips["n"],
+        "lock_avg_ms": round(1000 * sum(locks) / len(locks), 1) if locks else None,
+        "lock_max_ms": round(1000 * max(locks), 1) if locks else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    })
+
+
+def run_workload(workload: Workload) -> dict:
+    farm_kwargs = {
+        "users": workload.users,
+        "records": workload.records,
+        "latency": workload.latency_ms / 1000.0,
+        "end": HISTORY_END,
+    }
+    with FakeDeviceFarm(workload.devices, seed=SEED, **farm_kwargs) as farm:
+        ctx = multiprocessing.get_context("spawn")
+        out = ctx.Queue()
+        child = ctx.Process(target=_run_workload, args=(workload, farm.targets, out))
+        child.start()
+        metrics = None
+        while metrics is None:
+            try:
+                metrics = out.get(timeout=1)
+            except queue.Empty:
+                if not child.is_alive():
+                    raise RuntimeError(f"el workload {workload.key()} terminó sin resultados (exit={child.exitcode})")
+        child.join()
+        metrics["device_round_trips"] = sum(d.commands for d in farm.devices)
+    return metrics
+
+
+def _git_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain"], cwd=ROOT, capture_output=True, text=True).stdout
+        return f"{commit}+dirty" if dirty.strip() else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _load_history(path: Path) -> dict:
+    """Última corrida registrada por llave de workload."""
+    last = {}
+    if not path.exists():
+        return last
+    with path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                last[item["key"]] = item
+    return last
+
+
+def _compare(current: dict, previous: dict, threshold: float) -> list:
+    """Regresiones: menos registros/s o más round-trips que la corrida anterior."""
+    issues = []
+    now, before = current["metrics"], previous["metrics"]
+    if before.get("records_per_second") and now.get("records_per_second") is not None:
+        change = (now["records_per_second"] - before["records_per_second"]) / before["records_per_second"]
+        if change < -threshold:
+            issues.append(f"records/s {before['records_per_second']:.0f} -> {now['records_per_second']:.0f} ({change:+.0%})")
+    for metric in ("db_round_trips", "device_round_trips"):
+        if before.get(metric) and now.get(metric, 0) > before[metric] * (1 + threshold):
+            issues.append(f"{metric} {before[metric]} -> {now[metric]}")
+    return issues
+
+
+def _fmt(value, unit: str) -> str:
+    return "-" if value is None else f"{value}{unit}"
+
+
+def _csv(raw: str, cast):
+    return [cast(v) for v in raw.split(",") if v.strip()]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark del collector contra checadores simulados (fake_mb160) y SQLite local."
+    )
+    parser.add_argument("--scenarios", default="poll,backfill,multi,user_sync", help=f"de {','.join(SCENARIOS)}")
+    parser.add_argument("--records", default="5000", help="registros por dispositivo (user_sync: usuarios en cola)")
+    parser.add_argument("--devices", default="1,4")
+    parser.add_argument("--dup-ratio", default="0,0.5", help="fracción de registros que ya están en la DB")
+    parser.add_argument("--latency-ms", default="0", help="latencia por respuesta del checador")
+    parser.add_argument("--db-rtt-ms", default="0", help="latencia por round-trip a la DB (VPN)")
+    parser.add_argument("--users", type=int, default=50, help="usuarios por dispositivo")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=1, help="corridas por workload; se guarda la más rápida")
+    parser.add_argument("--results", default="state/bench/collector.jsonl", help="historial JSONL ('' = no guardar)")
+    parser.add_argument("--threshold", type=float, default=0.15, help="tolerancia antes de marcar regresión")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    workloads = []
+    grid = itertools.product(
+        _csv(args.scenarios, str),
+        _csv(args.records, int),
+        _csv(args.devices, int),
+        _csv(args.dup_ratio, float),
+        _csv(args.latency_ms, float),
+        _csv(args.db_rtt_ms, float),
+    )
+    for scenario, records, devices, dup_ratio, latency_ms, db_rtt_ms in grid:
+        if scenario not in SCENARIOS:
+            parser.error(f"escenario desconocido: {scenario}")
+        if scenario == "user_sync":
+            # un solo reloj y sin duplicados: el trabajo es la cola
+            devices, dup_ratio = 1, 0.0
+        workload = Workload(scenario, records, devices, dup_ratio, latency_ms, db_rtt_ms, args.users, args.batch_size)
+        if workload not in workloads:
+            workloads.append(workload)
+
+    results_path = Path(args.results) if args.results else None
+    history = _load_history(results_path) if results_path else {}
+    commit = _git_commit()
+    regressions = 0
+
+    for workload in workloads:
+        runs = [run_workload(workload) for _ in range(max(1, args.repeat))]
+        metrics = max(runs, key=lambda m: m["records_per_second"] or 0)
+        entry = {
+            "key": workload.key(),
+            "commit": commit,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "workload": asdict(workload),
+            "metrics": metrics,
+        }
+        print(
+            f"{workload.key()}\n"
+            f"    {metrics['records_per_second'] or 0:>10,.0f} rec/s | {metrics['elapsed_seconds']:.2f}s | "
+            f"inserted={metrics['inserted']} dup={metrics['dup_skipped']} | "
+            f"db_rt={metrics['db_round_trips']} dev_rt={metrics['device_round_trips']} | "
+            f"lock avg={_fmt(metrics['lock_avg_ms'], 'ms')} max={_fmt(metrics['lock_max_ms'], 'ms')} | "
+            f"rss={_fmt(metrics['peak_rss_mb'], 'MB')}"
+        )
+        previous = history.get(workload.key())
+        if previous:
+            issues = _compare(entry, previous, args.threshold)
+            label = f"vs {previous['commit']}"
+            if issues:
+                regressions += 1
+                print(f"    REGRESION {label}: " + "; ".join(issues))
+            else:
+                print(f"    sin regresión {label}")
+        if results_path:
+            results_path.parent.mkdir(parents=True, exist_ok=True)
+            with results_path.open("a", encoding="utf-8") as fh:
+                fh.write(json.dumps(entry, sort_keys=True) + "\n")
+
+    if regressions and args.fail_on_regression:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
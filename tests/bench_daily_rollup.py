@@ -0,0 +1,133 @@
+import argparse
+import sys
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+from sqlalchemy import text
+
+bootstrap.add_src_to_path()
+
+from mb160_service.api.daily import DailyFilters, fetch_daily_page
+from mb160_service.api.marks import MarkFilters, fetch_marks_page
+from mb160_service.collector import poller
+from mb160_service.utils.simulator import (
+    DOUBLE_TAP_SECONDS,
+    ENTRY_END,
+    EXIT_START,
+    LUNCH_START,
+    attendance_rows,
+    load_attendance,
+    shift_punches,
+    simulated_employees,
+)
+from mb160_service.utils.standin_db import build_standin_engine
+
+_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def _summarize(punches):
+    """Lo que hace hoy cada consumidor de /marks: recorrer todos los marcajes del mes."""
+    days = {}
+    for user_id, ts in punches:
+        days.setdefault((user_id, ts.date()), []).append(ts)
+    out = {}
+    for key, stamps in days.items():
+        stamps.sort()
+        valid = [t for i, t in enumerate(stamps) if i == 0 or (t - stamps[i - 1]).total_seconds() > DOUBLE_TAP_SECONDS]
+        lunch = [t for t in valid if LUNCH_START <= t.time() < EXIT_START]
+        out[key] = (
+            min((t for t in valid if t.time() < ENTRY_END), default=None),
+            lunch[0] if lunch else None,
+            lunch[1] if len(lunch) > 1 else None,
+            max((t for t in valid if t.time() >= EXIT_START), default=None),
+            len(stamps),
+        )
+    return out
+
+
+def _as_dt(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.strptime(str(value)[:19], _FMT)
+
+
+def _report_from_marks(engine, start: date, end: date, limit: int):
+    filters = MarkFilters(dt_from=datetime.combine(start, dtime()), dt_to=datetime.combine(end, dtime(23, 59, 59)))
+    punches = []
+    cursor = None
+    with engine.connect() as conn:
+        while True:
+            rows, cursor = fetch_marks_page(conn, filters, limit=limit, cursor=cursor)
+            punches += [(r["UsuarioDispositivo"], _as_dt(r["EventoFechaHora"])) for r in rows]
+            if not cursor:
+                break
+    return _summarize(punches), len(punches)
+
+
+def _report_from_rollup(engine, start: date, end: date, limit: int):
+    filters = DailyFilters(date_from=start, date_to=end)
+    out = {}
+    cursor = None
+    with engine.connect() as conn:
+        while True:
+            rows, cursor = fetch_daily_page(conn, filters, limit=limit, cursor=cursor)
+            for r in rows:
+                key = (r["UsuarioDispositivo"], date.fromisoformat(str(r["Fecha"])[:10]))
+                out[key] = (
+                    _as_dt(r["PrimeraEntrada"]), _as_dt(r["SalidaComida"]), _as_dt(r["EntradaComida"]),
+                    _as_dt(r["UltimaSalida"]), int(r["Marcajes"]),
+                )
+            if not cursor:
+                break
+    return out
+
+
+def _load(engine, employees, start: date, days: int, *, rollup: bool, chunk_rows: int) -> float:
+    poller.DAILY_ROLLUP = rollup
+    started = time.perf_counter()
+    load_attendance(engine, attendance_rows(shift_punches(employees, start, days)), chunk_rows=chunk_rows)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /attendance/daily (rollup) vs recorrer /marks (SQLite local).")
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--chunk-rows", type=int, default=500, help="filas por insert (≈ un poll del collector)")
+    parser.add_argument("--limit", type=int, default=2000)
+    args = parser.parse_args()
+
+    start = date(2026, 3, 1)
+    end = start + timedelta(days=args.days - 1)
+    employees = simulated_employees(args.employees, devices=("SIM00001", "SIM00002", "SIM00003"))
+
+    # costo del mantenimiento incremental: mismo historial con y sin rollup
+    plain = build_standin_engine()
+    t_plain = _load(plain, employees, start, args.days, rollup=False, chunk_rows=args.chunk_rows)
+    engine = build_standin_engine()
+    t_rollup = _load(engine, employees, start, args.days, rollup=True, chunk_rows=args.chunk_rows)
+    with engine.connect() as conn:
+        marks = conn.execute(text("SELECT COUNT(*) FROM dbo.AsistenciaMarcaje")).scalar()
+        daily = conn.execute(text("SELECT COUNT(*) FROM dbo.AsistenciaDiaria")).scalar()
+    print(f"marcajes={marks} | empleado-días={daily} | insert sin rollup={t_plain:.2f}s | con rollup={t_rollup:.2f}s")
+
+    started = time.perf_counter()
+    from_marks, scanned = _report_from_marks(engine, start, end, args.limit)
+    t_marks = time.perf_counter() - started
+    started = time.perf_counter()
+    from_rollup = _report_from_rollup(engine, start, end, args.limit)
+    t_daily = time.perf_counter() - started
+
+    print(f"reporte del mes desde /marks          filas leídas={scanned:>8} | {t_marks * 1000:8.1f} ms")
+    print(f"reporte del mes desde /attendance/daily filas leídas={len(from_rollup):>6} | {t_daily * 1000:8.1f} ms")
+    print(f"mismo resultado: {from_marks == from_rollup}")
+
+
+if __name__ == "__main__":
+    main()
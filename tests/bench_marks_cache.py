@@ -0,0 +1,112 @@
+import argparse
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+
+bootstrap.add_src_to_path()
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from mb160_service.api.cache import CachedResponse, ResponseCache, etag_matches, make_etag
+from mb160_service.api.marks import MarkFilters, fetch_marks_page
+from mb160_service.collector.poller import insert_rows
+from mb160_service.collector.watermark import IngestWatermarks, ingest_transaction
+from mb160_service.utils.simulator import attendance_rows, load_attendance, shift_punches, simulated_employees
+from mb160_service.utils.standin_db import build_standin_engine
+
+DEVICES = ("SIM00001", "SIM00002", "SIM00003", "SIM00004")
+
+
+def _serve(engine, cache, watermarks, filters: MarkFilters, limit: int, if_none_match=None):
+    """Mismo camino que GET /marks en api/main.py (sin HTTP). Regresa (status, etag, body)."""
+    snapshot = watermarks.snapshot()
+    key = ("marks", filters, limit, None, 0)
+    token = cache.token(snapshot, filters.device_serial)
+    etag = make_etag(key, token)
+    if etag_matches(if_none_match, etag):
+        return 304, etag, b""
+    entry = cache.get(key, snapshot)
+    if entry is None:
+        with engine.connect() as conn:
+            rows, _ = fetch_marks_page(conn, filters, limit=limit)
+        body = JSONResponse(jsonable_encoder(rows)).body
+        entry = CachedResponse(body=body, etag=etag, scope=filters.device_serial, token=token, headers={})
+        cache.put(key, entry)
+    return 200, entry.etag, entry.body
+
+
+def _run(label, engine, cache, watermarks, dashboards, *, polls: int, limit: int, conditional: bool, cycle=None):
+    """Cada dashboard pide su consulta `polls` veces; cycle(i) simula un ciclo del collector."""
+    etags = {}
+    statuses = {200: 0, 304: 0}
+    started = time.perf_counter()
+    for i in range(polls):
+        if cycle is not None:
+            cycle(i)
+        for filters in dashboards:
+            status, etag, _body = _serve(
+                engine, cache, watermarks, filters, limit, etags.get(filters) if conditional else None,
+            )
+            etags[filters] = etag
+            statuses[status] += 1
+    elapsed = time.perf_counter() - started
+    requests = polls * len(dashboards)
+    print(
+        f"{label:34s} {elapsed / requests * 1000:7.3f} ms/req | 200={statuses[200]:>5} 304={statuses[304]:>5} "
+        f"| cache hits={cache.hits:>5} misses={cache.misses:>5}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cache de /marks (watermark de ingesta + ETag) sobre SQLite local.")
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=19, help="el último día es \"hoy\" (default: viernes)")
+    parser.add_argument("--polls", type=int, default=200, help="peticiones por dashboard")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--cycle-every", type=int, default=20, help="polls entre ciclos del collector (un dispositivo)")
+    args = parser.parse_args()
+
+    engine = build_standin_engine()
+    start = date(2026, 3, 2)
+    today = start + timedelta(days=args.days - 1)
+    employees = simulated_employees(args.employees, devices=DEVICES)
+    rows = list(attendance_rows(shift_punches(employees, start, args.days)))
+    # la tarde de hoy del primer checador llega en ciclos del collector durante el benchmark
+    cutoff = datetime.combine(today, dtime(16))
+    late = [r for r in rows if r["DispositivoSerial"] == DEVICES[0] and r["EventoFechaHora"] >= cutoff]
+    load_attendance(engine, (r for r in rows if not (r["DispositivoSerial"] == DEVICES[0] and r["EventoFechaHora"] >= cutoff)))
+    # "hoy, dispositivo X" por checador + uno sin filtro de dispositivo
+    day = MarkFilters(dt_from=datetime.combine(today, dtime()), dt_to=datetime.combine(today, dtime(23, 59, 59)))
+    dashboards = [MarkFilters(device_serial=serial, dt_from=day.dt_from, dt_to=day.dt_to) for serial in DEVICES] + [day]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        watermarks = IngestWatermarks(str(Path(tmp) / "ingest_watermarks.json"))
+
+        def cycle(i):
+            # cada N polls el collector confirma marcajes nuevos de un solo dispositivo
+            if i and i % args.cycle_every == 0 and late:
+                chunk = [late.pop(0) for _ in range(min(20, len(late)))]
+                with ingest_transaction(engine, watermarks) as dbconn:
+                    insert_rows(dbconn, chunk)
+
+        _run("sin cache", engine, ResponseCache(0, 0), watermarks, dashboards,
+             polls=args.polls, limit=args.limit, conditional=False)
+        _run("cache (sin If-None-Match)", engine, ResponseCache(), watermarks, dashboards,
+             polls=args.polls, limit=args.limit, conditional=False)
+        _run("cache + If-None-Match (304)", engine, ResponseCache(), watermarks, dashboards,
+             polls=args.polls, limit=args.limit, conditional=True)
+        _run(f"cache + 304, collector c/{args.cycle_every} polls", engine, ResponseCache(), watermarks, dashboards,
+             polls=args.polls, limit=args.limit, conditional=True, cycle=cycle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import gc
+import importlib.util
+import json
+import sys
+import time
+import tracemalloc
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+from sqlalchemy import text
+
+bootstrap.add_src_to_path()
+
+from mb160_service.api.columnar import arrow_stream
+from mb160_service.api.marks import MarkFilters, _json_default, export_marks, fetch_marks_page
+from mb160_service.utils.simulator import attendance_rows, load_attendance, shift_punches, simulated_employees
+from mb160_service.utils.standin_db import build_standin_engine
+
+
+def _paged(engine, filters: MarkFilters, *, limit: int):
+    """Lo que hacía nómina: /marks con limit=2000 y offset creciente, cada página como list[dict] + JSON."""
+    offset = 0
+    with engine.connect() as conn:
+        while True:
+            rows, _ = fetch_marks_page(conn, filters, limit=limit, offset=offset)
+            if not rows:
+                break
+            yield json.dumps(rows, default=_json_default).encode("utf-8")
+            offset += limit
+
+
+def _measure(label: str, make_body) -> None:
+    # tiempo sin tracemalloc (lo distorsiona) y memoria en una segunda pasada
+    started = time.perf_counter()
+    ttfb = None
+    total = 0
+    for chunk in make_body():
+        if ttfb is None:
+            ttfb = time.perf_counter() - started
+        total += len(chunk)
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    for _chunk in make_body():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:16s} ttfb={ttfb * 1000:8.1f}ms total={elapsed:6.2f}s bytes={total / 2**20:7.1f}MB "
+        f"peak_mem={peak / 2**20:6.1f}MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /marks/export (NDJSON/CSV/Arrow) vs paginar /marks (SQLite local).")
+    parser.add_argument("--employees", type=int, default=600)
+    parser.add_argument("--days", type=int, default=300)
+    parser.add_argument("--chunk-rows", type=int, default=5000)
+    parser.add_argument("--db", help="archivo SQLite (se reutiliza si ya tiene datos)")
+    parser.add_argument("--skip-paged", action="store_true", help="no medir el loop de /marks con offset (lento)")
+    args = parser.parse_args()
+
+    engine = build_standin_engine(args.db)
+    with engine.connect() as conn:
+        existing = conn.execute(text("SELECT COUNT(*) FROM dbo.AsistenciaMarcaje")).scalar()
+    if not existing:
+        employees = simulated_employees(args.employees, devices=("SIM00001", "SIM00002"))
+        existing, _ = load_attendance(engine, attendance_rows(shift_punches(employees, date(2025, 1, 1), args.days)))
+    print(f"filas={existing} | chunk_rows={args.chunk_rows}")
+
+    filters = MarkFilters()
+    for fmt in ("ndjson", "csv"):
+        for gzip in (False, True):
+            _measure(
+                fmt + ("+gzip" if gzip else ""),
+                lambda: export_marks(engine, filters, fmt=fmt, chunk_rows=args.chunk_rows, gzip=gzip),
+            )
+    if importlib.util.find_spec("pyarrow") is None:
+        print("arrow            (pyarrow no instalado)")
+    else:
+        _measure("arrow", lambda: arrow_stream(engine, filters, chunk_rows=args.chunk_rows))
+    if not args.skip_paged:
+        _measure("/marks x2000", lambda: _paged(engine, filters, limit=2000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import statistics
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+from sqlalchemy import text
+
+bootstrap.add_src_to_path()
+
+from mb160_service.api.marks import MarkFilters, _as_datetime, encode_cursor, fetch_marks_page
+from mb160_service.utils.simulator import attendance_rows, load_attendance, shift_punches, simulated_employees
+from mb160_service.utils.standin_db import build_standin_engine
+
+DEVICE = "SIM00001"  # la mayoría del historial, para llegar a la página 10,000 con filtro
+
+
+def _cursor_for_page(conn, filters: MarkFilters, *, page: int, limit: int):
+    """Cursor que regresaría la página anterior (se calcula fuera de la medición)."""
+    if page <= 1:
+        return None
+    rows, _ = fetch_marks_page(conn, filters, limit=1, offset=(page - 1) * limit - 1)
+    if not rows:
+        return None
+    return encode_cursor(_as_datetime(rows[0]["EventoFechaHora"]), rows[0]["AsistenciaMarcajeID"])
+
+
+def _timed(conn, filters: MarkFilters, *, limit: int, repeat: int, **kwargs):
+    times = []
+    rows = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows, _ = fetch_marks_page(conn, filters, limit=limit, **kwargs)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GET /marks: OFFSET vs cursor (keyset) por número de página.")
+    parser.add_argument("--employees", type=int, default=600)
+    parser.add_argument("--days", type=int, default=300, help="días de turnos simulados (~575k marcajes con el default)")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--pages", default="1,10,100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", help="archivo SQLite (se reutiliza si ya tiene datos)")
+    args = parser.parse_args()
+
+    engine = build_standin_engine(args.db)
+    with engine.connect() as conn:
+        existing = conn.execute(text("SELECT COUNT(*) FROM dbo.AsistenciaMarcaje")).scalar()
+    if not existing:
+        started = time.perf_counter()
+        employees = simulated_employees(args.employees, devices=(DEVICE,))
+        employees += simulated_employees(max(1, args.employees // 20), devices=("SIM00002",), seed=1)
+        inserted, _ = load_attendance(engine, attendance_rows(shift_punches(employees, date(2025, 1, 1), args.days)))
+        print(f"cargados={inserted} en {time.perf_counter() - started:.1f}s")
+    else:
+        print(f"reutilizando {args.db} | filas={existing}")
+
+    pages = [int(p) for p in args.pages.split(",") if p.strip()]
+    cases = (("sin filtro", MarkFilters()), ("device_serial", MarkFilters(device_serial=DEVICE)))
+    with engine.connect() as conn:
+        for label, filters in cases:
+            print(f"\n{label} | limit={args.limit}")
+            print(f"{'página':>8} {'offset ms':>10} {'cursor ms':>10}  iguales")
+            for page in pages:
+                cursor = _cursor_for_page(conn, filters, page=page, limit=args.limit)
+                if page > 1 and cursor is None:
+                    print(f"{page:>8}  (no hay tantas filas)")
+                    continue
+                t_offset, by_offset = _timed(
+                    conn, filters, limit=args.limit, repeat=args.repeat, offset=(page - 1) * args.limit,
+                )
+                t_cursor, by_cursor = _timed(conn, filters, limit=args.limit, repeat=args.repeat, cursor=cursor)
+                print(f"{page:>8} {t_offset * 1000:>10.2f} {t_cursor * 1000:>10.2f}  {by_offset == by_cursor}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+from sqlalchemy import event
+
+bootstrap.add_src_to_path()
+
+from mb160_service.collector.poller import _filter_logs, insert_rows
+from mb160_service.utils.standin_db import build_standin_engine
+
+
+class _FakeAttendance:
+    def __init__(self, user_id: str, timestamp: datetime, status: int, punch: int):
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.status = status
+        self.punch = punch
+        self.workcode = None
+
+
+def _fake_logs(n: int, *, seed: int = 160) -> list:
+    rnd = random.Random(seed)
+    start = datetime(2026, 1, 1, 7, 0, 0)
+    users = [f"5{i:04d}" for i in range(300)]
+    return [
+        _FakeAttendance(rnd.choice(users), start + timedelta(seconds=i * 37), 1, rnd.choice([0, 1, 4]))
+        for i in range(n)
+    ]
+
+
+def _run(engine, logs, *, serial: str, batch_size: int, staging: bool = False) -> tuple:
+    started = time.perf_counter()
+    with engine.begin() as dbconn:
+        rows = _filter_logs(
+            logs,
+            device_serial=serial,
+            device_ip="127.0.0.1",
+            user_map={},
+            min_ts=None,
+            max_ts=None,
+            last_ts=None,
+        )
+        inserted, dup_skipped = insert_rows(dbconn, rows, batch_size=batch_size, staging=staging)
+    return time.perf_counter() - started, inserted, dup_skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark insert fila por fila vs batched vs staging (SQLite local).")
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="latencia simulada por round-trip (VPN)")
+    args = parser.parse_args()
+
+    engine = build_standin_engine()
+    round_trips = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _latency(*_a):
+        round_trips["n"] += 1
+        if args.rtt_ms:
+            time.sleep(args.rtt_ms / 1000.0)
+
+    logs = _fake_logs(args.records)
+
+    modes = (
+        ("per-row", "BENCH-ROW", 1, False),
+        ("batched", "BENCH-BATCH", args.batch_size, False),
+        ("staging", "BENCH-STG", args.batch_size, True),
+    )
+    for label, serial, size, staging in modes:
+        for phase in ("nuevos", "duplicados"):
+            round_trips["n"] = 0
+            elapsed, inserted, dup_skipped = _run(engine, logs, serial=serial, batch_size=size, staging=staging)
+            print(
+                f"{label:8s} {phase:10s} records={len(logs)} inserted={inserted} dup_skipped={dup_skipped} "
+                f"round_trips={round_trips['n']} elapsed={elapsed:.2f}s rate={len(logs) / elapsed:,.0f}/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# sin spool, cache de dumps ni watermark en state/: todo vive en memoria
+os.environ.setdefault("SPOOL_FILE", "")
+os.environ.setdefault("DUMP_CACHE_DIR", "")
+os.environ.setdefault("INGEST_WATERMARK_FILE", "")
+
+import bootstrap
+from sqlalchemy import text
+
+bootstrap.add_src_to_path()
+
+from mb160_service.collector.checkpoint import CheckpointStore
+from mb160_service.collector.poller import poll_once
+from mb160_service.collector.sessions import DeviceSessionPool
+from mb160_service.collector.user_cache import UserMapCache
+from mb160_service.utils.fake_mb160 import FakeDeviceFarm
+from mb160_service.utils.standin_db import build_standin_engine
+
+
+def _count(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM dbo.AsistenciaMarcaje")).scalar()
+
+
+def test_range_pull_keeps_incremental_checkpoint():
+    """
+    Poll incremental, llegan checadas nuevas, backfill de una ventana vieja:
+    el siguiente poll incremental tiene que bajar las checadas nuevas (el
+    backfill no debe dejar el record_count actual del reloj en el checkpoint).
+    """
+    engine = build_standin_engine()
+    end = datetime(2026, 3, 20, 18)
+    with FakeDeviceFarm(1, users=20, records=200, end=end) as farm:
+        ip, port = farm.targets[0]
+        device = farm.devices[0]
+        kwargs = dict(
+            device_ip=ip, device_port=port, checkpoints=CheckpointStore(None),
+            user_maps=UserMapCache(), sessions=DeviceSessionPool(omit_ping=True),
+        )
+
+        first = poll_once(engine, **kwargs)
+        print("incremental:", first.inserted, "| db:", _count(engine))
+        assert first.inserted == 200 and _count(engine) == 200
+
+        device.add_punch(device.users[0].user_id, end + timedelta(hours=1))
+        device.add_punch(device.users[1].user_id, end + timedelta(hours=1, minutes=5))
+
+        oldest = min(p.timestamp for p in device.punches)
+        backfill = poll_once(engine, min_ts=oldest, max_ts=oldest + timedelta(hours=1), use_last_ts=False, **kwargs)
+        print("backfill:", backfill.inserted, "| dup_skipped:", backfill.dup_skipped)
+        assert backfill.inserted == 0
+
+        second = poll_once(engine, **kwargs)
+        print("incremental:", second.inserted, "| skipped:", second.skipped, "| db:", _count(engine))
+        assert not second.skipped
+        assert second.inserted == 2 and _count(engine) == 202
+
+
+def main():
+    test_range_pull_keeps_incremental_checkpoint()
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
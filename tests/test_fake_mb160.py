@@ -0,0 +1,72 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import bootstrap
+from zk import ZK
+
+bootstrap.add_src_to_path()
+
+from mb160_service.utils.fake_mb160 import FakeDeviceFarm
+
+
+def check_device(ip: str, port: int, *, force_udp: bool) -> None:
+    conn = ZK(ip, port=port, timeout=5, password=0, force_udp=force_udp, ommit_ping=True).connect()
+    try:
+        print("serial:", conn.get_serialnumber(), "| udp" if force_udp else "| tcp")
+        conn.read_sizes()
+        print("users:", conn.users, "records:", conn.records)
+
+        conn.disable_device()
+        users = conn.get_users() or []
+        logs = conn.get_attendance() or []
+        conn.enable_device()
+        print("get_users:", len(users), "get_attendance:", len(logs))
+        assert len(users) == conn.users
+        assert len(logs) == conn.records
+
+        conn.set_user(uid=0, name="Prueba Sim", user_id="29999")
+        names = {u.user_id: u.name for u in conn.get_users()}
+        print("set_user:", names.get("29999"))
+        assert names.get("29999") == "Prueba Sim"
+    finally:
+        conn.disconnect()
+
+
+def check_live_capture(farm: FakeDeviceFarm) -> None:
+    ip, port = farm.targets[0]
+    device = farm.devices[0]
+    conn = ZK(ip, port=port, timeout=5, password=0, ommit_ping=True).connect()
+
+    def punch_later():
+        time.sleep(0.5)
+        device.add_punch("20001")
+
+    threading.Thread(target=punch_later, daemon=True).start()
+    try:
+        for evt in conn.live_capture(new_timeout=2):
+            if evt is None:
+                continue
+            print("live_capture:", evt)
+            assert evt.user_id == "20001"
+            conn.end_live_capture = True
+    finally:
+        conn.disconnect()
+
+
+def main():
+    with FakeDeviceFarm(3, users=40, records=5000) as farm:
+        for ip, port in farm.targets:
+            check_device(ip, port, force_udp=False)
+        check_device(*farm.targets[0], force_udp=True)
+        check_live_capture(farm)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()